@@ -13,14 +13,21 @@ import os
 from time import sleep
 import pandas as pd
 import paramiko
-import configparser
-import warnings
 import json
 import numpy as np
 import logging
-import psutil
 from datetime import datetime
 from abc import ABC, abstractmethod
+from ssh_pool import ssh_pool
+from batch_monitor import get_monitor
+from poll_policy import get_poll_policy
+from agent_client import AgentClient, get_agent
+from run_state import get_store
+from pp_queue import get_pp_queue
+from sftp_download import BulkDownloader
+from result_pack import local_codecs
+from reduce_metrics import metrics_name, read_metrics
+from hpc_protocol import RESULT_PREFIX, parse_result
 
 
 ################################################################################### PARAMETRIC STUDY ################################################################################
@@ -54,6 +61,17 @@ class SimScheduling(ABC):
             self.message = message
             super().__init__(self.message)
 
+    ### Error codes of the HPC result record mapped to the local exception raised for each
+    remote_errors = {
+        'JobStatError': (JobStatError, 'qstat output empty, job finished or deleted from HPC run queue'),
+        'ValueError': (ValueError, 'Exception raised from job sh creation, qstat in job_wait or attempting to search restart in job_restart'),
+        'FileNotFoundError': (FileNotFoundError, 'File not found: either .out or .csv files not found when attempting restart or vtk/pvd/convert files not found when attempting to convert'),
+        'ConvergenceError': (ConvergenceError, 'Convergence checks on HPC failed, job killed as a result'),
+        'BadTerminationError': (BadTerminationError, 'Job run ended with a bad termination error message in the output file. Check convergence or setup issues'),
+        'KeyError': (KeyError, 'Error while attempting to restart: Stop condition key name does not exist in the CSV file checked'),
+        'UnhandledError': (NameError, 'Remote function exited with an unhandled exception')
+    }
+
     ### Constructor function to be initialized in each child class instance through psweep local run
     def __init__(self,pset_dict, **kwargs):
 
@@ -71,14 +89,30 @@ class SimScheduling(ABC):
         self.save_path_runID = os.path.join(self.save_path,self.run_name)
         self.main_path = os.path.join(self.run_path,'..')
 
+        ### Durable stage record for crash-resume, disabled by setting state_db to None
+        state_db = pset_dict.get('state_db', os.path.join(self.local_path, f'run_state_{self.case_type}.db'))
+        self.state_store = get_store(state_db) if state_db else None
+
+        ### Post-processing backend: 'pvpython' subprocess scripts or 'numpy' in-process VTR metrics (vtr_metrics.py)
+        self.pv_backend = pset_dict.get('pv_backend', 'pvpython')
+
+        ### Shared local post-processing queue: pp_workers concurrent jobs, each admitted with pp_memory GB free
+        self.pp_queue = get_pp_queue(pset_dict.get('pp_workers'), pset_dict.get('pp_memory'))
+
+        ### Payload of the last remote result record, see read_record
+        self.remote_data = None
+
+        ### Entry of this run in a batched run_batch response, set by RunOrchestrator when the grid is submitted at once
+        self.submission = None
+
         for key, value in kwargs.items():
             setattr(self, key, value)
 
     ### Defining individual logging files for each run.
     @staticmethod
     def set_log(log_filename):
-        # Create a new logger instance for each process
-        logger = logging.getLogger(__name__)
+        # Create a new logger instance for each run, several runs can share one process under the orchestrator
+        logger = logging.getLogger(f"{__name__}.{os.path.abspath(log_filename).replace('.', '_')}")
 
         # Clear existing handlers to avoid duplication
         logger.handlers = []
@@ -93,14 +127,6 @@ class SimScheduling(ABC):
 
         return logger  # Return the logger instance
 
-    ### Checking if a pvpython process is active
-    @staticmethod
-    def is_pvpython_running():
-        for process in psutil.process_iter(['pid', 'name']):
-            if process.info['name'] == 'pvpython':
-                return True, process.info['pid']
-        return False, None
-
     ### converting dictionary input from psweep run_local into readable JSON format
     @staticmethod
     def convert_to_json(obj):
@@ -114,14 +140,399 @@ class SimScheduling(ABC):
     @abstractmethod
     def localrun(self,pset_dict):
         pass
-    
+
+    ### Return value handed back to psweep when a stage fails, overridden per study
+    def failed_return(self):
+        return {}
+
+    ### Local post-processing executed once converted files are downloaded, overridden per study
+    def postprocess(self,log):
+        return {}
+
+    ### Running a vtr_metrics function in-process instead of its pvpython script, returning None on failure as the scripts do
+    def run_inprocess(self, func, args, log):
+
+        log.info(f'Executing in-process post-processing: {func.__name__}')
+        log.info('-'*100)
+
+        try:
+            return func(*args)
+        except FileNotFoundError as e:
+            log.info(f'FileNotFoundError, VTR/PVD files missing: {e}')
+        except (ValueError, KeyError) as e:
+            log.info(f'{type(e).__name__}, Exited with message: {e}')
+
+        return None
+
+    ### Persisting a workflow stage transition when a state store is configured
+
+    def checkpoint(self, stage, jobid=None, t_wait=0, status=None, result=None):
+        if self.state_store is not None:
+            self.state_store.record(self.run_name, stage, jobid=jobid, t_wait=t_wait, status=status, result=result)
+
+    ### Recording the failed stage and returning the study specific failure values
+
+    def abort(self):
+        self.checkpoint('failed')
+        return self.failed_return()
+
+    ### Full BLUE workflow as a generator of effects: submit -> monitor -> restart -> convert -> download -> post-process
+    ### Driven by drive() inside localrun, or concurrently with other runs by the asyncio orchestrator
+    ### resume: state record from the RunStateStore, restarting right after the last completed stage
+
+    def workflow(self,log,resume=None):
+
+        dict_str = json.dumps(self.pset_dict, default=self.convert_to_json, ensure_ascii=False)
+        stage = resume['stage'] if resume is not None else 'new'
+
+        HPC_script = 'HPC_run_scheduling.py'
+
+        if resume is None:
+            if self.state_store is not None:
+                self.state_store.register(self.pset_dict, type(self).__module__, type(self).__name__, dict_str)
+        else:
+            log.info('-' * 100)
+            log.info(f'RESUMING RUN FROM STAGE {stage}')
+            log.info('-' * 100)
+
+        if stage == 'done':
+            return json.loads(resume['result']) if resume['result'] else {}
+
+        ### First job creation and submission
+
+        if stage == 'new':
+            log.info('-' * 100)
+            log.info('-' * 100)
+            log.info('NEW RUN')
+            log.info('-' * 100)
+            log.info('-' * 100)
+
+            if self.submission is not None:
+                ### Already provisioned and submitted with the rest of the grid by run_batch
+                error = self.submission['error']
+                if error is not None:
+                    log.info(f"Exited with message: batched submission failed with {error['code']}: {error['message']}")
+                    return self.abort()
+
+                jobid, t_wait, status = self.submission['jobid'], self.submission['t_wait'], self.submission['status']
+                log.info(f'Job {self.run_ID} submitted by run_batch with ID {jobid}, status {status}')
+
+            else:
+                ### wait time to connect at first, avoiding multiple simultaneuous connections
+                init_wait_time = np.random.RandomState().randint(0,180)
+                yield ('sleep', init_wait_time)
+
+                try:
+                    jobid, t_wait, status, _ = yield ('call', self.remote_function, (HPC_script, 'run', dict_str, log))
+                except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                    log.info(f"SSH ERROR: Authentication failed: {e}")
+                    return self.abort()
+                except (ValueError, SimScheduling.JobStatError, NameError) as e:
+                    log.info(f'Exited with message: {e}')
+                    return self.abort()
+
+            self.checkpoint('running', jobid, t_wait, status)
+            stage = 'running'
+
+        elif stage == 'running':
+            ### Re-querying the recorded job straight away instead of trusting a stale wait time
+            jobid, t_wait, status = resume['jobid'], 1, 'Q'
+
+        elif stage == 'sim_finished':
+            ### Finished simulation job, needed by the PBS chain decision. None for records written without it
+            jobid, t_wait, status = resume['jobid'], 0, 'F'
+            
+        ### Job monitor and restarting nested loop. Checks job status and restarts if needed.
+
+        if stage in ('running', 'sim_finished'):
+
+            restart = True
+            while restart:
+
+                ### job monitoring loop, skipped if the crash happened after the job had already finished
+
+                if stage == 'running':
+                    log.info('-' * 100)
+                    log.info('JOB MONITORING')
+                    log.info('-' * 100)
+
+                    try:
+                        yield from self.jobmonitor_steps(t_wait, status, jobid, self.run_ID, HPC_script,log,stage='running')
+                    except (ValueError, NameError, SimScheduling.ConvergenceError) as e:
+                        log.info(f'Exited with message: {e}')
+                        return self.abort()
+                    except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                        log.info(f"SSH ERROR: Authentication failed: {e}")
+                        return self.abort()
+
+                    self.checkpoint('sim_finished', jobid)
+
+                ### Job restart execution
+
+                log.info('-' * 100)
+                log.info('JOB RESTARTING')
+                log.info('-' * 100)
+
+                try:
+                    log.info('-' * 100)
+                    if self.pset_dict.get('pbs_chain'):
+                        ### Decision already taken on the HPC by the restart check chained after the job
+                        new_jobID, new_t_wait, new_status, ret_bool = yield from self.chain_decision(jobid, HPC_script, dict_str, log)
+                    else:
+                        new_jobID, new_t_wait, new_status, ret_bool = yield ('call', self.remote_function, (HPC_script, 'job_restart', dict_str, log))
+
+                    log.info('-' * 100)
+
+                    ### updating
+                    jobid = new_jobID
+                    t_wait = new_t_wait
+                    status = new_status
+                    if ret_bool is None:
+                        raise TypeError('Restart decision missing from the HPC result record')
+                    restart = ret_bool
+
+                except (ValueError,FileNotFoundError,NameError,SimScheduling.BadTerminationError,SimScheduling.JobStatError,TypeError,KeyError) as e:
+                    log.info(f'Exited with message: {e}')
+                    return self.abort()
+                except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                    log.info(f"SSH ERROR: Authentication failed: {e}")
+                    return self.abort()
+
+                if restart:
+                    self.checkpoint('running', jobid, t_wait, status)
+                    stage = 'running'
+
+            ### vtk convert job creation and submission
+
+            log.info('-' * 100)
+            log.info('VTK CONVERTING')
+            log.info('-' * 100)
+
+            chain = self.remote_data if self.pset_dict.get('pbs_chain') else None
+
+            if chain is not None and chain.get('stage') == 'converting':
+                ### Convert (and reduce) jobs already submitted by the restart check on the HPC
+                conv_jobid, conv_t_wait, conv_status = chain['convert_jobid'], 1, 'Q'
+                reduce_jobid = chain.get('reduce_jobid')
+                log.info(f'Convert job {conv_jobid} submitted by the PBS chain')
+            else:
+                try:
+                    log.info('-' * 100)
+                    conv_jobid, conv_t_wait, conv_status, _ = yield ('call', self.remote_function, (HPC_script, 'vtk_convert', dict_str, log))
+                    log.info('-' * 100)
+                except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                    log.info(f"SSH ERROR: Authentication failed: {e}")
+                    return self.abort()
+                except (FileNotFoundError, SimScheduling.JobStatError, ValueError, NameError) as e:
+                    log.info(f'Exited with message: {e}')
+                    return self.abort()
+
+                ### Reduce job chained after the convert job by vtk_convert in remote_reduce mode
+                reduce_jobid = (self.remote_data or {}).get('reduce_jobid')
+
+            self.checkpoint('convert_submitted', conv_jobid, conv_t_wait, conv_status)
+            stage = 'convert_submitted'
+
+        elif stage == 'convert_submitted':
+            conv_jobid, conv_t_wait, conv_status = resume['jobid'], 1, 'Q'
+            ### Reduce job id not kept across a crash, its metrics file is still fetched if the job produced it
+            reduce_jobid = None
+        
+        conv_name = 'Convert' + str(self.run_ID)
+
+        ### job convert monitoring loop
+
+        if stage == 'convert_submitted':
+            log.info('-' * 100)
+            log.info('JOB MONITORING')
+            log.info('-' * 100)
+
+            try:
+                yield from self.jobmonitor_steps(conv_t_wait,conv_status,conv_jobid,conv_name,HPC_script,log,stage='convert_submitted')
+            except (ValueError, NameError) as e:
+                log.info(f'Exited with message: {e}')
+                return self.abort()
+            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                log.info(f"SSH ERROR: Authentication failed: {e}")
+                return self.abort()
+
+            self.checkpoint('convert_finished')
+            stage = 'convert_finished'
+
+            if reduce_jobid is not None:
+                self.checkpoint('reduce_submitted', reduce_jobid, 1, 'Q')
+                stage = 'reduce_submitted'
+
+        elif stage == 'reduce_submitted':
+            reduce_jobid = resume['jobid']
+
+        ### Reduce job monitoring, the metrics it writes replace the local post-processing of the downloaded fields
+
+        if stage == 'reduce_submitted':
+            log.info('-' * 100)
+            log.info('REDUCE JOB MONITORING')
+            log.info('-' * 100)
+
+            reduce_name = 'Reduce' + str(self.run_ID)
+
+            try:
+                yield from self.jobmonitor_steps(1,'Q',reduce_jobid,reduce_name,HPC_script,log,stage='reduce_submitted')
+            except (ValueError, NameError) as e:
+                log.info(f'Reduce job monitoring failed, falling back to the full download. Exited with message: {e}')
+            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                log.info(f"SSH ERROR: Authentication failed: {e}")
+                return self.abort()
+
+            stage = 'convert_finished'
+
+        ### Downloading files and local Post-processing
+
+        if stage == 'convert_finished':
+
+            ### Metrics reduced on the HPC fetched first, the converted fields are only downloaded if still needed
+            bulk = True
+            if self.pset_dict.get('remote_reduce'):
+                try:
+                    fetched = yield ('call', self.fetch_metrics, (log,))
+                except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                    log.info(f"SSH ERROR: Authentication failed: {e}")
+                    return self.abort()
+                except (BulkDownloader.IntegrityError, OSError) as e:
+                    log.info(f"DOWNLOAD ERROR: {e}")
+                    fetched = False
+
+                bulk = not fetched or self.pset_dict.get('reduce_download', False)
+
+            if bulk:
+                ### Optional packing of RESULTS on the HPC, the download falls back to individual files if it fails
+                if self.pset_dict.get('pack_results'):
+                    log.info('-' * 100)
+                    log.info('PACKING RESULTS')
+                    log.info('-' * 100)
+
+                    pack_str = json.dumps({**self.pset_dict, 'pack_codecs': local_codecs()}, default=self.convert_to_json, ensure_ascii=False)
+
+                    try:
+                        yield ('call', self.remote_function, (HPC_script, 'pack_results', pack_str, log))
+                    except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                        log.info(f"SSH ERROR: Authentication failed: {e}")
+                        return self.abort()
+                    except (FileNotFoundError, ValueError, NameError) as e:
+                        log.info(f'Packing skipped, downloading individual files. Exited with message: {e}')
+
+                log.info('-' * 100)
+                log.info('DOWNLOADING FILES FROM EPHEMERAL')
+                log.info('-' * 100)
+
+                try:
+                    yield ('call', self.scp_download, (log,))
+                except (paramiko.AuthenticationException, paramiko.SSHException) as e:
+                    log.info(f"SSH ERROR: Authentication failed: {e}")
+                    return self.abort()
+                ### Partial files and the manifest are kept, a resumed run only fetches what is missing
+                except (BulkDownloader.IntegrityError, OSError) as e:
+                    log.info(f"DOWNLOAD ERROR: {e}")
+                    return self.abort()
+
+            self.checkpoint('downloaded')
+
+        log.info('-' * 100)
+        log.info('PVPYTHON POSTPROCESSING')
+        log.info('-' * 100)
+
+        ### Queuing the post-processing with every other finished run, resumed as soon as it completes
+        running, pending = self.pp_queue.load()
+        log.info(f'Queued for post-processing: {running} job(s) running, {pending} waiting, {self.pp_queue.max_workers} slot(s)')
+        log.info('-' * 100)
+
+        result = yield ('postprocess', self.pp_queue, self.postprocess, (log,))
+        self.checkpoint('done', result=result)
+
+        return result
+
+    ### Monitored jobs other than the simulation itself: no convergence checks, and held while their dependency runs
+    chained_jobs = ('Convert', 'Reduce', 'Chain')
+
+    def is_chained(self, run):
+        return any(name in str(run) for name in self.chained_jobs)
+
+    ### Restart decision of the PBS chain for the finished simulation job jobid, as (jobid, t_wait, status, ret_bool) of job_restart
+    ### Waits on the restart check job if it has not run yet, and falls back to job_restart if it ended without a decision
+
+    def chain_decision(self, jobid, HPC_script, dict_str, log):
+
+        while True:
+            _, t_wait, chain_status, _ = yield ('call', self.remote_function, (HPC_script, 'chain_status', dict_str, log))
+            chain = self.remote_data
+
+            if chain['stage'] == 'failed':
+                error = chain['error']
+                exc_class, description = self.remote_errors.get(error['code'], (NameError, f"Unknown remote error code {error['code']}"))
+                raise exc_class(f"{description}. PBS chain message: {error['message']}")
+
+            if chain['stage'] == 'converting':
+                log.info(f"PBS chain reached the finishing condition after {chain['restarts']} restart(s)")
+                return None, 0, None, False
+
+            ### Unknown jobid (resumed without one): the chain state alone tells which simulation job is current
+            if jobid is not None and int(chain['sim_jobid']) != int(jobid):
+                log.info(f"PBS chain resubmitted the simulation as job {chain['sim_jobid']} (restart {chain['restarts']})")
+                return int(chain['sim_jobid']), 1, 'Q', True
+
+            if chain_status == 'F':
+                log.info(f"Restart check job {chain['chain_jobid']} ended without a decision, restarting from here")
+                return (yield ('call', self.remote_function, (HPC_script, 'job_restart', dict_str, log)))
+
+            log.info(f"Waiting for restart check job {chain['chain_jobid']} (status {chain_status})")
+            yield from self.jobmonitor_steps(max(t_wait, 1), chain_status, chain['chain_jobid'], 'Chain' + str(self.run_ID), HPC_script, log)
+
+    ### Running a workflow generator to completion in this process, performing each yielded effect in place
+    ### Effects: ('sleep', seconds), ('call', func, args), ('wait_job', monitor, jobid, status, max_wait), ('postprocess', queue, func, args)
+
+    @staticmethod
+    def drive(steps):
+
+        value, error = None, None
+
+        while True:
+            try:
+                effect = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
+
+            value, error = None, None
+            kind = effect[0]
+
+            try:
+                if kind == 'sleep':
+                    sleep(effect[1])
+                elif kind == 'wait_job':
+                    _, monitor, jobid, status, max_wait = effect
+                    value = monitor.wait_for_change(jobid, status, max_wait)
+                elif kind == 'call':
+                    _, func, args = effect
+                    value = func(*args)
+                elif kind == 'postprocess':
+                    _, queue, func, args = effect
+                    value = queue.submit(func, *args).result()
+                else:
+                    raise ValueError(f'Unknown workflow effect {kind}')
+            except Exception as e:
+                error = e
+
     ### calling monitoring and restart function to check in on jobs
 
     def jobmonitor(self, t_wait, status, jobid, run, HPC_script,log):
+        return self.drive(self.jobmonitor_steps(t_wait, status, jobid, run, HPC_script, log))
+
+    ### stage: workflow stage under which each job id/status update is checkpointed, if any
+
+    def jobmonitor_steps(self, t_wait, status, jobid, run, HPC_script,log,stage=None):
 
         running = True
         chk_counter = 0
         csv_check = True # Option to deactivate csv checks and only run qstat
+        stopping = False # Job stopped early on the HPC, polled every stop_poll seconds until it ends
         
         while running:
             
@@ -129,30 +540,59 @@ class SimScheduling(ABC):
             mdict = self.pset_dict
             mdict['jobID'] = jobid
             mdict['check'] = csv_check
+            ### Chained jobs wait in H on their dependency, only the simulation job is resubmitted when held
+            mdict['resubmit_held'] = not self.is_chained(run)
             mdict_str = json.dumps(mdict, default=self.convert_to_json, ensure_ascii=False)
                         
             ### If t_wait>0, job is either running or queieng
             if t_wait>0:
 
             ### Performing monitoring and waiting processes depending on job status and type
-                if (status == 'Q' or status == 'H' or (status == 'R' and 'Convert' in run)):
+                if (status == 'Q' or status == 'H' or (status == 'R' and self.is_chained(run))):
                     ### If Q or H, wait and qstat later
                     log.info('-' * 100)
                     log.info(f'Job {run} with id: {jobid} has status {status}. Sleeping for:{t_wait/60} mins')
                     log.info('-' * 100)
-                    sleep(t_wait)
+
+                    ### Waiting on the shared batched qstat monitor instead of sleeping blindly, only querying this run once its status changes
+                    if self.pset_dict.get('batch_monitor', True):
+                        monitor = get_monitor(self.local_path, self.usr, self.main_path,
+                                              poll_interval=self.pset_dict.get('batch_poll', 300), agent=self.agent(),
+                                              policy=self.poll_policy())
+                        monitor.register(jobid)
+                        try:
+                            update = yield ('wait_job', monitor, jobid, 'Q' if status == 'H' else status, t_wait)
+                        finally:
+                            monitor.unregister(jobid)
+
+                        if update is not None and update['status'] == 'F':
+                            log.info('-' * 100)
+                            log.info(f'Job {jobid} no longer listed by batched qstat')
+                            log.info('-' * 100)
+                            log.info(f'JOB {run} FINISHED')
+                            log.info('-' * 100)
+
+                            t_wait = 0
+                            status = 'F'
+                            running = False
+                            continue
+                        elif update is not None:
+                            log.info(f'Batched qstat reports status {update["status"]} for job {jobid}')
+                    else:
+                        yield ('sleep', t_wait)
+
                     try:
                         ### Execute monitor function in HPC to check job status
-                        command = f'python {self.main_path}/{HPC_script} monitor --pdict \'{mdict_str}\' --study \'{str(self.study_ID)}\''
-                        new_jobid, new_t_wait, new_status, _ = self.execute_remote_command(
-                            command=command,search=0,log=log
-                            )
+                        new_jobid, new_t_wait, new_status, _ = yield ('call', self.remote_function, (HPC_script, 'monitor', mdict_str, log))
                         
                         ### update t_wait and job status accordingly
                         t_wait = new_t_wait
                         status = new_status
                         jobid = new_jobid
 
+                        if stage is not None:
+                            self.checkpoint(stage, jobid, t_wait, status)
+
                         log.info('-' * 100)
                         log.info(f'Job {run} with id {jobid} status is {status}. Updated sleeping time: {t_wait/60} mins')
                     except (SimScheduling.JobStatError, ValueError, NameError) as e:  
@@ -192,26 +632,40 @@ class SimScheduling(ABC):
                         log.info('-' * 100)
                         log.info('First check to be performed')
 
+                    ### Job asked to stop, polled every stop_poll seconds even once qstat reports it exiting (E, t_wait 0)
+                    if stopping:
+                        stop_poll = max(run_t_wait, float(self.pset_dict.get('stop_poll', 60)))
+                        log.info('-' * 100)
+                        log.info(f'Sleeping for {stop_poll/60} mins until job {jobid} ends after its early stop')
+                        yield ('sleep', stop_poll)
                     ### Sleep extra after last check to guarantee job has finished at the end
-                    if run_t_wait > (t_wait)/(n_checks+1):
+                    elif run_t_wait > (t_wait)/(n_checks+1):
                         log.info('-' * 100)
                         log.info(f'Sleeping for {t_wait/(n_checks+1)/60} mins until next check')
-                        sleep(t_wait/(n_checks+1))
+                        yield ('sleep', t_wait/(n_checks+1))
                     else:
                         log.info('-' * 100)
                         log.info(f'Final check done, sleeping for {run_t_wait/60} mins until completion')
-                        sleep((t_wait/(n_checks+1))* 1.05)
+                        yield ('sleep', (t_wait/(n_checks+1))* 1.05)
 
                     try:
                         ### Execute monitor function in HPC to check job status
-                        command = f'python {self.main_path}/{HPC_script} monitor --pdict \'{mdict_str}\' --study \'{str(self.study_ID)}\''
-                        _, run_t_wait, run_status, _ = self.execute_remote_command(
-                            command=command,search=0,log=log
-                            )
+                        _, run_t_wait, run_status, _ = yield ('call', self.remote_function, (HPC_script, 'monitor', mdict_str, log))
                         
                         status = run_status
                         chk_counter += 1
 
+                        ### Job stopped on the HPC as soon as its finishing condition was met, the monitor call finding it ended moves on to converting
+                        early_stop = (self.remote_data or {}).get('early_stop')
+                        if early_stop is not None:
+                            if not stopping:
+                                log.info('-' * 100)
+                                log.info(f"Finishing condition met ({early_stop['cond_csv']} = {early_stop['value']}), job {jobid} stopped early by {early_stop['mode']}")
+                                log.info(f"{early_stop['walltime_left']/60} mins of walltime saved")
+                                log.info('-' * 100)
+                            stopping = True
+                            continue
+
                         log.info('-' * 100)
                         log.info(f'Run time remaining: {run_t_wait/60} mins')
 
@@ -243,132 +697,132 @@ class SimScheduling(ABC):
             else:
                 running = False
 
-    ### Executing HPC functions remotely via Paramiko SSH library.
+    ### Long-lived HPC agent shared by the runs of this process, None unless enabled with the hpc_agent pset key
 
-    def execute_remote_command(self,command,search,log):
+    def agent(self):
+        if not self.pset_dict.get('hpc_agent', False):
+            return None
+        return get_agent(self.local_path, self.usr, self.main_path, workers=self.pset_dict.get('agent_workers', 4))
 
-        ### Read SSH configuration from config file
-        config = configparser.ConfigParser()
-        configfile = os.path.join(self.local_path, f'config_{self.usr}.ini')
-        config.read(configfile)
-        user = config.get('SSH', 'username')
-        key = config.get('SSH', 'password')
-        try_logins = ['login.hpc.ic.ac.uk','login-a.hpc.ic.ac.uk','login-b.hpc.ic.ac.uk','login-c.hpc.ic.ac.uk']
+    ### Adaptive qstat poll policy of the batched monitor, None for a fixed batch_poll interval
+    def poll_policy(self):
+        if not self.pset_dict.get('adaptive_poll', True):
+            return None
+        return get_poll_policy(os.path.join(self.local_path, 'queue_history.json'),
+                               min_interval=self.pset_dict.get('poll_min', 60), max_interval=self.pset_dict.get('poll_max', 1800),
+                               max_rate=self.pset_dict.get('poll_rate', 60))
 
-        ### Initialize variables for result storage
-        jobid, t_wait, status, ret_bool = None, 0, None, None
-        exc = None
+    ### Calling an HPC_run_scheduling function through the HPC agent when enabled, as a one-shot remote python command otherwise
+    ### via_stdin: pdict sent on the command stdin rather than as an argument, for parameter grids too long for the command line
 
-        for login in try_logins:
+    def remote_function(self,HPC_script,function,dict_str,log,via_stdin=False):
 
-            ### Establish an SSH connection using a context manager
-            ssh = paramiko.SSHClient()
-            ssh.load_system_host_keys()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            warnings.filterwarnings("ignore", category=ResourceWarning)
+        agent = self.agent()
 
+        if agent is not None:
             try:
-                ssh.connect(login, username=user, password=key)
+                ### agent_timeout must exceed the longest remote call, submissions included, as the one-shot fallback runs it again
+                record = agent.request(function, pdict=json.loads(dict_str), study=str(self.study_ID), log=log,
+                                       timeout=self.pset_dict.get('agent_timeout', 1800))
+            except AgentClient.AgentUnavailable as e:
+                log.info(f'{e}, running {function} as a one-shot command')
+            else:
+                for line in record['output']:
+                    log.info(line)
+                return self.read_record(record, log)
+
+        if via_stdin:
+            command = f'python {self.main_path}/{HPC_script} {function} --pdict - --study \'{str(self.study_ID)}\''
+            return self.execute_remote_command(command, log, stdin_data=dict_str)
+
+        command = f'python {self.main_path}/{HPC_script} {function} --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\''
+        return self.execute_remote_command(command, log)
+
+    ### Executing HPC functions remotely via Paramiko SSH library.
+
+    def execute_remote_command(self,command,log,stdin_data=None):
 
-                stdin, stdout, stderr = ssh.exec_command(command)
-                out_lines = []
-                for line in stdout:
-                    stripped_line = line.strip()
+        ### Reusing a pooled SSH session instead of a fresh handshake per command
+        stdin, stdout, stderr = ssh_pool.exec_command(self.local_path, self.usr, command, log)
+
+        try:
+            if stdin_data is not None:
+                stdin.write(stdin_data)
+                stdin.flush()
+                stdin.channel.shutdown_write()
+
+            out_lines = []
+            for line in stdout:
+                stripped_line = line.strip()
+                out_lines.append(stripped_line)
+                if not stripped_line.startswith(RESULT_PREFIX):
                     log.info(stripped_line)
-                    out_lines.append(stripped_line)
-                
-                ### Extracting exceptions, job id, job wait time, status and restart condition
-                results = self.search(out_lines=out_lines,search=search)
-
-                jobid = results.get("jobid", None)
-                t_wait = float(results.get("t_wait", 0))
-                status = results.get("status", None)
-                ret_bool = results.get("ret_bool", None)
-                exc = results.get("exception",None)
-
-                ### Handle exceptions
-                if exc is not None:
-                    if exc == "JobStatError":
-                        raise SimScheduling.JobStatError('qstat output empty, job finished or deleted from HPC run queue')
-                    elif exc == "ValueError":
-                        raise ValueError('Exception raised from job sh creation, qstat in job_wait \
-                                         or attempting to search restart in job_restart')
-                    elif exc == "FileNotFoundError":
-                        raise FileNotFoundError('File not found: either .out or .csv files not found when attempting restart \
-                                                or vtk/pvd/convert files not found when attempting to convert')
-                    elif exc == "ConvergenceError":
-                        raise SimScheduling.ConvergenceError('Convergence checks on HPC failed, job killed as a result')
-                    elif exc == "BadTerminationError":
-                        raise SimScheduling.BadTerminationError("Job run ended with a bad termination error message in the output file. Check convergence or setup issues")
-                    elif exc == 'KeyError':
-                        raise KeyError('Error while attempting to restart: Stop condition key name does not exist in the CSV file checked')
-                    else:
-                        raise NameError('Search for exception from log failed')
-                    
-                if stdin is not None:
-                    break
 
-            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-                if login == try_logins[-1]:
-                    raise e
-                else:
-                    log.info(f'SSH connection failed with login {login}, trying again ...')
-                    continue
+            ### Single JSON record printed last by the remote function
+            record = parse_result(out_lines)
 
-            ### Closing HPC session
-            finally:
-                if 'stdin' in locals():
-                    stdin.close()
-                if 'stdout' in locals():
-                    stdout.close()
-                if 'stderr' in locals():
-                    stderr.close()
-                ssh.close()
-        
-        return jobid, t_wait, status, ret_bool
- 
-    ### Search and extract communications from the functions executed remotely on the HPC
+        ### Closing command channels, the SSH session itself stays pooled
+        finally:
+            stdin.close()
+            stdout.close()
+            stderr.close()
 
-    @staticmethod
-    def search(out_lines,search):
-        ##### search = 0 : looks for JobID, status and wait time
-        ##### search = 1 : looks for wait time, status
-        ##### search = 2 : looks for JobID, status and wait time and boolean return values
-
-        ### Define markers and corresponding result keys for different search types
-        if search == 0:
-            markers = {
-                "====JOB_IDS====": "jobid",
-                "====WAIT_TIME====": "t_wait",
-                "====JOB_STATUS====": "status",
-                "====EXCEPTION====" : "exception"
-                }
-        elif search == 1:
-            markers = {
-                "====WAIT_TIME====": "t_wait",
-                "====JOB_STATUS====": "status",
-                "====EXCEPTION====" : "exception"
-                }
-        elif search == 2:
-            markers = {
-                "====JOB_IDS====": "jobid",
-                "====WAIT_TIME====": "t_wait",
-                "====JOB_STATUS====": "status",
-                "====RETURN_BOOL====": "ret_bool",
-                "====EXCEPTION====" : "exception"
-                }
-            
-        results = {}
-        current_variable = None
+        return self.read_record(record, log)
+
+    ### Returns the typed jobid, t_wait, status and ret_bool fields of a remote result record, raising its error locally
+
+    def read_record(self,record,log):
+
+        log.info(f"Remote {record['function']} completed in {record['timing']['elapsed']} s")
+
+        ### Raising the local counterpart of the remote error code
+        error = record['error']
+        if error is not None:
+            exc_class, description = self.remote_errors.get(error['code'], (NameError, f"Unknown remote error code {error['code']}"))
+            raise exc_class(f"{description}. HPC message: {error['message']}")
+
+        ### Function specific payload of the last record, e.g. the reduce job id submitted by vtk_convert
+        self.remote_data = record['data']
+
+        return record['jobid'], record['t_wait'], record['status'], record['ret_bool']
+
+    ### Folder the converted files and the reduced metrics are downloaded to
+    def download_dir(self):
+        return self.save_path_runID_post if hasattr(self, 'save_path_runID_post') else self.save_path_runID
+
+    ### Download of the metrics file written by the reduce job, False if the job did not produce it
+
+    def fetch_metrics(self,log):
+
+        remote_path = f'/rds/general/user/{self.usr}/ephemeral/{self.run_name}/RESULTS'
+
+        downloader = BulkDownloader(self.local_path, self.usr, verify=self.pset_dict.get('sftp_verify'), log=log)
+        fetched = downloader.download_file(remote_path, self.download_dir(), metrics_name(self.run_name))
 
-        for idx, line in enumerate(out_lines):
-            if line in markers:
-                current_variable = markers[line]
-                # Store the value associated with the marker as the value of the current variable
-                results[current_variable] = out_lines[idx + 1]
+        log.info('-' * 100)
+        log.info(f'Metrics reduced on the HPC downloaded to {self.download_dir()}' if fetched
+                 else 'No metrics file found on the HPC, downloading the converted files')
+        log.info('-' * 100)
 
+        return fetched
 
-        return results
+    ### DataFrame and final time computed by the reduce job, None outside remote_reduce mode or if no metrics were downloaded
+
+    def reduced_metrics(self,log):
+
+        if not self.pset_dict.get('remote_reduce'):
+            return None
+
+        try:
+            frame, maxtime = read_metrics(os.path.join(self.download_dir(), metrics_name(self.run_name)))
+        except (FileNotFoundError, ValueError, KeyError) as e:
+            log.info(f'Reduced metrics not available, post-processing the downloaded files. Exited with message: {e}')
+            return None
+
+        log.info('Using the metrics computed on the HPC by the reduce job')
+        log.info('-' * 100)
+
+        return frame, maxtime
 
     ### Download final converted data to local processing machine
 
@@ -385,67 +839,25 @@ class SimScheduling(ABC):
         except:
             pass
 
-        ### Config file with keys to login to the HPC
-        config = configparser.ConfigParser()
-        configfile = os.path.join(self.local_path, f'config_{self.usr}.ini')
-        config.read(configfile)
-        user = config.get('SSH', 'username')
-        key = config.get('SSH', 'password')
-        try_logins = ['login.hpc.ic.ac.uk','login-a.hpc.ic.ac.uk','login-b.hpc.ic.ac.uk','login-c.hpc.ic.ac.uk']
-
-        for login in try_logins:
-            
-            ### Establish an SSH connection using a context manager
-            ssh = paramiko.SSHClient()
-            ssh.load_system_host_keys()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            warnings.filterwarnings("ignore", category=ResourceWarning)
-
-            try:
-                ssh.connect(login, username=user, password=key)
-                stdin, _, _ = ssh.exec_command("echo 'SSH connection test'")
-                transport = ssh.get_transport()
-                sftp = paramiko.SFTPClient.from_transport(transport)
-
-                remote_path = os.path.join(ephemeral_path,self.run_name,'RESULTS')
-                remote_files = sftp.listdir_attr(remote_path)
-
-                for file_attr in remote_files:
-                    remote_file_path = os.path.join(remote_path, file_attr.filename)
-
-                    if hasattr(self, 'save_path_runID_post'):
-                        local_file_path = os.path.join(self.save_path_runID_post, file_attr.filename)
-                    else:
-                        local_file_path = os.path.join(self.save_path_runID, file_attr.filename)
+        remote_path = os.path.join(ephemeral_path,self.run_name,'RESULTS')
+        local_dir = self.download_dir()
 
-                    # Check if it's a regular file before copying
-                    if file_attr.st_mode & 0o100000:
-                        sftp.get(remote_file_path, local_file_path)
+        ### Parallel SFTP channels over the pooled SSH session, complete files skipped and partial ones resumed
+        downloader = BulkDownloader(self.local_path, self.usr,
+                                    channels=self.pset_dict.get('sftp_channels', 4),
+                                    verify=self.pset_dict.get('sftp_verify'), log=log)
 
-                log.info('-' * 100)
-                log.info(f'Files successfully copied at {self.save_path}')
+        ### Archives packed on the HPC streamed through the decompressor, individual files otherwise
+        pack_path = os.path.join(ephemeral_path,self.run_name,'RESULTS_PACKED')
+        if not (self.pset_dict.get('pack_results') and downloader.download_packed(pack_path, local_dir)):
+            downloader.download(remote_path, local_dir)
 
-                if stdin is not None:
-                    break
-                
-            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-                if login == try_logins[-1]:
-                    raise e
-                else:
-                    log.info(f'SSH connection failed with login {login}, trying again ...')
-                    continue
+        log.info('-' * 100)
+        log.info(f'Files successfully copied at {self.save_path}')
 
-            ### closing HPC session
-            finally:
-                if 'sftp' in locals():
-                    sftp.close()
-                if 'stdin' in locals():
-                    stdin.close()
-                if 'ssh' in locals():
-                    ssh.close()
-                    
-            log.info('-' * 100)
-            log.info('-' * 100)
+        log.info('-' * 100)
+        ssh_pool.report(log)
+        log.info('-' * 100)
 
 
 ################################################################################################################################################################################
@@ -528,10 +940,7 @@ class SimMonitoring(SimScheduling):
 
             try:
                 log.info('-' * 100)
-                command = f'python {self.main_path}/{HPC_script} job_restart --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\''
-                new_jobID, new_t_wait, new_status, ret_bool = self.execute_remote_command(
-                    command=command, search=2, log=log
-                    )
+                new_jobID, new_t_wait, new_status, ret_bool = self.remote_function(HPC_script, 'job_restart', dict_str, log)
 
                 log.info('-' * 100)
 
@@ -539,7 +948,9 @@ class SimMonitoring(SimScheduling):
                 jobid = new_jobID
                 t_wait = new_t_wait
                 status = new_status
-                restart = eval(ret_bool)
+                if ret_bool is None:
+                    raise TypeError('Restart decision missing from the HPC result record')
+                restart = ret_bool
 
             except (ValueError,FileNotFoundError,NameError,
                     SimScheduling.BadTerminationError,SimScheduling.JobStatError,TypeError,KeyError) as e:
@@ -555,80 +966,48 @@ class SimMonitoring(SimScheduling):
 
         ephemeral_path = f'/rds/general/user/{self.usr}/ephemeral/'
 
-        ### Config file with keys to login to the HPC
-        config = configparser.ConfigParser()
-        configfile = os.path.join(self.local_path, f'config_{self.usr}.ini')
-        config.read(configfile)
-        user = config.get('SSH', 'username')
-        key = config.get('SSH', 'password')
-        try_logins = ['login.hpc.ic.ac.uk','login-a.hpc.ic.ac.uk','login-b.hpc.ic.ac.uk','login-c.hpc.ic.ac.uk']
+        ### SFTP channel opened over the pooled SSH session
+        sftp = ssh_pool.open_sftp(self.local_path, self.usr, log)
 
-        for login in try_logins:
-            
-            ### Establish an SSH connection using a context manager
-            ssh = paramiko.SSHClient()
-            ssh.load_system_host_keys()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            warnings.filterwarnings("ignore", category=ResourceWarning)
+        try:
+            remote_path = os.path.join(ephemeral_path,self.run_name)
 
+            # Trying to Find .csv file in EPHEMERAL
             try:
-                ssh.connect(login, username=user, password=key)
-                stdin, _, _ = ssh.exec_command("echo 'SSH connection test'")
-                transport = ssh.get_transport()
-                sftp = paramiko.SFTPClient.from_transport(transport)
-                remote_path = os.path.join(ephemeral_path,self.run_name)
                 remote_files = sftp.listdir(remote_path)
+                csv_files = [file for file in remote_files if 
+                             file.endswith(f'{self.run_name}.csv' 
+                                           if os.path.exists(f'{self.run_name}.csv') else f'HST_{self.run_name}.csv')]
 
-                # Trying to Find .csv file in EPHEMERAL
-                try:
-                    remote_files = sftp.listdir(remote_path)
-                    csv_files = [file for file in remote_files if 
-                                 file.endswith(f'{self.run_name}.csv' 
-                                               if os.path.exists(f'{self.run_name}.csv') else f'HST_{self.run_name}.csv')]
-
-                    # If csv is found. Create a directory named with current date in "temporal", copy the csv there and rename it to: *_{today_date}.csv
-                    if csv_files:
-                        log.info('-' * 100)
-                        log.info(f"*.csv file found in remote directory")
-                        log.info('-' * 100)
-                        today_date = datetime.now().strftime("%d%m%y")
-                        target_directory = os.path.join(self.save_path_csv, today_date)
-                        os.makedirs(target_directory, exist_ok=True)
-                        log.info(f"Directory {today_date} created")
-
-                        for csv_file in csv_files:
-                            new_csv_file_name = f"{os.path.splitext(csv_file)[0]}_{today_date}.csv"
-                            remote_file_path = os.path.join(remote_path, csv_file)
-                            local_file_path = os.path.join(target_directory, new_csv_file_name)
-                            sftp.get(remote_file_path, local_file_path)
-                            log.info(f"File {new_csv_file_name} copied and renamed")
-                    else:
-                        # If no csv file is found. Continue with the job restarting process and issue a warning
-                        log.info('-' * 100)
-                        log.info("WARNING: No csv files found to copy. Simulation will be restarted but please check")
-                        log.info('-' * 100)
-                finally:
+                # If csv is found. Create a directory named with current date in "temporal", copy the csv there and rename it to: *_{today_date}.csv
+                if csv_files:
                     log.info('-' * 100)
-                    log.info("Restarting process will begin")
+                    log.info(f"*.csv file found in remote directory")
                     log.info('-' * 100)
-
-                if stdin is not None:
-                    break
-
-            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-                if login == try_logins[-1]:
-                    raise e
+                    today_date = datetime.now().strftime("%d%m%y")
+                    target_directory = os.path.join(self.save_path_csv, today_date)
+                    os.makedirs(target_directory, exist_ok=True)
+                    log.info(f"Directory {today_date} created")
+
+                    for csv_file in csv_files:
+                        new_csv_file_name = f"{os.path.splitext(csv_file)[0]}_{today_date}.csv"
+                        remote_file_path = os.path.join(remote_path, csv_file)
+                        local_file_path = os.path.join(target_directory, new_csv_file_name)
+                        sftp.get(remote_file_path, local_file_path)
+                        log.info(f"File {new_csv_file_name} copied and renamed")
                 else:
-                    log.info(f'SSH connection failed with login {login}, trying again ...')
-                    continue
-
-            ### closing HPC session
+                    # If no csv file is found. Continue with the job restarting process and issue a warning
+                    log.info('-' * 100)
+                    log.info("WARNING: No csv files found to copy. Simulation will be restarted but please check")
+                    log.info('-' * 100)
             finally:
-                if 'sftp' in locals():
-                    sftp.close()
-                if 'stdin' in locals():
-                    stdin.close()
-                if 'ssh' in locals():
-                    ssh.close()
+                log.info('-' * 100)
+                log.info("Restarting process will begin")
+                log.info('-' * 100)
+
+        ### closing SFTP channel, the SSH session itself stays pooled
+        finally:
+            sftp.close()
+
         return True
 
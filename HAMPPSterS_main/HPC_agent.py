@@ -0,0 +1,246 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Long-lived agent serving HPC_run_scheduling functions over a single SSH channel
+### to be run in the HPC, started by the local side through agent_client.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+### Requests arrive on stdin as one JSON line each: {"id": n, "function": ..., "study": ..., "pdict": {...}, "jobs": [...]}
+### Every response is one RESULT_PREFIX line: the hpc_protocol record plus the request id and the captured output lines
+
+import io
+import os
+import sys
+import json
+import time
+import zlib
+import queue
+import argparse
+import threading
+import contextlib
+import multiprocessing as mp
+
+### Heavy imports (pandas, numpy) paid once here rather than per remote command
+from HPC_run_scheduling import dispatch
+from hpc_protocol import RESULT_PREFIX, RemoteResult
+
+
+################################################################################### HPC AGENT ################################################################################
+
+class HPCAgent:
+    """Routes requests to forked worker processes that keep modules imported and per-run state cached"""
+
+    ### Functions sleeping for minutes (submission waits) or compressing run results run in their own forked process so workers stay responsive
+    long_functions = ['run', 'run_batch', 'job_restart', 'vtk_convert', 'pack_results']
+
+    ### Seconds between checks for dead worker and one-shot processes
+    check_interval = 10
+
+    def __init__(self, workers=4) -> None:
+
+        self.ctx = mp.get_context('fork')
+        self.responses = self.ctx.Queue()
+
+        ### One queue per worker, a run is always served by the same worker so its cache stays in one process
+        self.queues = [None] * workers
+        self.workers = [None] * workers
+        self.one_shots = []
+
+        ### request id -> (process serving it, function), to answer the requests of a process that dies before replying
+        self.inflight = {}
+        self.dead = set()
+        self.next_check = time.monotonic() + self.check_interval
+        self._lock = threading.Lock()
+
+        for index in range(workers):
+            self.start_worker(index)
+
+        self.writer = threading.Thread(target=self.write_responses, name='HPCAgentWriter', daemon=True)
+        self.writer.start()
+
+    ### Worker processes only talk back through the response queue, shell commands they spawn must not reach the channel
+
+    @staticmethod
+    def detach_output():
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        os.close(devnull)
+
+    ### Executing a request with its printed output captured, returning the response dict
+
+    @staticmethod
+    def handle(request, cache):
+
+        buffer = io.StringIO()
+
+        with contextlib.redirect_stdout(buffer), contextlib.redirect_stderr(buffer):
+            result = dispatch(request.get('function'), pdict=request.get('pdict'), study=request.get('study'),
+                              jobs=request.get('jobs'), cache=cache)
+
+        ### chdir calls in the HPC functions are process wide, returning to a neutral directory between requests
+        os.chdir(os.path.expanduser('~'))
+
+        return {**result.as_dict(), 'id': request.get('id'), 'output': buffer.getvalue().splitlines()}
+
+    @classmethod
+    def worker(cls, queue, responses):
+
+        cls.detach_output()
+
+        ### run_name -> cache dict handed to every HPCScheduling instance of that run
+        caches = {}
+
+        while True:
+            request = queue.get()
+            if request is None:
+                break
+
+            run_name = (request.get('pdict') or {}).get('run_name')
+            responses.put(cls.handle(request, caches.setdefault(run_name, {})))
+
+    @classmethod
+    def one_shot(cls, request, responses):
+        cls.detach_output()
+        responses.put(cls.handle(request, {}))
+
+    ### Fresh queue and process for a worker slot, its cached run state is lost
+
+    def start_worker(self, index):
+        self.queues[index] = self.ctx.Queue()
+        self.workers[index] = self.ctx.Process(target=self.worker, args=(self.queues[index], self.responses), daemon=True)
+        self.workers[index].start()
+
+    ### Restarting dead workers and failing the requests of dead processes, called with the lock held
+    ### A process is only failed on the check after the one that found it dead, so responses it queued before exiting are written first
+
+    def check_workers(self):
+
+        self.next_check = time.monotonic() + self.check_interval
+
+        for index, proc in enumerate(self.workers):
+            if not proc.is_alive():
+                self.start_worker(index)
+
+        dead = {proc for proc, _ in self.inflight.values() if not proc.is_alive()}
+
+        for req_id, (proc, function) in list(self.inflight.items()):
+            if proc in self.dead:
+                del self.inflight[req_id]
+                result = RemoteResult(function)
+                result.fail('UnhandledError', f'HPC agent process serving {function} exited with code {proc.exitcode}')
+                self.write({**result.as_dict(), 'id': req_id, 'output': []})
+
+        self.dead = dead
+
+    @staticmethod
+    def write(response):
+        sys.stdout.write(RESULT_PREFIX + json.dumps(response, default=str) + '\n')
+        sys.stdout.flush()
+
+    ### Single writer so response lines never interleave on the channel, checking on the processes every check_interval seconds
+
+    def write_responses(self):
+
+        while True:
+            try:
+                response = self.responses.get(timeout=self.check_interval)
+            except queue.Empty:
+                response = {}
+
+            if response is None:
+                break
+
+            with self._lock:
+                if response:
+                    self.inflight.pop(response.get('id'), None)
+                    self.write(response)
+                if time.monotonic() >= self.next_check:
+                    self.check_workers()
+
+    def route(self, request):
+
+        with self._lock:
+
+            if request.get('function') in self.long_functions:
+                proc = self.ctx.Process(target=self.one_shot, args=(request, self.responses), daemon=False)
+                proc.start()
+                self.one_shots = [p for p in self.one_shots if p.is_alive()] + [proc]
+
+            else:
+                ### Stable hash so a run keeps its worker across requests
+                run_name = (request.get('pdict') or {}).get('run_name') or ''
+                index = zlib.crc32(run_name.encode()) % len(self.queues)
+
+                if not self.workers[index].is_alive():
+                    self.check_workers()
+
+                proc = self.workers[index]
+                self.queues[index].put(request)
+
+            self.inflight[request.get('id')] = (proc, request.get('function'))
+
+    ### Serving until the local side closes the channel or sends a shutdown request
+
+    def serve(self, stream):
+
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                result = RemoteResult(None)
+                result.fail('ValueError', f'Malformed agent request: {e}')
+                self.responses.put({**result.as_dict(), 'id': None, 'output': []})
+                continue
+
+            if request.get('function') == 'shutdown':
+                break
+
+            self.route(request)
+
+        self.close()
+
+    def close(self):
+
+        for queue in self.queues:
+            queue.put(None)
+        for proc in self.workers:
+            proc.join()
+
+        ### Letting submissions in flight finish so no run is left half created
+        for proc in self.one_shots:
+            proc.join()
+
+        self.responses.put(None)
+        self.writer.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    ### Number of persistent worker processes for monitor and batched qstat requests
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+    )
+
+    args = parser.parse_args()
+
+    agent = HPCAgent(workers=args.workers)
+
+    ### Handshake telling the local side the agent is ready to accept requests
+    ready = RemoteResult('agent_ready')
+    agent.responses.put({**ready.as_dict(), 'id': 0, 'output': []})
+
+    agent.serve(sys.stdin)
+
+if __name__ == "__main__":
+    main()
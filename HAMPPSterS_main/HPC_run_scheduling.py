@@ -10,6 +10,7 @@
 #######################################################################################################################################################################################
 
 import os
+import sys
 from subprocess import Popen, PIPE
 from time import sleep
 import pandas as pd
@@ -23,7 +24,17 @@ import argparse
 import json
 import numpy as np
 import operator
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from abc import ABC, abstractmethod
+from hpc_protocol import RemoteResult
+from csv_tail import CSVTailReader
+from convergence import ConvergenceDiagnostics
+from out_scanner import OutScanner
+from templates import get_templates, render_in_place, substitute, ENCODING
+from result_pack import pack_results as pack_folder
+from reduce_metrics import REDUCERS, params_name
+from build_cache import get_build_cache, build_key, compiler_env
 
 operator_map = {
     "<": operator.lt,
@@ -34,6 +45,19 @@ operator_map = {
     "!=": operator.ne
 }
 
+### Restart-check job chained with afterany after every simulation job in pbs_chain mode
+### It runs chain_step on a compute node: resubmitting the simulation with its next check, or submitting the convert job
+CHAIN_JOB = '''#!/bin/bash
+#PBS -N 'job_name'
+#PBS -o 'job_name'.out
+#PBS -j oe
+#PBS -l select=1:ncpus=1:mem='mem'gb
+#PBS -l walltime='walltime'
+cd $PBS_O_WORKDIR
+
+'python_exe' 'hpc_script' chain_step --pdict "$(cat 'pdict_file')" --study 'study'
+'''
+
 ################################################################################### PARENT CLASS ################################################################################
 
 ################################################################################# Author: Juan Pablo Valdes #########################################################################
@@ -53,6 +77,9 @@ class HPCScheduling(ABC):
             self.message = message
             super().__init__(self.message)
 
+    ### Placeholder names of each rendered base file over every case type of the class, any of them left unreplaced is an error
+    template_placeholders = {'job_reduce.sh': ('job_name', 'params_file', 'python_exe', 'reduce_script', 'mem', 'walltime')}
+
     ### Init function  
     def __init__(self,pset_dict) -> None:
                 
@@ -76,63 +103,83 @@ class HPCScheduling(ABC):
         self.output_file_path = os.path.join(self.path,f'{self.run_name}.out')
         self.ephemeral_path = os.path.join(os.environ['EPHEMERAL'],self.run_name)
 
+        ### Structured record handed back to the local side, replaced and emitted by main() for each invocation
+        self.result = RemoteResult(None, self.run_name)
+
+        ### Per-run state that survives between calls when served by the long-lived HPC_agent.py
+        self.cache = {}
+
     ### assigning input parametric values as attributes of the SimScheduling class and submitting jobs
 
     def run(self):
 
+        if not self.provision():
+            return
+
+        ### wait time to submit jobs, avoiding them to go all at once
+        init_wait_time = np.random.RandomState().randint(60,180)
+        sleep(init_wait_time)
+
+        job_IDS = self.submit()
+
+        sleep(120)
+
+        ### Check job status and assign waiting time accordingly
+        try:
+            t_jobwait, status, update_jobID = self.job_wait(job_IDS)
+            self.result.update(jobid=update_jobID, status=status, t_wait=t_jobwait)
+
+        except HPCScheduling.JobStatError as e:
+            print(f'Job {self.run_ID} failed on initial submission')
+            self.result.fail('JobStatError', e)
+        except ValueError as e:
+            self.result.fail('ValueError', e)
+
+    ### Creating the run directory, f90, executable and job.sh, False with the result failed if the set-up is invalid
+
+    def provision(self):
+
         ### Creating f90
         print('-' * 100)
         print('F90 CREATION')
         print('-' * 100)
 
-        self.makef90()
+        try:
+            self.makef90()
 
-        ### Creating job.sh
-        print('-' * 100)
-        print('JOB.SH CREATION')
-        print('-' * 100)
+            ### Creating job.sh
+            print('-' * 100)
+            print('JOB.SH CREATION')
+            print('-' * 100)
 
-        try:
             self.setjobsh()
         except ValueError as e:
             print(f'Case ID {self.run_ID} failed due to: {e}')
-            print("====EXCEPTION====")
-            print("ValueError")
-            raise ValueError (f'Exited HPC with error {e}')
+            self.result.fail('ValueError', f'Exited HPC with error {e}')
+            return False
+
+        return True
+
+    ### Submitting job.sh of a provisioned run, with its restart check when chained. Returns the job id
+
+    def submit(self):
 
         ### Submitting job.sh
         print('-' * 100)
         print('JOB SUBMISSION')
         print('-' * 100)
 
-        ### wait time to submit jobs, avoiding them to go all at once
-        init_wait_time = np.random.RandomState().randint(60,180)
-        sleep(init_wait_time)
-
         job_IDS = self.submit_job(self.path,self.run_name)
 
         print('-' * 100)
         print(f'Job {self.run_ID} submitted succesfully with ID {job_IDS}')
 
-        sleep(120)
+        ### Restart check queued up front, PBS starts it as soon as the simulation job ends
+        if self.pset_dict.get('pbs_chain'):
+            chain_jobid = self.submit_chain(job_IDS)
+            self.write_chain(stage='running', sim_jobid=job_IDS, chain_jobid=chain_jobid, restarts=0, error=None)
 
-        ### Check job status and assign waiting time accordingly
-        try:
-            t_jobwait, status, update_jobID = self.job_wait(job_IDS)
-            print("====JOB_IDS====")
-            print(update_jobID)
-            print("====JOB_STATUS====")
-            print(status)
-            print("====WAIT_TIME====")
-            print(t_jobwait)
-
-        except HPCScheduling.JobStatError:
-            print(f'Job {self.run_ID} failed on initial submission')
-            print("====EXCEPTION====")
-            print("JobStatError")
-        except ValueError:
-            print("====EXCEPTION====")
-            print("ValueError")
+        return job_IDS
 
     ### checking jobstate and sleeping until completion or restart commands
 
@@ -141,33 +188,32 @@ class HPCScheduling(ABC):
         ### Read dictionary with job_ID to monitor
         self.jobID = self.pset_dict['jobID']
         self.check = self.pset_dict['check']
+        self.resubmit_held = self.pset_dict.get('resubmit_held', True)
 
 
         ### Call job waiting method and extract corresponding outputs
         try:
             t_jobwait, status, newjobid = self.job_wait(
-                int(self.jobID))
-            print("====JOB_IDS====")
-            print(newjobid)
-            print("====JOB_STATUS====")
-            print(status)
-            print("====WAIT_TIME====")
-            print(t_jobwait)
+                int(self.jobID), resubmit_held=self.resubmit_held)
+            self.result.update(jobid=newjobid, status=status, t_wait=t_jobwait)
+
+            ### Job already stopped early, skipping the checks until PBS releases it
+            if status == 'R' and self.early_stop_marker(self.jobID) is not None:
+                self.early_stop(int(self.jobID), None, t_jobwait)
 
             ### If job running, start convergence checks
-            if status == 'R' and self.check:
+            elif status == 'R' and self.check:
                 chk_status = self.check_convergence()
 
                 ### Job likely to diverge, kill the job and raise the exception
                 if chk_status == 'D':
-                    print('-' * 100)
-                    print("====EXCEPTION====")
-                    print("ConvergenceError")
                     print('-' * 100)
                     print(f'Job from run {self.run_ID} is failing to converge')
                     print(f'Killing Job ID {self.jobID} from run {self.run_ID}')
                     print('-' * 100)
                     Popen(['qdel', f"{self.jobID}"])
+                    self.stop_chain('ConvergenceError', f'Job {self.jobID} failed its convergence checks and was deleted')
+                    self.result.fail('ConvergenceError', f'Job {self.jobID} from run {self.run_ID} failed its convergence checks and was deleted')
 
                 ### Convergence checks not needed at early stage in the run
                 elif chk_status == 'NR':
@@ -186,13 +232,17 @@ class HPCScheduling(ABC):
                     print(f'Required convergence checks for job {self.run_ID} have passed successfully')
                     print('-' * 100)
 
-        except HPCScheduling.JobStatError:
-            print("====EXCEPTION====")
-            print("JobStatError")
+                ### Finishing condition already met in the csv tail: stopping the job instead of letting it use up its walltime
+                if chk_status in ('C', 'NR') and self.pset_dict.get('early_stop'):
+                    cond_value = self.stop_condition_met()
+                    if cond_value is not None:
+                        self.early_stop(int(self.jobID), cond_value, t_jobwait)
+
+        except HPCScheduling.JobStatError as e:
+            self.result.fail('JobStatError', e)
         except ValueError as e:
-            print("====EXCEPTION====")
-            print("ValueError")
             print(f'Exited with message: {e}')
+            self.result.fail('ValueError', e)
            
     ### creating f90 instance and executable
     @abstractmethod
@@ -204,14 +254,112 @@ class HPCScheduling(ABC):
     def setjobsh(self):
         pass
 
+    ### Base files of the case, read once and rendered in memory by makef90 and setjobsh
+    def base_templates(self):
+        base_case_dir = os.path.join(self.pset_dict['base_path'], self.case_type)
+        return get_templates(base_case_dir)
+
+    ### Rendering a base file into a run file, failing if a placeholder declared for it in template_placeholders is left
+    def write_template(self, name, out_path, placeholders=None, words=None):
+        self.base_templates().write(name, out_path, placeholders, words, expected=self.template_placeholders.get(name))
+
+    ### Placing the read-only base files in the new run directory, linked rather than duplicated on RDS
+    def link_base(self, templates, exclude):
+
+        ### base_link: 'hardlink' (default), 'symlink' or 'copy'
+        stats = templates.materialize(self.path, exclude=exclude, mode=self.pset_dict.get('base_link', 'hardlink'))
+
+        print('-' * 100)
+        print(f"Run directory {self.path} created, {stats['linked']} of {stats['files']} base files linked, "
+              f"{stats['saved'] / 1024**2:.1f} MB of {stats['bytes'] / 1024**2:.1f} MB not duplicated")
+
+        ### Reported to the local side with the run submission
+        self.result.update(data=dict(self.result.fields['data'] or {}, base_files=stats))
+
+    ### Executable of the run taken from the build cache, compiled only the first time its source, Makefile and compiler environment are seen
+    def compile_f90(self, exe_name):
+
+        ### build_cache: cache folder (build_cache next to the runs folder by default), False to compile every run
+        cache_dir = self.pset_dict.get('build_cache', os.path.join(self.mainpath, 'build_cache'))
+        if not cache_dir:
+            self.make_exe(exe_name)
+            return
+
+        with open(os.path.join(self.path, f'{exe_name}.f90'), 'r', encoding=ENCODING, newline='') as file:
+            source = file.read()
+
+        key = build_key(source, self.base_templates().files['Makefile'], compiler_env())
+        hit = get_build_cache(cache_dir).build(key, os.path.join(self.path, f'{self.run_name}.x'), lambda: self.make_exe(exe_name))
+
+        if hit:
+            print('-' * 100)
+            exe_size = os.path.getsize(os.path.join(self.path, f'{self.run_name}.x'))
+            print(f'Executable for {self.run_name} reused from build cache entry {key[:12]} ({exe_size / 1024**2:.1f} MB), compilation skipped')
+
+    ### compiling the rendered f90 in the run directory and renaming the executable after the run
+    def make_exe(self, exe_name):
+        subprocess.run(['make'], cwd=self.path, capture_output=True, text=True, check=True)
+        print('-' * 100)
+        print('Makefile created succesfully')
+        os.rename(os.path.join(self.path, f'{exe_name}.x'), os.path.join(self.path, f'{self.run_name}.x'))
+        subprocess.run(['make', 'cleanall'], cwd=self.path, capture_output=True, text=True, check=True)
+
     ### Converting vtk to vtr
     @abstractmethod
     def vtk_convert(self):
         pass
 
+    ### Rendering and submitting the reduce job in RESULTS, chained after the convert job so it runs next to the converted fields
+    def submit_reduce(self, results_path, convert_jobid):
+
+        ### Parameters read by reduce_metrics.py inside the job
+        with open(os.path.join(results_path, params_name(self.run_name)), 'w') as file:
+            json.dump(self.pset_dict, file)
+
+        placeholders = {'job_name': f'Reduce_{self.run_name}', 'params_file': params_name(self.run_name),
+                        'python_exe': sys.executable,
+                        'reduce_script': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'reduce_metrics.py'),
+                        'mem': self.pset_dict.get('reduce_mem', 32), 'walltime': self.pset_dict.get('reduce_walltime', '01:00:00')}
+
+        self.write_template('job_reduce.sh', os.path.join(results_path, 'job_reduce.sh'), placeholders)
+
+        jobid = self.submit_job(results_path, 'reduce', depend=convert_jobid)
+
+        print('-' * 100)
+        print(f'JOB REDUCE from {self.run_name} submitted succesfully with ID {jobid}, held until convert job {convert_jobid} ends')
+
+        return jobid
+
+    ### Packing the converted RESULTS into a few compressed archives once the convert job has finished, downloaded and unpacked locally
+    def pack_results(self):
+
+        results_path = os.path.join(self.ephemeral_path,'RESULTS')
+        pack_path = os.path.join(self.ephemeral_path,'RESULTS_PACKED')
+
+        print('-' * 100)
+        print(f'Packing {results_path}')
+
+        ### Codecs listed by the local side in the order it prefers them, one archive per SFTP channel by default
+        codecs = self.pset_dict.get('pack_codecs') or ['gzip']
+        n_archives = self.pset_dict.get('pack_archives') or self.pset_dict.get('sftp_channels', 4)
+
+        try:
+            manifest = pack_folder(results_path, pack_path, codecs=codecs, n_archives=n_archives)
+            self.result.update(data={'codec': manifest['codec'], 'archives': len(manifest['archives']),
+                                     'raw': sum(entry['raw'] for entry in manifest['archives'].values()),
+                                     'size': sum(entry['size'] for entry in manifest['archives'].values())})
+            print(f'RESULTS packed in {pack_path}')
+            print('-' * 100)
+        except FileNotFoundError as e:
+            print(f'Exited with message :{e}')
+            self.result.fail('FileNotFoundError', e)
+        except (ValueError, OSError, subprocess.CalledProcessError) as e:
+            print(f'Packing failed with message :{e}')
+            self.result.fail('ValueError', f'Packing failed: {e}')
+
     ### checking job status and sending exceptions as fitting
 
-    def job_wait(self,job_id):
+    def job_wait(self,job_id,resubmit_held=True):
         try:
             p = Popen(['qstat', '-a',f"{job_id}"],stdout=PIPE, stderr=PIPE)
             output = p.communicate()[0]
@@ -227,6 +375,12 @@ class HPCScheduling(ABC):
                 raise ValueError('Job exists but belongs to another account')
     
             if status == 'Q':
+                ### Upper bound of the wait: the PBS estimated start when known, within 5 min and 1 h
+                start_in = self.queue_details([job_id]).get(str(int(job_id)), {}).get('start_in')
+                t_wait = 3600 if start_in is None else min(3600, max(300, start_in))
+                newjobid = job_id
+            elif status == 'H' and not resubmit_held:
+                ### Chained jobs wait in H on their dependency and are left untouched
                 t_wait = 3600
                 newjobid = job_id
             elif status == 'H':
@@ -235,20 +389,14 @@ class HPCScheduling(ABC):
                 Popen(['qdel', f"{job_id}"])
                 sleep(60)
                 newjobid = self.submit_job(self.path,self.run_name)
+                self.replace_chain(job_id, newjobid)
                 t_wait = 1800
                 print(f'Submitted new job with id: {newjobid}')
             elif status == 'R':
-                time_format = '%H:%M'
-                time_format_regex = r'\d{2}:\d{2}'
-                
+                remaining = self.remaining_walltime(jobstatus)
+
                 # can have early monitor where R and -- as elap time
-                if re.match(time_format_regex, jobstatus[2]):
-                    if jobstatus[0] == '24:00':
-                        jobstatus[0] = '23:00'
-                    wall_time = datetime.datetime.strptime(jobstatus[0], time_format).time()
-                    elap_time = datetime.datetime.strptime(jobstatus[2], time_format).time()
-                    delta = datetime.datetime.combine(datetime.date.min, wall_time)-datetime.datetime.combine(datetime.date.min, elap_time)
-                    remaining = delta.total_seconds()+60
+                if remaining is not None:
                     t_wait = remaining
                     newjobid = job_id
                 else:
@@ -257,6 +405,7 @@ class HPCScheduling(ABC):
                     print(f'Elap time has not shown yet. Re-check in {t_wait/60} mins.')
             else:
                 t_wait = 0
+                newjobid = job_id
                 
         except subprocess.CalledProcessError:
             raise HPCScheduling.JobStatError("qstat output empty, job finished or deleted from HPC run queue")
@@ -267,6 +416,126 @@ class HPCScheduling(ABC):
             
         return t_wait, status, newjobid
 
+    ### remaining walltime in seconds from the [Req'd Time, S, Elap Time] columns of qstat -a, None if elap time not shown yet
+
+    @staticmethod
+    def remaining_walltime(jobstatus):
+        time_format = '%H:%M'
+        time_format_regex = r'\d{2}:\d{2}'
+
+        if not re.match(time_format_regex, jobstatus[2]):
+            return None
+
+        wall = '23:00' if jobstatus[0] == '24:00' else jobstatus[0]
+        wall_time = datetime.datetime.strptime(wall, time_format).time()
+        elap_time = datetime.datetime.strptime(jobstatus[2], time_format).time()
+        delta = datetime.datetime.combine(datetime.date.min, wall_time)-datetime.datetime.combine(datetime.date.min, elap_time)
+        return delta.total_seconds()+60
+
+    ### single qstat call for many job ids, returning {jobid: {'status', 't_wait'}}
+    ### 'F' only for jobs qstat reports as unknown or finished, ids it says nothing about are left out so callers keep their last status
+    ### Raises ValueError if qstat itself failed (e.g. PBS server unreachable), rather than reporting every job as finished
+
+    @staticmethod
+    def job_status_batch(job_ids):
+
+        job_ids = [str(int(job_id)) for job_id in job_ids]
+        statuses = {}
+
+        if not job_ids:
+            return statuses
+
+        ### qstat returns non-zero if any id is unknown, but still lists the ones it knows
+        p = Popen(['qstat', '-a'] + job_ids, stdout=PIPE, stderr=PIPE)
+        output, errors = p.communicate()
+
+        ### Ids qstat explicitly does not know (any more), every other stderr line is a qstat failure
+        gone, failures = set(), []
+        for line in str(errors, 'utf-8', errors='replace').splitlines():
+            match = re.search(r'Unknown Job Id\D*(\d+)', line) or re.search(r'(\d+)\S*\s+Job has finished', line)
+            if match is not None:
+                gone.add(match.group(1))
+            elif line.strip():
+                failures.append(line.strip())
+
+        for line in str(output,'utf-8').splitlines():
+            tokens = line.split()
+            if len(tokens) < 4:
+                continue
+            match = re.match(r'^(\d+)', tokens[0])
+            if match is None or match.group(1) not in job_ids:
+                continue
+
+            jobstatus = tokens[-3:]
+            status = jobstatus[1]
+
+            if status == 'R':
+                remaining = HPCScheduling.remaining_walltime(jobstatus)
+                t_wait = remaining if remaining is not None else 60
+            elif status == 'Q':
+                t_wait = 3600
+            else:
+                t_wait = 0
+
+            statuses[match.group(1)] = {'status': status, 't_wait': t_wait}
+
+        if failures or (p.returncode != 0 and not statuses and not gone):
+            raise ValueError(f"qstat failed with exit code {p.returncode}: {'; '.join(failures) or 'no job listed'}")
+
+        for job_id in gone & set(job_ids):
+            statuses.setdefault(job_id, {'status': 'F', 't_wait': 0})
+
+        ### Queue, time queued and estimated start of waiting jobs, read by the local poll policy
+        waiting = [job_id for job_id, value in statuses.items() if value['status'] in ('Q', 'H')]
+        for job_id, details in HPCScheduling.queue_details(waiting).items():
+            statuses[job_id].update(details)
+
+        return statuses
+
+    ### {job_id: {'queue', 'queued_for', 'start_in'}} from one qstat -f, times in seconds relative to now so clock offsets cancel
+    ### start_in is None when the scheduler has not estimated a start time for the job
+
+    @staticmethod
+    def queue_details(job_ids):
+
+        details = {}
+        if not job_ids:
+            return details
+
+        p = Popen(['qstat', '-f'] + [str(job_id) for job_id in job_ids], stdout=PIPE, stderr=PIPE)
+        output = p.communicate()[0]
+
+        now = datetime.datetime.now()
+        time_format = '%a %b %d %H:%M:%S %Y'
+
+        def seconds_from_now(value):
+            try:
+                return (datetime.datetime.strptime(' '.join(value.split()), time_format) - now).total_seconds()
+            except (ValueError, AttributeError):
+                return None
+
+        jobs, attrs, key = {}, None, None
+
+        for line in str(output, 'utf-8').splitlines():
+            match = re.match(r'^Job Id:\s*(\d+)', line)
+            if match is not None:
+                attrs = jobs.setdefault(match.group(1), {})
+                key = None
+            elif attrs is not None and line.startswith('\t') and key is not None:
+                ### Long values are wrapped onto tab indented lines
+                attrs[key] += line.strip()
+            elif attrs is not None and ' = ' in line:
+                key, value = line.strip().split(' = ', 1)
+                attrs[key] = value
+
+        for job_id, attrs in jobs.items():
+            queued_for = seconds_from_now(attrs.get('qtime'))
+            details[job_id] = {'queue': attrs.get('queue'),
+                               'queued_for': -queued_for if queued_for is not None else None,
+                               'start_in': seconds_from_now(attrs.get('estimated.start_time'))}
+
+        return details
+
     ### checking if the running job is diverging or not
     ### Author: Fuyue Liang
 
@@ -278,112 +547,47 @@ class HPCScheduling(ABC):
         chk_status = None
 
         ### Checking if the csv exists
-        if not os.path.exists(f'{self.run_name}.csv' if os.path.exists(f'{self.run_name}.csv') else f'HST_{self.run_name}.csv'):
+        csv_name = f'{self.run_name}.csv' if os.path.exists(f'{self.run_name}.csv') else f'HST_{self.run_name}.csv'
+        if not os.path.exists(csv_name):
             chk_status = 'FNF'
             return chk_status
         
-        csv_to_check = pd.read_csv(f'{self.run_name}.csv' if os.path.exists(f'{self.run_name}.csv') else f'HST_{self.run_name}.csv')
-        
-        # verify whether convergence checks can start
-        len_to_check = 400
-        recent = int(len_to_check * 0.95)
-
-        window_size = max(10,int(len_to_check * 0.05))
-        window_step = max(10, int(window_size * 0.5))
+        ### Criteria, thresholds and voting rule configurable per study through the 'convergence' pset entry
+        diagnostics = ConvergenceDiagnostics(self.pset_dict.get('convergence'))
 
-        recent_data = csv_to_check.iloc[-recent:]
-        relchg_thres = 0.1
-        grad_thres = 0.1
-        if len(csv_to_check) < len_to_check:
+        # verify whether convergence checks can start
+        len_to_check = diagnostics.len_to_check
+
+        ### Parsing only the rows appended since the previous check, state kept in the agent cache or a sidecar file
+        csv_path = os.path.join(ephemeral_path, csv_name)
+        reader = self.cache.get('csv_tail')
+        if reader is None or reader.csv_path != csv_path or reader.tail < len_to_check:
+            reader = CSVTailReader(csv_path, tail=len_to_check)
+            self.cache['csv_tail'] = reader
+        reader.update()
+        reader.save()
+
+        if reader.rows < len_to_check:
             # let the job run for longer, return NotReady NR status
             chk_status = 'NR'
             return chk_status
         
         else:
-            ### Time CFL ###
-            # check the CFL and time step: over half of time steps CFL < dt or CFL drop below a lower bound
-            lower_limit = csv_to_check['dt CFL'].nlargest(5).iloc[-1] * 1e-3
-            CFL_check = np.any(csv_to_check['dt CFL'] < lower_limit)
-
-            dt_CFL, dt = recent_data['dt CFL'].values, recent_data['dt'].values
-            dt_arr = dt_CFL - dt
-            bad_steps = 0
-            for item in dt_arr:
-                if item < 0:
-                    bad_steps += 1
-            bad_steps_percent = bad_steps / recent
-
-            dt_check = bad_steps_percent > 0.5
-            ts_check = CFL_check or dt_check
-
-            ### Divergence ###
-            moving_avg_div = recent_data['Max(div(V))'].rolling(window=window_size).mean()[::window_step].dropna().values
-            highest_order = np.log10(moving_avg_div).max()
-            div_check = False
-
-            if highest_order > -1:
-                relchg_div = np.diff(moving_avg_div) / moving_avg_div[:-1]
-                grad_div = np.gradient(moving_avg_div, 2)
-
-                stable_period_div = int(len(relchg_div) * 0.8)
-                stable_relchg_div = 0
-                stable_grad_div = 0
-
-                for rate in relchg_div:
-                    if rate < 0 or abs(rate) < relchg_thres:
-                        stable_relchg_div += 1
-                    else:
-                        stable_relchg_div = 0
-                for rate in grad_div:
-                    if rate < 0 or abs(rate) < grad_thres:
-                        stable_grad_div += 1
-                    else:
-                        stable_grad_div = 0
-                
-                div_check = stable_relchg_div < stable_period_div or stable_grad_div < stable_period_div
-            
-            ### Kinetic Energy ###
-            # check the KE: there is no relative change higher than the initial ones
-            moving_avg_ke = recent_data['Kinetic Energy'].rolling(window=window_size).mean()[::window_step].dropna().values
-            relchg_ke = np.diff(moving_avg_ke) / moving_avg_ke[:-1]
-            grad_ke = np.gradient(moving_avg_ke,2)
-
-            stable_period_ke = int(len(relchg_ke) * 0.9)
-            stable_relchg_ke = 0
-            stable_grad_ke = 0
-
-            for rate in relchg_ke:
-                if abs(rate) < relchg_thres:
-                    stable_relchg_ke += 1
-                else:
-                    stable_relchg_ke = 0
-            for rate in grad_ke:
-                if abs(rate) < grad_thres:
-                    stable_grad_ke += 1
-                else:
-                    stable_grad_ke = 0
-
-            ke_check = stable_relchg_ke < stable_period_ke or stable_grad_ke < stable_period_ke
-
             # check all the conditions
-            checks = {
-                'time step check':ts_check,
-                'divergence check':div_check,
-                'kinetic energy check':ke_check
-            }
+            checks = diagnostics.evaluate(reader.frame(), reader)
 
             ### Counting failed checks with True = 1 and False = 0
             failed_checks = sum(value for value in checks.values())
             ### Adding failed checks if value = True
             failed_keys = [key for key, value in checks.items() if value]
 
-            ### If 2/3 checks fail, raise a diverging D status
-            if failed_checks >=2:
+            ### If enough checks fail (2/3 by default), raise a diverging D status
+            if failed_checks >= diagnostics.fail_votes:
                 chk_status = 'D'
                 print(f'Job seems to be diverging or unstable since it does not pass {failed_checks} checks: {failed_keys}.')
             
             ### Else keep monitoring with converging status C, issuing warnings where appropiate
-            elif failed_checks == 1:
+            elif failed_checks >= 1:
                 chk_status = 'C'
                 print(f'WARNING: Check: {failed_keys} has failed to pass, job will continue')
 
@@ -393,7 +597,101 @@ class HPCScheduling(ABC):
                 
             return chk_status
 
+    ### Last cond_csv value if the finishing condition of condition_restart is already met, None otherwise
+    ### Read from the csv tail parsed by check_convergence, so no extra pass over the csv is made
+
+    def stop_condition_met(self):
+
+        reader = self.cache.get('csv_tail')
+        if reader is None:
+            return None
+
+        frame = reader.frame()
+        if frame.empty or self.cond_csv not in frame.columns:
+            return None
+
+        cond_value = float(frame[self.cond_csv].iloc[-1])
+        if operator_map[self.conditional](cond_value, float(self.cond_csv_limit)):
+            return None
+
+        return cond_value
+
+    ### Stopping a running job that already met its finishing condition, without waiting for it to end
+    ### early_stop: 'qdel' deletes the job, 'signal' writes stop_file in the ephemeral folder for BLUE to stop on its own,
+    ### deleting it at a later monitor call if it is still running stop_grace seconds after the stop file was written
+    ### The local side polls the job again after stop_poll seconds, the monitor call that finds it ended moves on to converting
+
+    def early_stop(self, job_id, cond_value, walltime_left):
+
+        mode = self.pset_dict.get('early_stop')
+        grace = float(self.pset_dict.get('stop_grace', 600))
+
+        marker = self.early_stop_marker(job_id)
+
+        print('-' * 100)
+
+        if marker is None:
+            print(f'Finishing condition met by job {job_id} of run {self.run_name}: {self.cond_csv} = {cond_value}')
+
+            if mode == 'signal':
+                open(self.stop_file_path(), 'w').close()
+                print(f'Stop file {self.stop_file_path()} written for job {job_id}')
+            else:
+                mode = 'qdel'
+                print(f'Deleting job {job_id}')
+                Popen(['qdel', f"{job_id}"]).wait()
+
+            marker = {'jobid': job_id, 'mode': mode, 'cond_csv': self.cond_csv, 'value': cond_value,
+                      'walltime_left': walltime_left, 'time': datetime.datetime.now().isoformat(timespec='seconds')}
+
+        elif (marker['mode'] == 'signal' and
+              (datetime.datetime.now() - datetime.datetime.fromisoformat(marker['time'])).total_seconds() >= grace):
+            print(f'Job {job_id} still running {grace/60} mins after its stop file was written, deleting it')
+            Popen(['qdel', f"{job_id}"]).wait()
+            marker['mode'] = 'qdel'
+
+        else:
+            print(f'Job {job_id} already stopped early by {marker["mode"]}, waiting for it to end')
+
+        print('-' * 100)
+
+        ### Marker read by condition_restart, the deleted job may end with a bad termination message in its .out
+        with open(self.early_stop_path(), 'w') as file:
+            json.dump(marker, file)
+
+        self.result.update(t_wait=float(self.pset_dict.get('stop_poll', 60)), data={'early_stop': marker})
+
+    def early_stop_path(self):
+        return os.path.join(self.path, f'early_stop_{self.run_name}.json')
+
+    def stop_file_path(self):
+        return os.path.join(self.ephemeral_path, self.pset_dict.get('stop_file', 'STOP'))
+
+    ### Early stop marker of job_id, None if the run has none or it belongs to another job
+
+    def early_stop_marker(self, job_id=None):
+
+        try:
+            with open(self.early_stop_path(), 'r') as file:
+                marker = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if job_id is not None and int(marker['jobid']) != int(job_id):
+            return None
+
+        return marker
+
+    ### Removing the marker and the stop file once the stopped job has been assessed, so neither outlives it
+    ### The stop file must not survive into a restarted job, which would stop as soon as it starts
+
+    def clear_early_stop(self):
+        for path in (self.early_stop_path(), self.stop_file_path()):
+            if os.path.exists(path):
+                os.remove(path)
+
     ### Function that performs multiple checks to decide if the simulation should restart
+    ### Returns the restart decision, restart number, messages and (error code, message) when a check kills the workflow
     ### Author: Paula Pico
 
     def condition_restart(self):
@@ -402,25 +700,28 @@ class HPCScheduling(ABC):
     
         # Check # 1: Does the .out file exist? If not raise exception and kill workflow --------------------------------------------------------------
         if not os.path.exists(self.output_file_path):
-            message = ['-' * 100,"====EXCEPTION====","FileNotFoundError",f'File {self.run_name}.out does not exist','-' * 100]
-            return False, new_restart_num, message
+            error = ('FileNotFoundError', f'File {self.run_name}.out does not exist')
+            message = ['-' * 100,error[1],'-' * 100]
+            return False, new_restart_num, message, error
+
+        ### Single backwards pass over the .out for the patterns of checks 2, 4 and 5, table configurable through 'out_patterns'
+        scanner = self.cache.get('out_scan')
+        if scanner is None:
+            scanner = OutScanner(self.output_file_path, patterns=self.pset_dict.get('out_patterns'))
+            self.cache['out_scan'] = scanner
+        out_matches = scanner.scan()
+        scanner.save()
+
+        ### A job stopped early may end with a bad termination message, the marker is used by this assessment only
+        stopped_early = self.early_stop_marker() is not None
+        self.clear_early_stop()
 
         # Check # 2: Did the simulation diverge or were the .rst files deleted? If so, raise exception and kill workflow -----------------------------
-        os.chdir(self.path)
-        line_with_pattern = None
-        
-        ### Checking last restart file instance in output file
-        with open(f"{self.run_name}.out", 'r') as file:
-            pattern = 'BAD TERMINATION OF ONE OF YOUR APPLICATION PROCESSES'
-            # Only read the last 50 lines of .out file
-            lines = file.readlines()[-50:]
-            for line in reversed(lines):
-                if pattern in line:
-                    line_with_pattern = line.strip()
-                    break
-            if line_with_pattern is not None:
-                message = ['-' * 100,"====EXCEPTION====","BadTerminationError",f'Simulation {self.run_name} diverged or .rst files deleted!','-' * 100]
-                return False, new_restart_num, message
+        # Only the last 50 lines of .out file
+        if out_matches['bad_termination'] is not None and not stopped_early:
+            error = ('BadTerminationError', f'Simulation {self.run_name} diverged or .rst files deleted!')
+            message = ['-' * 100,error[1],'-' * 100]
+            return False, new_restart_num, message, error
         
         # Check # 3: Has the finishing condition been satisfied? If so, raise exception and kill workflow  -----------------------------------------------
         os.chdir(self.ephemeral_path)
@@ -438,8 +739,8 @@ class HPCScheduling(ABC):
             comparison_func = operator_map[self.conditional]
 
             if not comparison_func(cond_val_last, float(self.cond_csv_limit)):
-                message = ['-' * 100,f"Simulation {self.run_name} reached completion, no restarts required","====RETURN_BOOL====","False",'-' * 100]
-                return False, new_restart_num, message
+                message = ['-' * 100,f"Simulation {self.run_name} reached completion, no restarts required",'-' * 100]
+                return False, new_restart_num, message, None
         else:
             print('-' * 100)
             print("WARNING: No *csv file found. Cannot check finishing condition. Simulation progress not calculated")
@@ -454,66 +755,50 @@ class HPCScheduling(ABC):
             )
 
         # Check # 4: Did the HPC kill the job due to lack of memory? If so, issue warning and continue -------------------------------------------------------
+        # Only the last 50 lines of .out file
+        if out_matches['killed_mem'] is not None:
+            message.append(
+                f"{'-' * 100}\n"
+                f"WARNING: \n"
+                f"Simulation {self.run_name} was killed due to lack of memory.\n"
+                f"Job will be re-submitted but please check.\n"
+                f"{'-' * 100}\n"
+            )
+        
+        # Check # 5: Has it created .rst files? If not raise exception and kill workflow. Are they new files? If not, issue warning and continue -------------------
         os.chdir(self.path)
-        line_with_pattern = None
         
-        ### Checking last restart file instance in output file
-        with open(f"{self.run_name}.out", 'r') as file:
-            pattern = 'PBS: job killed: mem'
-            # Only read the last 50 lines of .out file
-            lines = file.readlines()[-50:]
-            for line in reversed(lines):
-                if pattern in line:
-                    line_with_pattern = line.strip()
-                    break
-            if line_with_pattern is not None:
+        ### Last restart file instance in output file
+        line_with_pattern = out_matches['restart']
+        ### Extracting restart number from line
+        if line_with_pattern is None:
+            error = ('ValueError', f'Restart file pattern in .out not found for simulation {self.run_name}')
+            message = ['-' * 100,error[1],'-' * 100]
+            return False, new_restart_num, message, error
+        else:
+            ### searching with re a sequence of 1 or more digits '\d+' in between two word boundaries '\b'
+            match = re.search(r"\b\d+\b", line_with_pattern)
+            if match is None:
+               error = ('ValueError', f'No restart number match found in simulation {self.run_name}')
+               message = ['-' * 100,error[1],'-' * 100]
+               return False, new_restart_num, message, error
+            else:
+                new_restart_num = int(match.group())
+            with open(f"job_{self.run_name}.sh", 'r+') as file:
+                lines = file.readlines()
+                for line in reversed(lines):
+                    match = re.search(r'input_file_index=(\d+)', line)
+                    if match:
+                        old_restart_num = int(match.group(1))
+                        break
+            if new_restart_num == old_restart_num:
                 message.append(
                     f"{'-' * 100}\n"
                     f"WARNING: \n"
-                    f"Simulation {self.run_name} was killed due to lack of memory.\n"
+                    f"No new .rst files were created in the previous run.\n"
                     f"Job will be re-submitted but please check.\n"
                     f"{'-' * 100}\n"
                 )
-        
-        # Check # 5: Has it created .rst files? If not raise exception and kill workflow. Are they new files? If not, issue warning and continue -------------------
-        os.chdir(self.path)
-        line_with_pattern = None
-        
-        ### Checking last restart file instance in output file
-        with open(f"{self.run_name}.out", 'r') as file:
-            pattern = 'writing restart file'
-            lines = file.readlines()
-            for line in reversed(lines):
-                if pattern in line:
-                    line_with_pattern = line.strip()
-                    break
-            ### Extracting restart number from line
-            if line_with_pattern is None:
-                message = ['-' * 100,"====EXCEPTION====","ValueError",f'Restart file pattern in .out not found for simulation {self.run_name}','-' * 100]
-                return False, new_restart_num, message       
-            else:
-                ### searching with re a sequence of 1 or more digits '\d+' in between two word boundaries '\b'
-                match = re.search(r"\b\d+\b", line_with_pattern)
-                if match is None:
-                   message = ['-' * 100,"====EXCEPTION====","ValueError",f'No restart number match found in simulation {self.run_name}','-' * 100]
-                   return False, new_restart_num, message
-                else:
-                    new_restart_num = int(match.group())
-                with open(f"job_{self.run_name}.sh", 'r+') as file:
-                    lines = file.readlines()
-                    for line in reversed(lines):
-                        match = re.search(r'input_file_index=(\d+)', line)
-                        if match:
-                            old_restart_num = int(match.group(1))
-                            break
-                if new_restart_num == old_restart_num:
-                    message.append(
-                        f"{'-' * 100}\n"
-                        f"WARNING: \n"
-                        f"No new .rst files were created in the previous run.\n"
-                        f"Job will be re-submitted but please check.\n"
-                        f"{'-' * 100}\n"
-                    )
 
         message.append(
             f"{'-' * 100}\n"
@@ -524,7 +809,7 @@ class HPCScheduling(ABC):
         )
 
         # If all checks have been passed, then return True to restart the job
-        return True, new_restart_num, message
+        return True, new_restart_num, message, None
 
     ### Restarting sh based on termination condition eval and last output restart reached
     ### Authors: Juan Pablo Valdes, Paula Pico
@@ -533,11 +818,10 @@ class HPCScheduling(ABC):
 
         # Calling the checking function to see if the simulation can restart, verifying cond_csv key exists condition in csv file
         try:
-            ret_bool, new_restart_num, message = self.condition_restart()
+            ret_bool, new_restart_num, message, error = self.condition_restart()
         except KeyError as e:
             print(f'Exited with message: {e}')
-            print("====EXCEPTION====")
-            print("KeyError")
+            self.result.fail('KeyError', e)
             return False
 
         # If the output of the cheking function is True, being the restarting process
@@ -575,36 +859,33 @@ class HPCScheduling(ABC):
             ### check status and waiting time for re-submitted job
             try:
                 t_jobwait, status, new_jobID = self.job_wait(job_IDS)
-                print("====JOB_IDS====")
-                print(new_jobID)
-                print("====JOB_STATUS====")
-                print(status)
-                print("====WAIT_TIME====")
-                print(t_jobwait)
-                print("====RETURN_BOOL====")
-                print("True")
+                self.result.update(jobid=new_jobID, status=status, t_wait=t_jobwait, ret_bool=True)
                 return True
-            except HPCScheduling.JobStatError:
+            except HPCScheduling.JobStatError as e:
                 print(f'Restart job {self.run_ID} failed on initial re-submission')
-                print("====EXCEPTION====")
-                print("JobStatError")
-            except ValueError:
-                print("====EXCEPTION====")
-                print("ValueError")
+                self.result.fail('JobStatError', e)
+            except ValueError as e:
+                self.result.fail('ValueError', e)
             
         else:
             print('-' * 100)
             for line in message:
                 print(line)
+            if error is not None:
+                self.result.fail(*error)
+            else:
+                self.result.update(ret_bool=False)
             return False
 
-    ### submitting the SMX job and recording job_id
+    ### submitting the SMX job and recording job_id, held by PBS until job depend ends if given
+    ### after: PBS dependency type, 'afterok' (depend ended successfully) or 'afterany' (depend ended in any way)
     @staticmethod
-    def submit_job(path,name):
+    def submit_job(path,name,depend=None,after='afterok'):
 
         proc = []
         os.chdir(f'{path}')
-        proc = Popen(['qsub', f"job_{name}.sh"], stdout=PIPE)
+        depend_args = ['-W', f'depend={after}:{depend}'] if depend is not None else []
+        proc = Popen(['qsub'] + depend_args + [f"job_{name}.sh"], stdout=PIPE)
 
         output = proc.communicate()[0].decode('utf-8').split()
 
@@ -613,6 +894,129 @@ class HPCScheduling(ABC):
 
         return jobid
 
+    ### PBS chain state of the run: stage ('running', 'converting', 'failed'), job ids, restarts and error
+
+    def chain_file(self):
+        return os.path.join(self.path, f'chain_{self.run_name}.json')
+
+    def read_chain(self):
+        try:
+            with open(self.chain_file(), 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    ### Updating the chain state atomically, the local side may read it at any time through chain_status
+
+    def write_chain(self, **fields):
+        chain = self.read_chain() or {}
+        chain.update(fields)
+        tmp_path = self.chain_file() + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(chain, file)
+        os.replace(tmp_path, self.chain_file())
+        return chain
+
+    ### Rendering and submitting the restart-check job of a simulation job, started by PBS whenever that job ends
+
+    def submit_chain(self, sim_jobid):
+
+        pdict_file = f'chain_{self.run_name}_pdict.json'
+        with open(os.path.join(self.path, pdict_file), 'w') as file:
+            json.dump(self.pset_dict, file)
+
+        placeholders = {'job_name': f'Chain_{self.run_name}', 'pdict_file': pdict_file,
+                        'python_exe': sys.executable, 'hpc_script': os.path.abspath(__file__),
+                        'study': self.pset_dict['study_ID'],
+                        'mem': self.pset_dict.get('chain_mem', 4), 'walltime': self.pset_dict.get('chain_walltime', '00:30:00')}
+
+        with open(os.path.join(self.path, 'job_chain.sh'), 'w') as file:
+            file.write(substitute(CHAIN_JOB, placeholders))
+
+        chain_jobid = self.submit_job(self.path, 'chain', depend=sim_jobid, after='afterany')
+
+        print('-' * 100)
+        print(f'Restart check job {chain_jobid} chained after job {sim_jobid} of run {self.run_name}')
+
+        return chain_jobid
+
+    ### Moving the pending restart check onto a resubmitted simulation job, so the deleted one does not trigger it
+
+    def replace_chain(self, old_jobid, new_jobid):
+
+        chain = self.read_chain()
+        if chain is None or chain.get('stage') != 'running' or int(chain['sim_jobid']) != int(old_jobid):
+            return
+
+        Popen(['qdel', f"{chain['chain_jobid']}"])
+        self.write_chain(sim_jobid=new_jobid, chain_jobid=self.submit_chain(new_jobid))
+
+    ### Cancelling the pending restart check, e.g. when the simulation job was deleted after failing its convergence checks
+
+    def stop_chain(self, code, message):
+
+        chain = self.read_chain()
+        if chain is None or chain.get('stage') != 'running':
+            return
+
+        Popen(['qdel', f"{chain['chain_jobid']}"])
+        self.write_chain(stage='failed', error={'code': code, 'message': message})
+        print(f"Restart check job {chain['chain_jobid']} deleted")
+
+    ### Restart-check job body: the restart decision of job_restart, then the next simulation job and its check or the convert job
+
+    def chain_step(self):
+
+        print('-' * 100)
+        print(f'PBS CHAIN STEP FOR RUN {self.run_name}')
+        print('-' * 100)
+
+        chain = self.read_chain() or {}
+        if chain.get('stage') == 'failed':
+            print('Chain stopped earlier, nothing to do')
+            return
+
+        restart = self.job_restart()
+
+        if self.result.error is not None:
+            self.write_chain(stage='failed', error=self.result.error)
+            return
+
+        if restart:
+            sim_jobid = self.result.fields['jobid']
+            chain_jobid = self.submit_chain(sim_jobid)
+            self.write_chain(stage='running', sim_jobid=sim_jobid, chain_jobid=chain_jobid,
+                             restarts=chain.get('restarts', 0) + 1)
+            return
+
+        ### Finishing condition met: converting straight away, vtk_convert also chains the reduce job if requested
+        self.vtk_convert()
+
+        if self.result.error is not None:
+            self.write_chain(stage='failed', error=self.result.error)
+        else:
+            self.write_chain(stage='converting', convert_jobid=self.result.fields['jobid'],
+                             reduce_jobid=(self.result.fields['data'] or {}).get('reduce_jobid'))
+
+    ### Chain state for the local side, with the queue status of the pending restart check ('F' once it has ended)
+
+    def chain_status(self):
+
+        chain = self.read_chain()
+        if chain is None:
+            self.result.fail('FileNotFoundError', f'No PBS chain state found for run {self.run_name}')
+            return
+
+        chain['chain_status'] = 'F'
+        if chain['stage'] == 'running':
+            try:
+                t_jobwait, chain['chain_status'], _ = self.job_wait(int(chain['chain_jobid']), resubmit_held=False)
+                self.result.update(t_wait=t_jobwait)
+            except HPCScheduling.JobStatError:
+                pass
+
+        self.result.update(status=chain['chain_status'], data=chain)
+
     ### clean previous rst file from ephemeral
     def rst_cleaning(self,cleanrst=True, saverstnum=1):
         os.chdir(self.ephemeral_path)
@@ -645,6 +1049,12 @@ class HPCScheduling(ABC):
 ########################################################################################### CHILD CLASS ############################################################################
 
 class SMHPCScheduling(HPCScheduling):
+
+    template_placeholders = {**HPCScheduling.template_placeholders,
+                             'base_SMX.f90': ('pipe_radius', 'smx_pos', 'bar_width', 'bar_thickness', 'bar_angle', 'n_bars', 'flowrate',
+                                              'd_per_level', 'n_levels', 'd_radius', 'n_elements'),
+                             'job_base.sh': ('box2', 'box4', 'box6', 'x_subd', 'y_subd', 'z_subd', 'n_cpus', 'n_nodes', 'mem',
+                                             'cell1', 'cell2', 'cell3', 'diff1', 'diff2', 'ka', 'kd', 'ginf', 'gini', 'diffs', 'beta')}
     
     def __init__(self,pset_dict) -> None:
                 
@@ -690,60 +1100,51 @@ class SMHPCScheduling(HPCScheduling):
 
         ## Create run_ID directory
         os.mkdir(self.path)
-        base_path = self.pset_dict['base_path']
-        base_case_dir = os.path.join(base_path, self.case_type)
+        templates = self.base_templates()
 
-        ## Copy base files and rename to current run accordingly
-        os.system(f'cp -r {base_case_dir}/* {self.path}')
-        os.system(f'mv {self.path}/base_SMX.f90 {self.path}/{self.run_name}_SMX.f90')
-        print('-' * 100)
-        print(f'Run directory {self.path} created and base files copied')
+        ## Link base files not needing placeholders, the f90, Makefile and job.sh are rendered and written once each
+        self.link_base(templates, exclude=['base_SMX.f90', 'Makefile', 'job_base.sh', 'job_reduce.sh'])
+
+        placeholders = {}
 
         if self.case_type == 'geom' or self.case_type == 'sp_geom':
 
             ## Assign values to placeholders
-            os.system(f'sed -i \"s/\'pipe_radius\'/{self.pipe_radius}/\" {self.path}/{self.run_name}_SMX.f90')
-            os.system(f'sed -i \"s/\'smx_pos\'/{self.smx_pos}/\" {self.path}/{self.run_name}_SMX.f90')
-            os.system(f'sed -i \"s/\'bar_width\'/{self.bar_width}/g\" {self.path}/{self.run_name}_SMX.f90')
-            os.system(f'sed -i \"s/\'bar_thickness\'/{self.bar_thickness}/\" {self.path}/{self.run_name}_SMX.f90')
-            os.system(f'sed -i \"s/\'bar_angle\'/{self.bar_angle}/\" {self.path}/{self.run_name}_SMX.f90')
-            os.system(f'sed -i \"s/\'n_bars\'/{self.n_bars}/\" {self.path}/{self.run_name}_SMX.f90')
-            os.system(f'sed -i \"s/\'flowrate\'/{self.flowrate}/\" {self.path}/{self.run_name}_SMX.f90')
+            placeholders = {'pipe_radius': self.pipe_radius,
+                            'smx_pos': self.smx_pos,
+                            'bar_width': self.bar_width,
+                            'bar_thickness': self.bar_thickness,
+                            'bar_angle': self.bar_angle,
+                            'n_bars': self.n_bars,
+                            'flowrate': self.flowrate}
 
             if self.case_type == 'geom':
-                os.system(f'sed -i \"s/\'d_per_level\'/{self.d_per_level}/\" {self.path}/{self.run_name}_SMX.f90')
-                os.system(f'sed -i \"s/\'n_levels\'/{self.n_levels}/\" {self.path}/{self.run_name}_SMX.f90')
-                os.system(f'sed -i \"s/\'d_radius\'/{self.d_radius}/\" {self.path}/{self.run_name}_SMX.f90')
+                placeholders.update({'d_per_level': self.d_per_level,
+                                     'n_levels': self.n_levels,
+                                     'd_radius': self.d_radius})
 
             else:
-                os.system(f'sed -i \"s/\'n_elements\'/{self.n_ele}/\" {self.path}/{self.run_name}_SMX.f90')
+                placeholders['n_elements'] = self.n_ele
 
-            os.system(f'sed -i \"s/\'flowrate\'/{self.flowrate}/\" {self.path}/{self.run_name}_SMX.f90')
+        self.write_template('base_SMX.f90', os.path.join(self.path, f'{self.run_name}_SMX.f90'), placeholders)
+
+        if placeholders:
             print('-' * 100)
             print(f'Placeholders for geometry specs in {self.run_name}_SMX.f90 modified correctly')
         
         #modify the Makefile
 
-        os.system(f'sed -i s/file/{self.run_name}_SMX/g {self.path}/Makefile')
+        self.write_template('Makefile', os.path.join(self.path, 'Makefile'), words={'file': f'{self.run_name}_SMX'})
 
         #compile the f90 into an executable
 
-        os.chdir(self.path)
-        subprocess.run('make',shell=True, capture_output=True, text=True, check=True)
-        print('-' * 100)
-        print('Makefile created succesfully')
-        os.system(f'mv {self.run_name}_SMX.x {self.run_name}.x')
-        subprocess.run('make cleanall',shell=True, capture_output=True, text=True, check=True)
-        os.chdir('..')
+        self.compile_f90(f'{self.run_name}_SMX')
 
     ### modifying .sh instance accordingly
     def setjobsh(self):
-        
-        ## rename job with current run
-        os.system(f'mv {self.path}/job_base.sh {self.path}/job_{self.run_name}.sh')
 
-        ## Assign values to placeholders
-        os.system(f'sed -i \"s/RUN_NAME/{self.run_name}/g\" {self.path}/job_{self.run_name}.sh')
+        ## placeholder values collected here and rendered into job_{run_name}.sh in one write
+        placeholders = {}
 
         ### If geometry variations are studied, construct domain and mesh specifications in job.sh accordingly
         if self.case_type == 'geom' or self.case_type == 'sp_geom':
@@ -769,9 +1170,7 @@ class SMHPCScheduling(HPCScheduling):
             box_4 = math.ceil(2*radius*1000)/1000
             box_6 = math.ceil(2*radius*1000)/1000
 
-            os.system(f'sed -i \"s/\'box2\'/{box_2}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'box4\'/{box_4}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'box6\'/{box_6}/\" {self.path}/job_{self.run_name}.sh')
+            placeholders.update({'box2': box_2, 'box4': box_4, 'box6': box_6})
 
             ### High and low cell number cases
             yz_cpus_l = (min_res*d_pipe)/64
@@ -918,34 +1317,22 @@ class SMHPCScheduling(HPCScheduling):
                     n_nodes = 1
 
             ### Replacing placeholders in job.sh file after resolution calculations
-            os.system(f'sed -i \"s/\'x_subd\'/{xsub}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'y_subd\'/{ysub}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'z_subd\'/{zsub}/\" {self.path}/job_{self.run_name}.sh')
-
-            os.system(f'sed -i \"s/\'n_cpus\'/{ncpus}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'n_nodes\'/{n_nodes}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'mem\'/{mem}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'cell1\'/{cell1}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'cell2\'/{cell2}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'cell3\'/{cell3}/\" {self.path}/job_{self.run_name}.sh')
-
-            print('-' * 100)
-            print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
+            placeholders.update({'x_subd': xsub, 'y_subd': ysub, 'z_subd': zsub,
+                                 'n_cpus': ncpus, 'n_nodes': n_nodes, 'mem': mem,
+                                 'cell1': cell1, 'cell2': cell2, 'cell3': cell3})
 
         elif self.case_type == 'surf':
 
             ### Replacing placeholders for surfactant parametric study with fixed geometry
-            os.system(f'sed -i \"s/\'diff1\'/{self.diff1}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'diff2\'/{self.diff2}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'ka\'/{self.ka}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'kd\'/{self.kd}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'ginf\'/{self.ginf}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'gini\'/{self.gini}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'diffs\'/{self.diffs}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'beta\'/{self.beta}/\" {self.path}/job_{self.run_name}.sh')
+            placeholders.update({'diff1': self.diff1, 'diff2': self.diff2, 'ka': self.ka, 'kd': self.kd,
+                                 'ginf': self.ginf, 'gini': self.gini, 'diffs': self.diffs, 'beta': self.beta})
 
-            print('-' * 100)
-            print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
+        ## rename job with current run and assign values to placeholders
+        self.write_template('job_base.sh', os.path.join(self.path, f'job_{self.run_name}.sh'),
+                            placeholders, words={'RUN_NAME': self.run_name})
+
+        print('-' * 100)
+        print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
 
     ### Converting vtk to vtr
     def vtk_convert(self):
@@ -988,21 +1375,17 @@ class SMHPCScheduling(HPCScheduling):
                 try:
                     shutil.move(file,'RESULTS')
                 except (FileNotFoundError, shutil.Error) as e:
-                    print('-' * 100)
-                    print("====EXCEPTION====")
-                    print("FileNotFoundError")
                     print('-' * 100)
                     print(f"Exited with message :{e}, File or directory not found.")
                     print('-' * 100)
+                    self.result.fail('FileNotFoundError', f"Exited with message :{e}, File or directory not found.")
                     return
         ### If files don't exist, exit function and terminate pipeline
         else:
-            print('-' * 100)
-            print("====EXCEPTION====")
-            print("FileNotFoundError")
             print('-' * 100)
             print("Either ISO or VAR files don't exist.")
             print('-' * 100)
+            self.result.fail('FileNotFoundError', "Either ISO or VAR files don't exist.")
             return
 
         print('-' * 100)
@@ -1023,12 +1406,10 @@ class SMHPCScheduling(HPCScheduling):
             print('-' * 100)
             print('VAR, ISO and csv files moved to RESULTS')
         except (FileNotFoundError, shutil.Error) as e:
-            print('-' * 100)
-            print("====EXCEPTION====")
-            print("FileNotFoundError")
             print('-' * 100)
             print(f"Exited with message :{e}, File or directory not found.")
             print('-' * 100)
+            self.result.fail('FileNotFoundError', f"Exited with message :{e}, File or directory not found.")
             return
 
         ### Cleaning previous restart from ephemeral
@@ -1048,41 +1429,38 @@ class SMHPCScheduling(HPCScheduling):
             try:
                 shutil.copy2(file, '.')
             except (FileNotFoundError, PermissionError, OSError):
-                print("====EXCEPTION====")
-                print("FileNotFoundError")
                 print(f"Failed to copy '{file}'.")
+                self.result.fail('FileNotFoundError', f"Failed to copy '{file}'.")
                 return
 
-        os.system(f'sed -i \"s/\'FILECOUNT\'/{file_count}/\" Multithread_pool.py')
+        render_in_place('Multithread_pool.py', {'FILECOUNT': file_count})
 
         ### Submitting job convert and extracting job_id, wait time and status
         jobid = self.submit_job(os.path.join(ephemeral_path,'RESULTS'),'convert')
 
         print('-' * 100)
         print(f'JOB CONVERT from {self.run_name} submitted succesfully with ID {jobid}')
+
+        ### On-HPC reduction of the single phase metrics, held by PBS until the convert job ends successfully
+        if self.pset_dict.get('remote_reduce') and self.case_type in REDUCERS:
+            reduce_jobid = self.submit_reduce(os.path.join(ephemeral_path,'RESULTS'), jobid)
+            self.result.update(data={'reduce_jobid': reduce_jobid})
+
         sleep(60)
 
         try:
             t_jobwait, status, new_jobID = self.job_wait(jobid)
-            print("====JOB_IDS====")
-            print(new_jobID)
-            print("====JOB_STATUS====")
-            print(status)
-            if status == 'Q' or status == 'H':
-                print("====WAIT_TIME====")
-                print(t_jobwait-1800)
-            elif status == 'R':
-                print("====WAIT_TIME====")
-                print(t_jobwait)
+            ### Queued or held: job_wait already bounds the wait by the PBS estimated start
+            if status not in ('Q', 'H', 'R'):
+                t_jobwait = 0
+            self.result.update(jobid=new_jobID, status=status, t_wait=t_jobwait)
 
-        except HPCScheduling.JobStatError:
+        except HPCScheduling.JobStatError as e:
             print(f'Convert job {self.run_ID} failed on initial submission')
-            print("====EXCEPTION====")
-            print("JobStatError")
+            self.result.fail('JobStatError', e)
 
-        except ValueError:
-            print("====EXCEPTION====")
-            print("ValueError")
+        except ValueError as e:
+            self.result.fail('ValueError', e)
 
 #####################################################################################################################################################################################
 
@@ -1096,6 +1474,10 @@ class SMHPCScheduling(HPCScheduling):
 
 class SVHPCScheduling(HPCScheduling):
 
+    template_placeholders = {**HPCScheduling.template_placeholders,
+                             'base_SV.f90': ('impeller_d', 'frequency', 'clearance', 'blade_width', 'blade_thick', 'nblades', 'inclination'),
+                             'job_base.sh': ('output_interval', 'diff1', 'diff2', 'ka', 'kd', 'ginf', 'gini', 'diffs', 'beta')}
+
     ### Init function
     def __init__(self,pset_dict):
                 
@@ -1131,67 +1513,53 @@ class SVHPCScheduling(HPCScheduling):
     def makef90(self):
         ### create run_ID directory ###
         os.mkdir(self.path)
-        base_path = self.pset_dict['base_path']
-        base_case_dir = os.path.join(base_path, self.case_type)
+        templates = self.base_templates()
 
-        ### Copy base files and rename to current run accordingly ###
-        os.system(f'cp -r {base_case_dir}/* {self.path}')
-        os.system(f'mv {self.path}/base_SV.f90 {self.path}/{self.run_name}_SV.f90')
-        print('-' * 100)
-        print(f'Run directory {self.path} created and base files copied')
+        ### Link base files not needing placeholders, f90, Makefile and job.sh are rendered and written once each ###
+        self.link_base(templates, exclude=['base_SV.f90', 'Makefile', 'job_base.sh', 'job_reduce.sh'])
+
+        placeholders = {}
 
         if self.case_type == 'svgeom' or self.case_type == 'sp_svgeom':
             ### Assign values to placeholders ###
-            os.system(f'sed -i \"s/\'impeller_d\'/{self.impeller_d}/\" {self.path}/{self.run_name}_SV.f90')
-            os.system(f'sed -i \"s/\'frequency\'/{self.frequency}/\" {self.path}/{self.run_name}_SV.f90')
-            os.system(f'sed -i \"s/\'clearance\'/{self.clearance}/\" {self.path}/{self.run_name}_SV.f90')
-            os.system(f'sed -i \"s/\'blade_width\'/{self.blade_width}/\" {self.path}/{self.run_name}_SV.f90')
-            os.system(f'sed -i \"s/\'blade_thick\'/{self.blade_thick}/\" {self.path}/{self.run_name}_SV.f90')
-            os.system(f'sed -i \"s/\'nblades\'/{self.nblades}/\" {self.path}/{self.run_name}_SV.f90')
-            os.system(f'sed -i \"s/\'inclination\'/{self.inclination}/\" {self.path}/{self.run_name}_SV.f90')
+            placeholders = {'impeller_d': self.impeller_d,
+                            'frequency': self.frequency,
+                            'clearance': self.clearance,
+                            'blade_width': self.blade_width,
+                            'blade_thick': self.blade_thick,
+                            'nblades': self.nblades,
+                            'inclination': self.inclination}
+
+        self.write_template('base_SV.f90', os.path.join(self.path, f'{self.run_name}_SV.f90'), placeholders)
 
         ### modify the Makefile ###
-        os.system(f'sed -i s/file/{self.run_name}_SV/g {self.path}/Makefile')
+        self.write_template('Makefile', os.path.join(self.path, 'Makefile'), words={'file': f'{self.run_name}_SV'})
 
         ### compile the f90 into an executable ###
-        os.chdir(self.path)
-        subprocess.run('make',shell=True, capture_output=True, text=True, check=True)
-        print('-' * 100)
-        print('Makefile created succesfully')
-        os.system(f'mv {self.run_name}_SV.x {self.run_name}.x')
-        subprocess.run('make cleanall',shell=True, capture_output=True, text=True, check=True)
-        os.chdir('..')
+        self.compile_f90(f'{self.run_name}_SV')
 
     ### modifying .sh instance accordingly
         
     def setjobsh(self):
-        ### rename job with current run ###
-        os.system(f'mv {self.path}/job_base.sh {self.path}/job_{self.run_name}.sh')
-
-        ### assign values to placeholders
-        os.system(f'sed -i \"s/RUN_NAME/{self.run_name}/g\" {self.path}/job_{self.run_name}.sh')
+        ### placeholder values collected here and rendered into job_{run_name}.sh in one write ###
+        placeholders = {}
         
         ### replace placeholders for surfactant parametric study with fixed geometry ###
         if self.case_type == 'svsurf':
-            os.system(f'sed -i \"s/\'diff1\'/{self.diff1}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'diff2\'/{self.diff2}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'ka\'/{self.ka}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'kd\'/{self.kd}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'ginf\'/{self.ginf}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'gini\'/{self.gini}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'diffs\'/{self.diffs}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'beta\'/{self.beta}/\" {self.path}/job_{self.run_name}.sh')
-
-            print('-' * 100)
-            print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
+            placeholders.update({'diff1': self.diff1, 'diff2': self.diff2, 'ka': self.ka, 'kd': self.kd,
+                                 'ginf': self.ginf, 'gini': self.gini, 'diffs': self.diffs, 'beta': self.beta})
 
         ### replace placeholders for output time interval for geometry parametric study ###
         else:
             opt = 1/32/float(self.frequency)
-            os.system(f'sed -i \"s/\'output_interval\'/{opt}/\" {self.path}/job_{self.run_name}.sh')
+            placeholders['output_interval'] = opt
 
-            print('-' * 100)
-            print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
+        ### rename job with current run and assign values to placeholders ###
+        self.write_template('job_base.sh', os.path.join(self.path, f'job_{self.run_name}.sh'),
+                            placeholders, words={'RUN_NAME': self.run_name})
+
+        print('-' * 100)
+        print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
 
     ### Convert last vtk to vtr
             
@@ -1248,23 +1616,19 @@ class SVHPCScheduling(HPCScheduling):
                 try:
                     shutil.move(file, 'RESULTS')
                 except (FileNotFoundError, shutil.Error) as e:
-                    print('-' * 100)
-                    print("====EXCEPTION====")
-                    print("FileNotFoundError")
                     print('-' * 100)
                     print(f"Exited with message :{e}, File or directory not found.")
                     print('-' * 100)
+                    self.result.fail('FileNotFoundError', f"Exited with message :{e}, File or directory not found.")
                     return
             print('-' * 100)
             print('Convert files (320-720) copied to RESULTS')
         ### If files don't exit, exit function and terminate pipeline ###
         else:
-            print('-' * 100)
-            print("====EXCEPTION====")
-            print("FileNotFoundError")
             print('-' * 100)
             print("VAR files don't exist.")
             print('-' * 100)
+            self.result.fail('FileNotFoundError', "VAR files don't exist.")
             return
 
         ### Moving individual files of interest: pvd, csv
@@ -1288,12 +1652,10 @@ class SVHPCScheduling(HPCScheduling):
             print('-' * 100)
             print('VAR and csv files moved to RESULTS')
         except (FileNotFoundError, shutil.Error) as e:
-            print('-' * 100)
-            print("====EXCEPTION====")
-            print("FileNotFoundError")
             print('-' * 100)
             print(f"Exited with message :{e}, File or directory not found.")
             print('-' * 100)
+            self.result.fail('FileNotFoundError', f"Exited with message :{e}, File or directory not found.")
             return
         
         ### Cleaning previous restart and vtk from ephemeral
@@ -1313,41 +1675,38 @@ class SVHPCScheduling(HPCScheduling):
             try:
                 shutil.copy2(file, '.')
             except (FileNotFoundError, PermissionError, OSError):
-                print("====EXCEPTION====")
-                print("FileNotFoundError")
                 print(f"Failed to copy '{file}'.")
+                self.result.fail('FileNotFoundError', f"Failed to copy '{file}'.")
                 return
 
-        os.system(f'sed -i \"s/\'FILECOUNT\'/{file_count}/\" Multithread_pool.py')
+        render_in_place('Multithread_pool.py', {'FILECOUNT': file_count})
 
         ### Submitting job convert and extracting job_id, wait time and status
         jobid = self.submit_job(os.path.join(ephemeral_path,'RESULTS'),'convert')
 
         print('-' * 100)
         print(f'JOB CONVERT from {self.run_name} submitted succesfully with ID {jobid}')
+
+        ### On-HPC reduction of the single phase metrics, held by PBS until the convert job ends successfully
+        if self.pset_dict.get('remote_reduce') and self.case_type in REDUCERS:
+            reduce_jobid = self.submit_reduce(os.path.join(ephemeral_path,'RESULTS'), jobid)
+            self.result.update(data={'reduce_jobid': reduce_jobid})
+
         sleep(60)
 
         try:
             t_jobwait, status, new_jobID = self.job_wait(jobid)
-            print("====JOB_IDS====")
-            print(new_jobID)
-            print("====JOB_STATUS====")
-            print(status)
-            if status == 'Q' or status == 'H':
-                print("====WAIT_TIME====")
-                print(t_jobwait-1800)
-            elif status == 'R':
-                print("====WAIT_TIME====")
-                print(t_jobwait)
+            ### Queued or held: job_wait already bounds the wait by the PBS estimated start
+            if status not in ('Q', 'H', 'R'):
+                t_jobwait = 0
+            self.result.update(jobid=new_jobID, status=status, t_wait=t_jobwait)
 
-        except HPCScheduling.JobStatError:
+        except HPCScheduling.JobStatError as e:
             print(f'Convert job {self.run_ID} failed on initial submission')
-            print("====EXCEPTION====")
-            print("JobStatError")
+            self.result.fail('JobStatError', e)
 
-        except ValueError:
-            print("====EXCEPTION====")
-            print("ValueError")
+        except ValueError as e:
+            self.result.fail('ValueError', e)
 
 #####################################################################################################################################################################################
 
@@ -1361,6 +1720,10 @@ class SVHPCScheduling(HPCScheduling):
 
 class IOHPCScheduling(HPCScheduling):
 
+    template_placeholders = {**HPCScheduling.template_placeholders,
+                             'int_osc_full.f90': ('epsilon_val', 'wave_num_val'),
+                             'job_base_osc_clean.sh': ('sigma_s_val', 'rho_g_val', 'rho_l_val', 'mu_g_val', 'mu_l_val', 'grav_val', 'delta_t_sn_val')}
+
     ### Init function
     def __init__(self,pset_dict):
 
@@ -1384,52 +1747,46 @@ class IOHPCScheduling(HPCScheduling):
     def makef90(self):
         ### create run_ID directory ###
         os.mkdir(self.path)
-        base_path = self.pset_dict['base_path']
-        base_case_dir = os.path.join(base_path, self.case_type)
+        templates = self.base_templates()
 
-        ### Copy base files and rename to current run accordingly ###
-        os.system(f'cp -r {base_case_dir}/* {self.path}')
-        os.system(f'mv {self.path}/int_osc_full.f90 {self.path}/{self.run_name}_IO.f90')
-        print('-' * 100)
-        print(f'Run directory {self.path} created and base files copied')
+        ### Link base files not needing placeholders, f90, Makefile and job.sh are rendered and written once each ###
+        self.link_base(templates, exclude=['int_osc_full.f90', 'Makefile', 'job_base_osc_clean.sh'])
+
+        placeholders = {}
 
         if self.case_type == 'osc_clean':
             ### Assign values to placeholders ###
-            os.system(f'sed -i \"s/\'epsilon_val\'/{self.epsilon}/\" {self.path}/{self.run_name}_IO.f90')
-            os.system(f'sed -i \"s/\'wave_num_val\'/{self.k}/\" {self.path}/{self.run_name}_IO.f90')
+            placeholders = {'epsilon_val': self.epsilon, 'wave_num_val': self.k}
+
+        self.write_template('int_osc_full.f90', os.path.join(self.path, f'{self.run_name}_IO.f90'), placeholders)
 
         ### modify the Makefile ###
-        os.system(f'sed -i s/file/{self.run_name}_IO/g {self.path}/Makefile')
+        self.write_template('Makefile', os.path.join(self.path, 'Makefile'), words={'file': f'{self.run_name}_IO'})
 
         ### compile the f90 into an executable ###
-        os.chdir(self.path)
-        subprocess.run('make',shell=True, capture_output=True, text=True, check=True)
-        print('-' * 100)
-        print('Makefile created succesfully')
-        os.system(f'mv {self.run_name}_IO.x {self.run_name}.x')
-        subprocess.run('make cleanall',shell=True, capture_output=True, text=True, check=True)
-        os.chdir('..')
+        self.compile_f90(f'{self.run_name}_IO')
 
     ### modifying .sh instance accordingly
     def setjobsh(self):
-        ### rename job with current run ###
-        os.system(f'mv {self.path}/job_base_osc_clean.sh {self.path}/job_{self.run_name}.sh')
-
-        ### assign values to placeholders
-        os.system(f'sed -i \"s/RUN_NAME/{self.run_name}/g\" {self.path}/job_{self.run_name}.sh')
+        ### placeholder values collected here and rendered into job_{run_name}.sh in one write ###
+        placeholders = {}
         
         ### replace placeholders for surfactant parametric study with fixed geometry ###
         if self.case_type == 'osc_clean':
-            os.system(f'sed -i \"s/\'sigma_s_val\'/{self.sigma_s}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'rho_g_val\'/{self.rho_g}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'rho_l_val\'/{self.rho_l}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'mu_g_val\'/{self.mu_g}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'mu_l_val\'/{self.mu_l}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'grav_val\'/{self.gravity}/\" {self.path}/job_{self.run_name}.sh')
-            os.system(f'sed -i \"s/\'delta_t_sn_val\'/{self.delta_t_sn}/\" {self.path}/job_{self.run_name}.sh')
+            placeholders = {'sigma_s_val': self.sigma_s,
+                            'rho_g_val': self.rho_g,
+                            'rho_l_val': self.rho_l,
+                            'mu_g_val': self.mu_g,
+                            'mu_l_val': self.mu_l,
+                            'grav_val': self.gravity,
+                            'delta_t_sn_val': self.delta_t_sn}
+
+        ### rename job with current run and assign values to placeholders ###
+        self.write_template('job_base_osc_clean.sh', os.path.join(self.path, f'job_{self.run_name}.sh'),
+                            placeholders, words={'RUN_NAME': self.run_name})
 
-            print('-' * 100)
-            print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
+        print('-' * 100)
+        print(f'Placeholders replaced succesfully in job.sh for run:{self.run_ID}')
     
     ### Convert all vtks at the end of simulation ###
     def vtk_convert(self):
@@ -1458,22 +1815,18 @@ class IOHPCScheduling(HPCScheduling):
                 try:
                     shutil.move(file, 'RESULTS')
                 except (FileNotFoundError, shutil.Error) as e:
-                    print('-' * 100)
-                    print("====EXCEPTION====")
-                    print("FileNotFoundError")
                     print('-' * 100)
                     print(f"Exited with message :{e}, File or directory not found.")
                     print('-' * 100)
+                    self.result.fail('FileNotFoundError', f"Exited with message :{e}, File or directory not found.")
                     return
             print('-' * 100)
         ### If files don't exit, exit function and terminate pipeline ###
         else:
-            print('-' * 100)
-            print("====EXCEPTION====")
-            print("FileNotFoundError")
             print('-' * 100)
             print("Either ISO or VAR files don't exist.")
             print('-' * 100)
+            self.result.fail('FileNotFoundError', "Either ISO or VAR files don't exist.")
             return
         
         print('-' * 100)
@@ -1487,12 +1840,10 @@ class IOHPCScheduling(HPCScheduling):
             print("pvd for ALL time steps moved to RESULTS. csv file copied to RESULTS")
             print('-' * 100)
         except (FileNotFoundError, shutil.Error) as e:
-            print('-' * 100)
-            print("====EXCEPTION====")
-            print("FileNotFoundError")
             print('-' * 100)
             print(f"Exited with message :{e}, File or directory not found.")
             print('-' * 100)
+            self.result.fail('FileNotFoundError', f"Exited with message :{e}, File or directory not found.")
             return
 
         os.chdir('RESULTS')
@@ -1509,13 +1860,12 @@ class IOHPCScheduling(HPCScheduling):
             try:
                 shutil.copy2(file, '.')
             except (FileNotFoundError, PermissionError, OSError):
-                print("====EXCEPTION====")
-                print("FileNotFoundError")
                 print(f"Failed to copy '{file}'.")
+                self.result.fail('FileNotFoundError', f"Failed to copy '{file}'.")
                 return
 
-        os.system(f'sed -i \"s/\'FILECOUNT\'/{file_count}/\" Multithread_pool.py')
-        os.system(f'sed -i \"s/\'case_name\'/{self.run_name}/\" job_convert.sh')
+        render_in_place('Multithread_pool.py', {'FILECOUNT': file_count})
+        render_in_place('job_convert.sh', {'case_name': self.run_name})
 
         ### Submitting job convert and extracting job_id, wait time and status
         jobid = self.submit_job(os.path.join(ephemeral_path,'RESULTS'),'convert')
@@ -1526,39 +1876,161 @@ class IOHPCScheduling(HPCScheduling):
 
         try:
             t_jobwait, status, new_jobID = self.job_wait(jobid)
-            print("====JOB_IDS====")
-            print(new_jobID)
-            print("====JOB_STATUS====")
-            print(status)
-            if status == 'Q' or status == 'H':
-                print("====WAIT_TIME====")
-                print(t_jobwait - 1800)
-            elif status == 'R':
-                print("====WAIT_TIME====")
-                print(t_jobwait)
+            ### Queued or held: job_wait already bounds the wait by the PBS estimated start
+            if status not in ('Q', 'H', 'R'):
+                t_jobwait = 0
+            self.result.update(jobid=new_jobID, status=status, t_wait=t_jobwait)
 
-        except HPCScheduling.JobStatError:
+        except HPCScheduling.JobStatError as e:
             print(f'Convert job {self.run_ID} failed on initial submission')
-            print("====EXCEPTION====")
-            print("JobStatError")
+            self.result.fail('JobStatError', e)
+
+        except ValueError as e:
+            self.result.fail('ValueError', e)
+
 
-        except ValueError:
-            print("====EXCEPTION====")
-            print("ValueError")
+### Scheduling class of each study ID
+study_classes = {'SM': SMHPCScheduling, 'SV': SVHPCScheduling, 'IO': IOHPCScheduling}
 
+### Provisioning and submitting a whole parameter grid in one call: pdict = {'runs': [pset_dict, ...], 'workers': n, 'qsub_interval': s}
+### Runs are provisioned (directory, f90, executable, job.sh) in parallel, and each is submitted as soon as it is ready,
+### with at least qsub_interval seconds between two qsub calls. Returns {'runs': {run_name: {jobid, status, t_wait, error}}, 'stats'}
+
+def run_batch(study, pdict):
+
+    runs = pdict['runs']
+    workers = int(pdict.get('workers') or min(8, len(runs)) or 1)
+    qsub_interval = float(pdict.get('qsub_interval', 2))
+    settle = float(pdict.get('settle', 60))
+
+    start = datetime.datetime.now()
+    outcome = {pset_dict['run_name']: {'jobid': None, 'status': None, 't_wait': 0, 'error': None} for pset_dict in runs}
+
+    def provision(pset_dict):
+        simulator = study_classes[study](pset_dict)
+        simulator.result = RemoteResult('run', pset_dict['run_name'])
+        try:
+            ok = simulator.provision()
+        except Exception as e:
+            traceback.print_exc()
+            simulator.result.fail('UnhandledError', f'{type(e).__name__}: {e}')
+            ok = False
+        return simulator, ok
+
+    last_qsub = None
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(provision, pset_dict) for pset_dict in runs]
+
+        ### qsub calls made from this thread only, as submit_job changes directory
+        for future in as_completed(futures):
+            simulator, ok = future.result()
+            entry = outcome[simulator.run_name]
+
+            if not ok:
+                entry['error'] = simulator.result.error
+                continue
+
+            if last_qsub is not None:
+                sleep(max(0.0, qsub_interval - (datetime.datetime.now() - last_qsub).total_seconds()))
+            last_qsub = datetime.datetime.now()
+
+            try:
+                entry['jobid'] = simulator.submit()
+            except (IndexError, AttributeError, OSError) as e:
+                entry['error'] = {'code': 'JobStatError', 'message': f'qsub failed for {simulator.run_name}: {e}'}
+
+    ### One qstat for every submitted job once PBS has registered them
+    submitted = {entry['jobid']: run_name for run_name, entry in outcome.items() if entry['jobid'] is not None}
+    if submitted:
+        sleep(settle)
+        try:
+            statuses = HPCScheduling.job_status_batch(list(submitted))
+        except ValueError as e:
+            print(f'Warning: {e}, submitted jobs left for the local monitor to query')
+            statuses = {}
+
+        for jobid, run_name in submitted.items():
+            outcome[run_name].update(status='Q', t_wait=1)
+
+        for jobid, value in statuses.items():
+            entry = outcome[submitted[int(jobid)]]
+            ### Held jobs are re-queried at once by the local monitor, which resubmits them
+            entry.update(status=value['status'], t_wait=value['t_wait'] or 1)
+            if value['status'] == 'F':
+                entry['error'] = {'code': 'JobStatError', 'message': f"Job {jobid} failed on initial submission"}
+
+    elapsed = (datetime.datetime.now() - start).total_seconds()
+    failed = sum(entry['error'] is not None for entry in outcome.values())
+
+    print('-' * 100)
+    print(f'Batch of {len(runs)} runs provisioned with {workers} workers and submitted in {elapsed:.0f} s, {failed} failed')
+    print('-' * 100)
+
+    return {'runs': outcome, 'stats': {'runs': len(runs), 'submitted': len(submitted), 'failed': failed,
+                                       'workers': workers, 'elapsed': round(elapsed, 1)}}
+
+
+### Functions callable remotely, from the command line or through HPC_agent.py
+remote_functions = ["run","run_batch","monitor","job_restart","vtk_convert","pack_results","chain_step","chain_status","monitor_batch"]
+
+### Executing one remote function and returning its result record, shared by main() and HPC_agent.py
+### cache: per-run state kept between calls by the agent, a fresh dict for one-shot invocations
+
+def dispatch(function, pdict=None, study=None, jobs=None, cache=None):
+
+    ### Result record returned even if the class set-up or the called function crashes
+    result = RemoteResult(function, (pdict or {}).get('run_name'))
+
+    try:
+        if function not in remote_functions:
+            result.fail('ValueError', f'Invalid function name {function}')
+            return result
+
+        ### Batched qstat for all active jobs, independent of any single run
+        if function == "monitor_batch":
+            try:
+                result.update(data=HPCScheduling.job_status_batch(jobs or []))
+            except ValueError as e:
+                result.fail('ValueError', e)
+            return result
+
+        ### choose class to run according to pdict given ###
+        if study not in study_classes:
+            print("No study ID provided. Double check run.py psweep script and pset_dict initialization")
+            result.fail('ValueError', f'Unknown study ID {study}')
+            return result
+
+        ### Every run of the grid provisioned and submitted in one call
+        if function == "run_batch":
+            result.update(data=run_batch(study, pdict))
+            return result
+
+        simulator = study_classes[study](pdict)
+
+        if cache is not None:
+            simulator.cache = cache
+        simulator.result = result
+        getattr(simulator, function)()
+
+    except Exception as e:
+        traceback.print_exc()
+        result.fail('UnhandledError', f'{type(e).__name__}: {e}')
+
+    return result
 
 def main():
     ### Argument parser to specify function to run
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "function",
-        choices=["run","monitor","job_restart","vtk_convert"], 
+        choices=remote_functions, 
     )
 
-    ### Input argument for dictionary
+    ### Input argument for dictionary, '-' to read it from stdin (parameter grids too long for the command line)
     parser.add_argument(
         "--pdict",
-        type=json.loads,
+        type=str,
     )
 
     parser.add_argument(
@@ -1566,24 +2038,20 @@ def main():
         type=str,
     )
 
+    ### Comma separated job ids for the batched status query
+    parser.add_argument(
+        "--jobs",
+        type=str,
+    )
+
     args = parser.parse_args()
 
-    ### choose class to run according to pdict given ###
-    if args.study:
-        if args.study == 'SV':
-            simulator = SVHPCScheduling(args.pdict)
-        elif args.study == 'IO':
-            simulator = IOHPCScheduling(args.pdict)
-        elif args.study == 'SM':
-            simulator = SMHPCScheduling(args.pdict)
-    else:
-        print("No study ID provided. Double check run.py psweep script and pset_dict initialization")
-
-    if hasattr(simulator, args.function):
-        func = getattr(simulator, args.function)
-        func()
-    else:
-        print("Invalid function name")
+    job_ids = [job for job in args.jobs.split(',') if job] if args.jobs else []
+    pdict = json.loads(sys.stdin.read() if args.pdict == '-' else args.pdict) if args.pdict else None
+
+    ### One result record per invocation, printed as the last output line
+    result = dispatch(args.function, pdict=pdict, study=args.study, jobs=job_ids)
+    result.emit()
 
 if __name__ == "__main__":
     main()
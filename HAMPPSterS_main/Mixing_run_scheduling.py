@@ -10,14 +10,11 @@
 #######################################################################################################################################################################################
 
 import os
-from time import sleep
 import pandas as pd
 import subprocess
-import paramiko
-import json
-import numpy as np
 import glob
 from CFD_run_scheduling import SimScheduling as SS
+from vtr_metrics import ndrop_DSD, sp_pipe_profiles, sv_vessel_profiles, sv_last_DSD
 
 
 ################################################################################### PARAMETRIC STUDY ################################################################################
@@ -37,159 +34,37 @@ class SMSimScheduling(SS):
     ### local run assigning parametric study to HPC handling script and performing overall BLUE workflow
     def localrun(self,pset_dict):
 
+        log = self.prepare(pset_dict)
+
+        return self.drive(self.workflow(log))
+
+    ### Building run attributes and logger from the psweep dictionary
+    def prepare(self,pset_dict):
+
         ### constructor from parent class SimScheduling ###
         super().__init__(pset_dict)
 
         ### Logger set-up
         log_filename = os.path.join(self.local_path,f"output_{self.case_type}/output_{self.run_name}.txt")
-        log = self.set_log(log_filename)
+        return self.set_log(log_filename)
 
-        dict_str = json.dumps(self.pset_dict, default=self.convert_to_json, ensure_ascii=False)
+    ### Exception return mapped by case type, to guarantee correct psweep completion
+    def failed_return(self):
 
-        ### Exception return mapped by case type, to guarantee correct psweep completion
         return_from_casetype = {
             'sp_geom': {'L': 0, 'e_max': 0, 'Q': 0, 'E_diss': 0, 'Gamma': 0, 'Pressure': 0, 'Velocity': 0},
             'surf': {"Nd": 0, "DSD": 0, "IntA": 0},
             'geom' : {"Nd": 0, "DSD": 0, "IntA": 0}
                                 }
 
-        ### First job creation and submission
+        return return_from_casetype.get(self.case_type,{})
 
-        HPC_script = 'HPC_run_scheduling.py'
-        
-        log.info('-' * 100)
-        log.info('-' * 100)
-        log.info('NEW RUN')
-        log.info('-' * 100)
-        log.info('-' * 100)
-
-        ### wait time to connect at first, avoiding multiple simultaneuous connections
-        init_wait_time = np.random.RandomState().randint(0,180)
-        sleep(init_wait_time)
-
-        try:
-            command = f'python {self.main_path}/{HPC_script} run --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\''
-            jobid, t_wait, status, _ = self.execute_remote_command(command=command,search=0,log=log)
-        except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-            log.info(f"SSH ERROR: Authentication failed: {e}")
-            return return_from_casetype.get(self.case_type,{})
-        except (ValueError, SS.JobStatError, NameError) as e:
-            log.info(f'Exited with message: {e}')
-            return return_from_casetype.get(self.case_type,{})
-            
-        ### Job monitor and restarting nested loop. Checks job status and restarts if needed.
-
-        restart = True
-        while restart:
-
-            ### job monitoring loop
-
-            log.info('-' * 100)
-            log.info('JOB MONITORING')
-            log.info('-' * 100)
-
-            try:
-                self.jobmonitor(t_wait, status, jobid, self.run_ID, HPC_script,log)
-            except (ValueError, NameError, SS.ConvergenceError) as e:
-                log.info(f'Exited with message: {e}')
-                return return_from_casetype.get(self.case_type,{})
-            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-                log.info(f"SSH ERROR: Authentication failed: {e}")
-                return return_from_casetype.get(self.case_type,{})
-
-            ### Job restart execution
-
-            log.info('-' * 100)
-            log.info('JOB RESTARTING')
-            log.info('-' * 100)
-
-            try:
-                log.info('-' * 100)
-                command = f'python {self.main_path}/{HPC_script} job_restart --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\''
-                new_jobID, new_t_wait, new_status, ret_bool = self.execute_remote_command(
-                    command=command, search=2, log=log
-                    )
-
-                log.info('-' * 100)
-
-                ### updating
-                jobid = new_jobID
-                t_wait = new_t_wait
-                status = new_status
-                restart = eval(ret_bool)
-
-            except (ValueError,FileNotFoundError,NameError,SS.BadTerminationError,SS.JobStatError,TypeError,KeyError) as e:
-                log.info(f'Exited with message: {e}')
-                return return_from_casetype.get(self.case_type,{})
-            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-                log.info(f"SSH ERROR: Authentication failed: {e}")
-                return return_from_casetype.get(self.case_type,{})
-
-        ### vtk convert job creation and submission
-
-        log.info('-' * 100)
-        log.info('VTK CONVERTING')
-        log.info('-' * 100)
-
-        try:
-            log.info('-' * 100)
-            command = f'python {self.main_path}/{HPC_script} vtk_convert --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\''
-            conv_jobid, conv_t_wait, conv_status, _ = self.execute_remote_command(
-                command=command,search=0,log=log
-                )
-            log.info('-' * 100)
-        except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-            log.info(f"SSH ERROR: Authentication failed: {e}")
-            return return_from_casetype.get(self.case_type,{})
-        except (FileNotFoundError, SS.JobStatError, ValueError, NameError) as e:
-            log.info(f'Exited with message: {e}')
-            return return_from_casetype.get(self.case_type,{})
-        
-        conv_name = 'Convert' + str(self.run_ID)
-
-        ### job convert monitoring loop
-
-        log.info('-' * 100)
-        log.info('JOB MONITORING')
-        log.info('-' * 100)
-
-        try:
-            self.jobmonitor(conv_t_wait,conv_status,conv_jobid,conv_name,HPC_script,log=log)
-        except (ValueError, NameError) as e:
-            log.info(f'Exited with message: {e}')
-            return return_from_casetype.get(self.case_type,{})
-        except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-            log.info(f"SSH ERROR: Authentication failed: {e}")
-            return return_from_casetype.get(self.case_type,{})
-
-        ### Downloading files and local Post-processing
-
-        log.info('-' * 100)
-        log.info('DOWNLOADING FILES FROM EPHEMERAL')
-        log.info('-' * 100)
-
-        try:
-            self.scp_download(log)
-        except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-            log.info(f"SSH ERROR: Authentication failed: {e}")
-            return return_from_casetype.get(self.case_type,{})
-
-        log.info('-' * 100)
-        log.info('PVPYTHON POSTPROCESSING')
-        log.info('-' * 100)
+    ### Local post-processing once the converted files are downloaded
+    def postprocess(self,log):
 
         # CSV backup saving file for post-processed variables
         csvbkp_file_path = os.path.join(self.local_path,'CSV_BKP',f'{self.case_type}.csv')
 
-        ### Checking if a pvpython is operating on another process, if so sleeps.
-
-        pvpyactive, pid = self.is_pvpython_running()
-
-        while pvpyactive:
-            log.info(f'pvpython is active in process ID : {pid}')
-            sleep(600)
-            pvpyactive, pid = self.is_pvpython_running()
-
         ### Exectuing post-processing instructions depending on single or two-phase case type
         if self.case_type == 'sp_geom':
 
@@ -278,11 +153,10 @@ class SMSimScheduling(SS):
     def post_process(self,log):
 
         ### Extracting Interfacial Area from CSV
-        os.chdir(self.save_path_runID) 
-        pvdfiles = glob.glob('VAR_*_time=*.pvd')
+        pvdfiles = glob.glob(os.path.join(self.save_path_runID, 'VAR_*_time=*.pvd'))
         maxpvd_tf = max(float(filename.split('=')[-1].split('.pvd')[0]) for filename in pvdfiles)
 
-        df_csv = pd.read_csv(os.path.join(self.save_path_runID,f'{self.run_name}.csv' if os.path.exists(f'{self.run_name}.csv') else f'HST_{self.run_name}.csv'))
+        df_csv = pd.read_csv(os.path.join(self.save_path_runID,f'{self.run_name}.csv' if os.path.exists(os.path.join(self.save_path_runID, f'{self.run_name}.csv')) else f'HST_{self.run_name}.csv'))
         df_csv['diff'] = abs(df_csv['Time']-maxpvd_tf)
         log.info('Reading data from csv')
         log.info('-'*100)
@@ -293,7 +167,6 @@ class SMSimScheduling(SS):
         log.info('Interfacial area extracted')
         log.info('-'*100)
 
-        os.chdir(self.local_path)
 
         ### Running pvpython script for Nd and DSD
         script_path = os.path.join(self.local_path,'PV_scripts/PV_ndrop_DSD.py')
@@ -301,30 +174,33 @@ class SMSimScheduling(SS):
         log.info('Executing pvpython script')
         log.info('-'*100)
 
-        try:
-            output = subprocess.run(['pvpython', script_path, self.save_path , self.run_name], 
-                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            captured_stdout = output.stdout.decode('utf-8').strip().split('\n')
-            outlines= []
-            for i, line in enumerate(captured_stdout):
-                stripline = line.strip()
-                outlines.append(stripline)
-                if i < len(captured_stdout) - 1:
-                    log.info(stripline)
+        if self.pv_backend == 'numpy':
+            df_DSD = self.run_inprocess(ndrop_DSD, (self.save_path, self.run_name), log)
+        else:
+            try:
+                output = subprocess.run(['pvpython', script_path, self.save_path , self.run_name], 
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+                captured_stdout = output.stdout.decode('utf-8').strip().split('\n')
+                outlines= []
+                for i, line in enumerate(captured_stdout):
+                    stripline = line.strip()
+                    outlines.append(stripline)
+                    if i < len(captured_stdout) - 1:
+                        log.info(stripline)
             
-            df_DSD = pd.read_json(outlines[-1], orient='split', dtype=float, precise_float=True)
+                df_DSD = pd.read_json(outlines[-1], orient='split', dtype=float, precise_float=True)
 
 
-        except subprocess.CalledProcessError as e:
-            log.info(f"Error executing the script with pvpython: {e}")
-            df_DSD = None
-        except FileNotFoundError:
-            log.info("pvpython command not found. Make sure Paraview is installed and accessible in your environment.")
-            df_DSD = None
-        except ValueError as e:
-            log.info(f'ValueError, Exited with message: {e}')
-            df_DSD = None
+            except subprocess.CalledProcessError as e:
+                log.info(f"Error executing the script with pvpython: {e}")
+                df_DSD = None
+            except FileNotFoundError:
+                log.info("pvpython command not found. Make sure Paraview is installed and accessible in your environment.")
+                df_DSD = None
+            except ValueError as e:
+                log.info(f'ValueError, Exited with message: {e}')
+                df_DSD = None
 
         return df_DSD, IntA
     
@@ -336,6 +212,11 @@ class SMSimScheduling(SS):
         self.pipe_radius = self.pset_dict['pipe_radius']
         domain_length = (1 + float(self.n_ele))*float(self.pipe_radius)*2
 
+        ### Metrics already computed next to the data by the reduce job in remote_reduce mode
+        metrics = self.reduced_metrics(log)
+        if metrics is not None:
+            return metrics[0]
+
         ### Running pvpython script for Nd and DSD
         script_path = os.path.join(self.local_path,'PV_scripts/PV_sp_PP.py')
 
@@ -343,6 +224,9 @@ class SMSimScheduling(SS):
         log.info('Executing pvpython script')
         log.info('-'*100)
 
+        if self.pv_backend == 'numpy':
+            return self.run_inprocess(sp_pipe_profiles, (self.save_path, self.run_name, domain_length, float(self.pipe_radius)), log)
+
         try:
             output = subprocess.run(['pvpython', script_path, self.save_path , self.run_name, str(domain_length), str(self.pipe_radius)], 
                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -383,8 +267,15 @@ class SVSimScheduling(SS):
     ### Ini Function ###
     def __init__(self) -> None:
         pass        
-    
+
     def localrun(self, pset_dict):
+
+        log = self.prepare(pset_dict)
+
+        return self.drive(self.workflow(log))
+
+    ### Building run attributes and logger from the psweep dictionary ###
+    def prepare(self, pset_dict):
         
         ## Study specific attrbiuted to be constructed
         vtk_conv_mode = pset_dict['vtk_conv_mode']
@@ -394,12 +285,11 @@ class SVSimScheduling(SS):
 
         ### Logger setup ###
         log_filename = os.path.join(self.local_path,f"output_{self.case_type}/output_{self.run_name}.txt")
-        log = self.set_log(log_filename)
+        return self.set_log(log_filename)
 
-        # convert the dictionary to strings for HPC
-        dict_str = json.dumps(self.pset_dict, default=self.convert_to_json, ensure_ascii=False)
+    ### Exception return mapped by case type, to guarantee correct psweep completion ###
+    def failed_return(self):
 
-        ### Exception return mapped by case type, to guarantee correct psweep completion ###
         return_from_casetype = {
             'svsurf': {"Time": 0,"Nd": 0, "DSD": 0, "IntA": 0},
             'svgeom': {"Time": 0,"Nd": 0, "DSD": 0, "IntA": 0},
@@ -410,140 +300,14 @@ class SVSimScheduling(SS):
                         "Ur_over_line":0,"Uz_over_line":0}
         }
 
-        ### First job creation and submission ###
-
-        HPC_script = 'HPC_run_scheduling.py'
-
-        log.info('-' * 100)
-        log.info('-' * 100)
-        log.info('NEW RUN')
-        log.info('-' * 100)
-        log.info('-' * 100)
-
-        ### wait time to connect at first, avoiding multiple simultaneuous connection ###
-        init_wait_time = np.random.RandomState().randint(0,180)
-        sleep(init_wait_time)
+        return return_from_casetype.get(self.case_type, {})
 
-        try:
-            command = f"python {self.main_path}/{HPC_script} run --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\'"
-            jobid, t_wait, status, _ = self.execute_remote_command(command=command,search=0,log=log)
-        except (paramiko.AuthenticationException,paramiko.SSHException) as e:
-            log.info(f'SSH EEROR: Authentication failed: {e}')
-            return return_from_casetype.get(self.case_type, {})
-        except (ValueError, SS.JobStatError, NameError) as e:
-            log.info(f'Exited with message: {e}')
-            return return_from_casetype.get(self.case_type,{})
-        
-        ### Job monitor and restart nested loop ###
-        ### Checks job status and restarts if needed ###
-
-        restart = True
-        while restart:
-            ### job monitoring loop ###
-            log.info('-' * 100)
-            log.info('JOB MONITORING')
-            log.info('-' * 100) 
-
-            try:
-                self.jobmonitor(t_wait, status, jobid, self.run_ID, HPC_script,log)
-            except (ValueError, NameError, SS.ConvergenceError) as e:
-                log.info(f'Exited with message: {e}')
-                return return_from_casetype.get(self.case_type,{})
-            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-                log.info(f"SSH ERROR: Authentication failed: {e}")
-                return return_from_casetype.get(self.case_type,{})
-
-            ### Job restart execution ###
-            log.info('-' * 100)
-            log.info('JOB RESTARTING')
-            log.info('-' * 100)
-
-            try:
-                log.info('-' * 100)
-                command = f'python {self.main_path}/{HPC_script} job_restart --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\''
-                new_jobID, new_t_wait, new_status, ret_bool = self.execute_remote_command(
-                    command=command, search=2, log=log
-                    )
-
-                log.info('-' * 100)
-
-                ### updating
-                jobid = new_jobID
-                t_wait = new_t_wait
-                status = new_status
-                restart = eval(ret_bool)
-
-            except (ValueError,FileNotFoundError,NameError,SS.BadTerminationError,SS.JobStatError,TypeError,KeyError) as e:
-                log.info(f'Exited with message: {e}')
-                return return_from_casetype.get(self.case_type,{})
-            except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-                log.info(f"SSH ERROR: Authentication failed: {e}")
-                return return_from_casetype.get(self.case_type,{})
-
-        ### vtk convert job creation and submission
-        log.info('-' * 100)
-        log.info('VTK CONVERTING')
-        log.info('-' * 100)
-
-        try:
-            log.info('-' * 100)
-            command = f'python {self.main_path}/{HPC_script} vtk_convert --pdict \'{dict_str}\' --study \'{str(self.study_ID)}\''
-            conv_jobid, conv_t_wait, conv_status, _ = self.execute_remote_command(
-                command=command,search=0,log=log
-                )
-            log.info('-' * 100)
-        except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-            log.info(f"SSH ERROR: Authentication failed: {e}")
-            return return_from_casetype.get(self.case_type,{})
-        except (FileNotFoundError, SS.JobStatError, ValueError, NameError) as e:
-            log.info(f'Exited with message: {e}')
-            return return_from_casetype.get(self.case_type,{})
-        
-        conv_name = 'Convert' + str(self.run_ID)
-
-        ### job convert monitoring loop ###
-
-        log.info('-' * 100)
-        log.info('JOB MONITORING')
-        log.info('-' * 100)
-
-        try:
-            self.jobmonitor(conv_t_wait,conv_status,conv_jobid,conv_name,HPC_script,log=log)
-        except (ValueError, NameError) as e:
-            log.info(f'Exited with message: {e}')
-            return return_from_casetype.get(self.case_type,{})
-        except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-            log.info(f"SSH ERROR: Authentication failed: {e}")
-            return return_from_casetype.get(self.case_type,{})
-
-        ### Downloading files and local Post-processing
-
-        log.info('-' * 100)
-        log.info('DOWNLOADING FILES FROM EPHEMERAL')
-        log.info('-' * 100)
-
-        try:
-            self.scp_download(log)
-            # log.info('Skipping downloading')
-        except (paramiko.AuthenticationException, paramiko.SSHException) as e:
-            log.info(f"SSH ERROR: Authentication failed: {e}")
-            return return_from_casetype.get(self.case_type,{})
-
-        log.info('-' * 100)
-        log.info('PVPYTHON POSTPROCESSING')
-        log.info('-' * 100)
+    ### Local post-processing once the converted files are downloaded ###
+    def postprocess(self, log):
 
         ### csv backup saving file for post-processed variables ###
         csvbkp_file_path = os.path.join(self.local_path,'CSV_BKP',f'{self.case_type}.csv')
 
-        ### checking if a pvpython is operating on another process, if so sleeps ###
-        pvpyactive, pid = self.is_pvpython_running()
-
-        while pvpyactive:
-            log.info(f'pvpython is active in process ID: {pid}')
-            sleep(1800)
-            pvpyactive,pid =self.is_pvpython_running()
-
         ### pvpython execution ###
         if self.vtk_conv_mode == 'last':
             log.info(f'{self.vtk_conv_mode} post-processing is starting.')
@@ -697,12 +461,16 @@ class SVSimScheduling(SS):
             #     return {"Time":0, "IntA":0, "Nd":0, "DSD":0}
 
     def post_process_lastsp(self,log):
+
+        ### Metrics and final time already computed next to the data by the reduce job in remote_reduce mode
+        metrics = self.reduced_metrics(log)
+        if metrics is not None:
+            return metrics
+
         # get the final time #
-        os.chdir(self.save_path_runID)
-        pvdfiles = glob.glob('VAR_*_time=*.pvd')
+        pvdfiles = glob.glob(os.path.join(self.save_path_runID, 'VAR_*_time=*.pvd'))
         maxpvd_tf = max(float(filename.split('=')[-1].split('.pvd')[0]) for filename in pvdfiles)
         
-        os.chdir(self.local_path)
         # Attributes needed for single phase post processing # 
         self.C = self.pset_dict['clearance']
 
@@ -711,39 +479,41 @@ class SVSimScheduling(SS):
         log.info('Executing pvpython script')
         log.info('-' * 100)
 
-        try:
-            output = subprocess.run(['pvpython', script_path, self.save_path, self.run_name, str(self.C)], 
-                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            captured_stdout = output.stdout.decode('utf-8').strip().split('\n')
-            outlines= []
-            for i, line in enumerate(captured_stdout):
-                stripline = line.strip()
-                outlines.append(stripline)
-                if i < len(captured_stdout) - 1:
-                    log.info(stripline)
-
-            df_sp = pd.read_json(outlines[-1], orient='split', dtype=float, precise_float=True)
-
-        except subprocess.CalledProcessError as e:
-            log.info(f"Error executing the script with pvpython: {e}")
-            df_sp = None
-        except FileNotFoundError:
-            log.info("pvpython command not found. Make sure Paraview is installed and accessible in your environment.")
-            df_sp = None
-        except ValueError as e:
-            log.info(f'ValueError, Exited with message: {e}')
-            df_sp =  None
+        if self.pv_backend == 'numpy':
+            df_sp = self.run_inprocess(sv_vessel_profiles, (self.save_path, self.run_name, self.C), log)
+        else:
+            try:
+                output = subprocess.run(['pvpython', script_path, self.save_path, self.run_name, str(self.C)], 
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+                captured_stdout = output.stdout.decode('utf-8').strip().split('\n')
+                outlines= []
+                for i, line in enumerate(captured_stdout):
+                    stripline = line.strip()
+                    outlines.append(stripline)
+                    if i < len(captured_stdout) - 1:
+                        log.info(stripline)
+
+                df_sp = pd.read_json(outlines[-1], orient='split', dtype=float, precise_float=True)
+
+            except subprocess.CalledProcessError as e:
+                log.info(f"Error executing the script with pvpython: {e}")
+                df_sp = None
+            except FileNotFoundError:
+                log.info("pvpython command not found. Make sure Paraview is installed and accessible in your environment.")
+                df_sp = None
+            except ValueError as e:
+                log.info(f'ValueError, Exited with message: {e}')
+                df_sp =  None
 
         return df_sp, maxpvd_tf
 
     def post_process_last(self, log):
         ### Extracting Interfacial Area from csv###
-        os.chdir(self.save_path_runID)
-        pvdfiles = glob.glob('VAR_*_time=*.pvd')
+        pvdfiles = glob.glob(os.path.join(self.save_path_runID, 'VAR_*_time=*.pvd'))
         maxpvd_tf = max(float(filename.split('=')[-1].split('.pvd')[0]) for filename in pvdfiles)
 
-        df_csv = pd.read_csv(os.path.join(self.save_path_runID,f'{self.run_name}.csv' if os.path.exists(f'{self.run_name}.csv') else f'HST_{self.run_name}.csv'))
+        df_csv = pd.read_csv(os.path.join(self.save_path_runID,f'{self.run_name}.csv' if os.path.exists(os.path.join(self.save_path_runID, f'{self.run_name}.csv')) else f'HST_{self.run_name}.csv'))
         df_csv['diff'] = abs(df_csv['Time']-maxpvd_tf)
         log.info('Reading data from csv')
         log.info('-'*100)
@@ -754,48 +524,49 @@ class SVSimScheduling(SS):
         log.info('Interfacial area extracted')
         log.info('-'*100)
 
-        os.chdir(self.local_path)
         ### Running pvpython script for Nd and DSD ###
         script_path = os.path.join(self.local_path,'PV_scripts/PV_sv_last.py')
 
         log.info('Executing pvpython script')
         log.info('-' * 100)
 
-        try:
-            output = subprocess.run(['pvpython', script_path, self.save_path , self.run_name], 
-                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            captured_stdout = output.stdout.decode('utf-8').strip().split('\n')
-            outlines= []
-            for i, line in enumerate(captured_stdout):
-                stripline = line.strip()
-                outlines.append(stripline)
-                if i < len(captured_stdout) - 1:
-                    log.info(stripline)
+        if self.pv_backend == 'numpy':
+            df_DSD = self.run_inprocess(sv_last_DSD, (self.save_path, self.run_name), log)
+        else:
+            try:
+                output = subprocess.run(['pvpython', script_path, self.save_path , self.run_name], 
+                                        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+                captured_stdout = output.stdout.decode('utf-8').strip().split('\n')
+                outlines= []
+                for i, line in enumerate(captured_stdout):
+                    stripline = line.strip()
+                    outlines.append(stripline)
+                    if i < len(captured_stdout) - 1:
+                        log.info(stripline)
             
-            df_DSD = pd.read_json(outlines[-1], orient='split', dtype=float, precise_float=True)
+                df_DSD = pd.read_json(outlines[-1], orient='split', dtype=float, precise_float=True)
 
 
-        except subprocess.CalledProcessError as e:
-            log.info(f"Error executing the script with pvpython: {e}")
-            df_DSD = None
-        except FileNotFoundError:
-            log.info("pvpython command not found. Make sure Paraview is installed and accessible in your environment.")
-            df_DSD = None
-        except ValueError as e:
-            log.info(f'ValueError, Exited with message: {e}')
-            df_DSD = None
+            except subprocess.CalledProcessError as e:
+                log.info(f"Error executing the script with pvpython: {e}")
+                df_DSD = None
+            except FileNotFoundError:
+                log.info("pvpython command not found. Make sure Paraview is installed and accessible in your environment.")
+                df_DSD = None
+            except ValueError as e:
+                log.info(f'ValueError, Exited with message: {e}')
+                df_DSD = None
 
         return df_DSD, IntA, maxpvd_tf
     
     def post_process_all(self, log):
         ### Extracting Interfacial Area from CSV ###
-        os.chdir(self.save_path_runID)
         
         df_csv = pd.read_csv(os.path.join(self.save_path_runID, f'{self.run_name}.csv'
-                                          if os.path.exists(f'{self.run_name}.csv') 
+                                          if os.path.exists(os.path.join(self.save_path_runID, f'{self.run_name}.csv')) 
                                           else f'HST_{self.run_name}.csv'))
-        pvdfiles = glob.glob('VAR_*_time=*.pvd')
+        pvdfiles = glob.glob(os.path.join(self.save_path_runID, 'VAR_*_time=*.pvd'))
         times = sorted([float(filename.split('=')[-1].split('.pvd')[0]) for filename in pvdfiles])
         maxtime = max(times)
 
@@ -809,7 +580,6 @@ class SVSimScheduling(SS):
         log.info('-' * 100)
 
         ### Running pvpython script for Nd and DSD ###
-        os.chdir(self.local_path)
         script_path = os.path.join(self.local_path,'PV_scripts/PV_sv_all.py')
         log.info('Executing pvpython script')
         log.info('-' * 100)
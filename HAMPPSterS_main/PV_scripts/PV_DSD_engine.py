@@ -0,0 +1,54 @@
+### SMX_Automation_simulation_run, tailored for Paraview 5.10
+### Droplet size distribution engine: all droplet volumes from a single fetch of the connectivity output
+### to be imported by the DSD pvpython scripts in this folder
+### Author: Juan Pablo Valdes,
+### First commit: October, 2026
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+from paraview.simple import CellSize, Delete
+from paraview import servermanager
+from vtkmodules.util.numpy_support import vtk_to_numpy
+import numpy as np
+
+
+### Volume of every connected region, indexed by RegionId
+### Replaces one Threshold + IntegrateVariables + Fetch per droplet with one Fetch and one weighted bincount
+
+def region_volumes(connectivity):
+
+    # volume of every cell, next to the RegionId array tagged by Connectivity
+    cell_size = CellSize(Input=connectivity)
+    cell_size.ComputeVertexCount = 0
+    cell_size.ComputeLength = 0
+    cell_size.ComputeArea = 0
+    cell_size.ComputeVolume = 1
+    cell_size.ComputeSum = 0
+
+    data = servermanager.Fetch(cell_size)
+
+    # the proxy keeps its output mesh alive, freed here since a pipeline can be reused across time steps
+    Delete(cell_size)
+
+    region_array = data.GetCellData().GetArray('RegionId')
+    volume_array = data.GetCellData().GetArray('Volume')
+
+    # nothing left after the clip, no droplets
+    if region_array is None or volume_array is None or data.GetNumberOfCells() == 0:
+        return np.zeros(0)
+
+    region_ids = vtk_to_numpy(region_array).astype(np.int64)
+    volumes = vtk_to_numpy(volume_array).astype(np.float64)
+
+    # cells of a region share all their points, so this matches thresholding RegionId on points
+    return np.bincount(region_ids, weights=volumes)
+
+### Droplet volumes from first_region onwards, e.g. 1 to skip the continuous phase when regions are sorted by cell count
+
+def droplet_volumes(connectivity, first_region=0):
+
+    volumes = region_volumes(connectivity)
+
+    return [float(x) for x in volumes[first_region:]]
@@ -13,16 +13,13 @@ import os
 import glob
 import shutil
 import json
+from PV_sweep_engine import sweep
 
-def pvpy(HDpath,case_name,rho_l,rho_g):
+### Pipeline held by each sweep worker for all of its time steps, built once instead of once per time step
 
-    path = os.path.join(HDpath,case_name,'postProcessing')
-    os.chdir(path)
+def build(case_name,rho_l,rho_g):
 
-    pvdfiles = glob.glob('VAR_*_time=*.pvd')
     pvdfile = f'VAR_{case_name}.pvd'
-    
-    timestep = int(glob.glob('VAR_*_*.vtr')[0].split("_")[-1].split(".")[0])
 
     case_data = PVDReader(FileName=pvdfile)
     case_data.CellArrays = []
@@ -31,98 +28,90 @@ def pvpy(HDpath,case_name,rho_l,rho_g):
 
     print('Read data')
 
-    rho_g = float(rho_g)
-    rho_l = float(rho_l)
-    t_ini = 0
-    t_fin = 100
+    clip1 = Clip(Input=case_data)
+    clip1.ClipType = 'Cylinder'
+    clip1.HyperTreeGridClipper = 'Cylinder'
+    clip1.Scalars = ['POINTS', 'Interface']
+    clip1.ClipType.Axis = [0.0, 0.0, 1.0]
+    clip1.ClipType.Radius = 6.8
 
-    Ek_list = []
-    time_list = []
+    print('Made cylinder clip')
 
-    print('Entering time loop')
+    clip2 = Clip(Input=clip1)
+    clip2.ClipType = 'Plane'
+    clip2.HyperTreeGridClipper = 'Plane'
+    clip2.Scalars = ['POINTS', 'Interface']
+    clip2.ClipType.Origin = [7.0155, 7.0155, 7.0155]
+    clip2.HyperTreeGridClipper.Origin = [7.0155, 7.0155, 7.0155]
+    clip2.Invert = 0
 
-    for i in range(t_ini,t_fin+1,1):
+    print('Made plane clip')
 
-        clip1 = Clip(Input=case_data)
-        clip1.ClipType = 'Cylinder'
-        clip1.HyperTreeGridClipper = 'Cylinder'
-        clip1.Scalars = ['POINTS', 'Interface']
-        clip1.ClipType.Axis = [0.0, 0.0, 1.0]
-        clip1.ClipType.Radius = 6.8
+    # create a new 'Calculator'
+    calculator1 = Calculator(Input=clip2)
+    calculator1.ResultArrayName = 'H'
+    calculator1.Function = '((Interface/abs(Interface))+1)/2'
 
-        print('Made cylinder clip')
+    print('Calculated H')
 
-        UpdatePipeline(time=i, proxy=clip1)
+    # create a new 'Calculator'
+    calculator2 = Calculator(Input=calculator1)
+    calculator2.ResultArrayName = 'rho'
+    calculator2.Function = f'{rho_g} + ({rho_l} - {rho_g})*H'
 
-        clip2 = Clip(Input=clip1)
-        clip2.ClipType = 'Plane'
-        clip2.HyperTreeGridClipper = 'Plane'
-        clip2.Scalars = ['POINTS', 'Interface']
-        clip2.ClipType.Origin = [7.0155, 7.0155, 7.0155]
-        clip2.HyperTreeGridClipper.Origin = [7.0155, 7.0155, 7.0155]
-        clip2.Invert = 0
+    print('Calculated rho')
 
-        print('Made plane clip')
+    # create a new 'Calculator'
+    calculator3 = Calculator(Input=calculator2)
+    calculator3.ResultArrayName = 'Ek'
+    calculator3.Function = '(1/2)*(rho)*(mag(Velocity)^2)'
 
-        UpdatePipeline(time=i, proxy=clip2)
+    print('Calculated Eki')
 
-        # create a new 'Calculator'
-        calculator1 = Calculator(Input=clip2)
-        calculator1.ResultArrayName = 'H'
-        calculator1.Function = '((Interface/abs(Interface))+1)/2'
+    integrateVariables1 = IntegrateVariables(registrationName='IntegrateVariables1', Input=calculator3)
+    integrateVariables1.DivideCellDataByVolume = 0
 
-        print('Calculated H')
+    animationScene1 = GetAnimationScene()
 
-        UpdatePipeline(time=i, proxy=calculator1)
+    # update animation scene based on data timesteps
+    animationScene1.UpdateAnimationUsingDataTimeSteps()
 
-        # create a new 'Calculator'
-        calculator2 = Calculator(Input=calculator1)
-        calculator2.ResultArrayName = 'rho'
-        calculator2.Function = f'{rho_g} + ({rho_l} - {rho_g})*H'
+    return {'case_data': case_data, 'integrate': integrateVariables1, 'scene': animationScene1}
 
-        print('Calculated rho')
+### Kinetic energy at one time step
 
-        UpdatePipeline(time=i, proxy=calculator2)
+def step(state, i):
 
-        # create a new 'Calculator'
-        calculator3 = Calculator(Input=calculator2)
-        calculator3.ResultArrayName = 'Ek'
-        calculator3.Function = '(1/2)*(rho)*(mag(Velocity)^2)'
+    # Properties modified on animationScene1
+    state['scene'].AnimationTime = i
 
-        print('Calculated Eki')
+    UpdatePipeline(time=i, proxy=state['case_data'])
 
-        UpdatePipeline(time=i, proxy=calculator3)
+    UpdatePipeline(time=i, proxy=state['integrate'])
+    integrate_object = paraview.servermanager.Fetch(state['integrate'])
+    Ek = np.array(integrate_object.GetPointData().GetArray('Ek'))
+    print('Calculated kinetic energy at time = '+str(i))
 
-        animationScene1 = GetAnimationScene()
+    return float(Ek.ravel()[0])
 
-        # update animation scene based on data timesteps
-        animationScene1.UpdateAnimationUsingDataTimeSteps()
-
-        # Properties modified on animationScene1
-        animationScene1.AnimationTime = i
-
-        # get the time-keeper
-        timeKeeper1 = GetTimeKeeper()
+def pvpy(HDpath,case_name,rho_l,rho_g):
 
-        UpdatePipeline(time=i, proxy=case_data)
+    path = os.path.join(HDpath,case_name,'postProcessing')
+    os.chdir(path)
 
-        UpdatePipeline(time=i, proxy=calculator3)
+    rho_g = float(rho_g)
+    rho_l = float(rho_l)
+    t_ini = 0
+    t_fin = 100
 
-        integrateVariables1 = IntegrateVariables(registrationName='IntegrateVariables1', Input=calculator3)
-        integrateVariables1.DivideCellDataByVolume = 0
-        UpdatePipeline(time=i, proxy=integrateVariables1)
-        integrate_object = paraview.servermanager.Fetch(integrateVariables1)
-        Ek = np.array(integrate_object.GetPointData().GetArray('Ek'))
-        time = np.full((1, 1), i)
-        Ek = np.full((1, 1), Ek)
-        Ek_list.append(Ek)
-        time_list.append(time)
-        Ek_list[0] = 0
-        time_list[0] = 0
-        print('Calculated kinetic energy at time = '+str(i))
+    print('Entering time loop')
 
-    Ek_floats = [float(x) for x in Ek_list]
-    time_floats = [float(x) for x in time_list]
+    ### Time steps sharded across the sweep workers, merged back in time order
+    Ek_floats = sweep(build, step, range(t_ini,t_fin+1,1), args=(case_name,rho_l,rho_g))
+    time_floats = [float(x) for x in range(t_ini,t_fin+1,1)]
+    # initial kinetic energy reported as zero
+    Ek_floats[0] = 0.0
+    time_floats[0] = 0.0
     value_to_add = [{'Time':time_floats, 'Ek':Ek_floats}]
     value_json = json.dumps(value_to_add)
         
@@ -138,15 +127,3 @@ if __name__ == "__main__":
     df_bytes = pvpy(HDpath,case_name,rho_l,rho_g)
 
     print(df_bytes)
-
-
-
-
-
-
-
-
-
-
-
-
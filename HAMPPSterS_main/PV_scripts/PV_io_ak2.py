@@ -13,13 +13,12 @@ import os
 import glob
 import shutil
 import json
+from PV_sweep_engine import sweep
 
-def pvpy(HDpath,case_name):
+### Pipeline held by each sweep worker for all of its time steps
 
-    path = os.path.join(HDpath,case_name,'postProcessing')
-    os.chdir(path)
+def build(case_name):
 
-    pvdfiles = glob.glob('VAR_*_time=*.pvd')
     pvdfile = f'VAR_{case_name}.pvd'
 
     case_data = PVDReader(FileName=pvdfile)
@@ -64,44 +63,47 @@ def pvpy(HDpath,case_name):
 
     print('Merged blocks')
 
-    t_ini = 0
-    t_fin = 100
+    animationScene1 = GetAnimationScene()
 
-    z_list = []
-    time_list = []
+    # update animation scene based on data timesteps
+    animationScene1.UpdateAnimationUsingDataTimeSteps()
 
-    print('Entering time loop')
+    return {'case_data': case_data, 'mergeBlocks': mergeBlocks, 'scene': animationScene1}
+
+### Wave amplitude at one time step
 
-    for i in range(t_ini,t_fin+1,1):
+def step(state, i):
 
-        animationScene1 = GetAnimationScene()
+    # Properties modified on animationScene1
+    state['scene'].AnimationTime = i
 
-        # update animation scene based on data timesteps
-        animationScene1.UpdateAnimationUsingDataTimeSteps()
+    UpdatePipeline(time=i, proxy=state['case_data'])
 
-        # Properties modified on animationScene1
-        animationScene1.AnimationTime = i
+    UpdatePipeline(time=i, proxy=state['mergeBlocks'])
 
-        # get the time-keeper
-        timeKeeper1 = GetTimeKeeper()
+    list = paraview.servermanager.Fetch(state['mergeBlocks'])
+    points = np.array(list.GetPoints().GetData())
 
-        UpdatePipeline(time=i, proxy=case_data)
+    selected_rows = points[points[:, 0] == 10.52325]
+    selected_z_values = selected_rows[:, 2]    
+    max_z_value = np.max(selected_z_values)
+    print('Calculated ak2 at time = '+str(i))
 
-        UpdatePipeline(time=i, proxy=mergeBlocks)
+    return float(max_z_value)
 
-        list = paraview.servermanager.Fetch(mergeBlocks)
-        points = np.array(list.GetPoints().GetData())
+def pvpy(HDpath,case_name):
 
-        selected_rows = points[points[:, 0] == 10.52325]
-        selected_y_values = selected_rows[:, 1]
-        selected_z_values = selected_rows[:, 2]    
-        max_z_value = np.max(selected_z_values)
-        z_list.append(max_z_value)
-        time_list.append(i)
-        print('Calculated ak2 at time = '+str(i))
+    path = os.path.join(HDpath,case_name,'postProcessing')
+    os.chdir(path)
 
-    z_floats = [float(x) for x in z_list]
-    time_floats = [float(x) for x in time_list]
+    t_ini = 0
+    t_fin = 100
+
+    print('Entering time loop')
+
+    ### Time steps sharded across the sweep workers, merged back in time order
+    z_floats = sweep(build, step, range(t_ini,t_fin+1,1), args=(case_name,))
+    time_floats = [float(x) for x in range(t_ini,t_fin+1,1)]
     value_to_add = [{'Time':time_floats, 'ak2':z_floats}]
     value_json = json.dumps(value_to_add)
         
@@ -116,15 +118,3 @@ if __name__ == "__main__":
     df_bytes = pvpy(HDpath,case_name)
 
     print(df_bytes)
-
-
-
-
-
-
-
-
-
-
-
-
@@ -0,0 +1,229 @@
+### Interfacial_Oscillations_Automation_simulation_run, tailored for Paraview 5.8.1
+### Tracking of wave oscillations, interfacial area and kinetic energy in one pass over ALL time steps
+### to be run locally
+### Author: Juan Pablo Valdes,
+### First commit: October, 2026
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#####################################################################
+
+from paraview.simple import *
+from paraview import servermanager
+from vtkmodules.util.numpy_support import vtk_to_numpy
+from vtkmodules.vtkCommonCore import vtkIdList
+import numpy as np
+import os
+import sys
+import json
+from PV_sweep_engine import sweep
+
+### Segments (point id pairs) of the interface line returned by the slice, lines and polylines alike
+
+def line_segments(data):
+
+    ids = vtkIdList()
+    segments = []
+
+    for c in range(data.GetNumberOfCells()):
+        data.GetCellPoints(c, ids)
+        cell = [ids.GetId(k) for k in range(ids.GetNumberOfIds())]
+        segments.extend(zip(cell[:-1], cell[1:]))
+
+    return np.array(segments, dtype=np.int64).reshape(-1, 2)
+
+### Highest interface point crossing the plane x = x_probe, the point the former per-probe plane clip produced
+
+def wave_amplitude(points, segments, x_probe):
+
+    a = points[segments[:, 0]]
+    b = points[segments[:, 1]]
+    da = a[:, 0] - x_probe
+    db = b[:, 0] - x_probe
+
+    crossing = (da * db <= 0) & (da != db)
+    if not np.any(crossing) and not np.any(points[:, 0] == x_probe):
+        return None
+
+    t = da[crossing] / (da[crossing] - db[crossing])
+    z = a[crossing, 2] + t * (b[crossing, 2] - a[crossing, 2])
+    z = np.concatenate([z, points[points[:, 0] == x_probe, 2]])
+
+    return float(np.max(z))
+
+### Pipeline held by each sweep worker for all of its time steps
+
+def build(case_name, probes, calc_Ek, rho_l, rho_g):
+
+    pvdfile = f'VAR_{case_name}.pvd'
+
+    ### One reader for every quantity, each time step is read once and shared by all branches
+    case_data = PVDReader(FileName=pvdfile)
+    case_data.CellArrays = []
+    case_data.PointArrays = ['Interface', 'Velocity'] if calc_Ek else ['Interface']
+    case_data.ColumnArrays = []
+
+    print('Read data')
+
+    ### Interface contour shared by the wave probes and the interfacial area
+    contour1 = Contour(Input=case_data)
+    contour1.ContourBy = ['POINTS', 'Interface']
+    contour1.Isosurfaces = [0.0]
+    contour1.PointMergeMethod = 'Uniform Binning'
+
+    print('Made contour')
+
+    ### Wave amplitude: interface line on the mid plane, crossed with every probe plane in numpy
+    slice1 = Slice(Input=contour1)
+    slice1.SliceType = 'Plane'
+    slice1.HyperTreeGridSlicer = 'Plane'
+    slice1.SliceOffsetValues = [0.0]
+    slice1.SliceType.Origin = [7.0155, 7.0155, 7.0155]
+    slice1.HyperTreeGridSlicer.Origin = [7.0155, 7.0155, 7.0155]
+    slice1.SliceType.Normal = [0.0, 1.0, 0.0]
+
+    mergeBlocks = MergeBlocks(Input=slice1)
+    mergeBlocks.OutputDataSetType = 'Unstructured Grid'
+    mergeBlocks.MergePoints = 1
+    mergeBlocks.Tolerance = 0.0
+    mergeBlocks.ToleranceIsAbsolute = 0
+
+    print('Made slice')
+
+    ### Interfacial area within the cylinder
+    clip1 = Clip(Input=contour1)
+    clip1.ClipType = 'Cylinder'
+    clip1.HyperTreeGridClipper = 'Cylinder'
+    clip1.Scalars = ['POINTS', 'Interface']
+    clip1.ClipType.Axis = [0.0, 0.0, 1.0]
+    clip1.ClipType.Radius = 6.8
+
+    cellSize1 = CellSize(Input=clip1)
+
+    integrate_area = IntegrateVariables(Input=cellSize1)
+    integrate_area.DivideCellDataByVolume = 0
+
+    print('Made area clip')
+
+    ### Kinetic energy of the cylinder half beyond the mid plane
+    if calc_Ek:
+
+        rho_g = float(rho_g)
+        rho_l = float(rho_l)
+
+        clip2 = Clip(Input=case_data)
+        clip2.ClipType = 'Cylinder'
+        clip2.HyperTreeGridClipper = 'Cylinder'
+        clip2.Scalars = ['POINTS', 'Interface']
+        clip2.ClipType.Axis = [0.0, 0.0, 1.0]
+        clip2.ClipType.Radius = 6.8
+
+        clip3 = Clip(Input=clip2)
+        clip3.ClipType = 'Plane'
+        clip3.HyperTreeGridClipper = 'Plane'
+        clip3.Scalars = ['POINTS', 'Interface']
+        clip3.ClipType.Origin = [7.0155, 7.0155, 7.0155]
+        clip3.HyperTreeGridClipper.Origin = [7.0155, 7.0155, 7.0155]
+        clip3.Invert = 0
+
+        calculator1 = Calculator(Input=clip3)
+        calculator1.ResultArrayName = 'H'
+        calculator1.Function = '((Interface/abs(Interface))+1)/2'
+
+        calculator2 = Calculator(Input=calculator1)
+        calculator2.ResultArrayName = 'rho'
+        calculator2.Function = f'{rho_g} + ({rho_l} - {rho_g})*H'
+
+        calculator3 = Calculator(Input=calculator2)
+        calculator3.ResultArrayName = 'Ek'
+        calculator3.Function = '(1/2)*(rho)*(mag(Velocity)^2)'
+
+        integrate_Ek = IntegrateVariables(Input=calculator3)
+        integrate_Ek.DivideCellDataByVolume = 0
+
+        print('Made kinetic energy calculators')
+
+    animationScene1 = GetAnimationScene()
+    animationScene1.UpdateAnimationUsingDataTimeSteps()
+
+    return {'probes': probes, 'case_data': case_data, 'mergeBlocks': mergeBlocks, 'integrate_area': integrate_area,
+            'integrate_Ek': integrate_Ek if calc_Ek else None, 'scene': animationScene1}
+
+### Wave amplitudes, interfacial area and kinetic energy at one time step
+
+def step(state, i):
+
+    state['scene'].AnimationTime = i
+
+    UpdatePipeline(time=i, proxy=state['case_data'])
+
+    ### Wave amplitudes at every probe from a single fetch of the interface line
+    UpdatePipeline(time=i, proxy=state['mergeBlocks'])
+    line = servermanager.Fetch(state['mergeBlocks'])
+    points = vtk_to_numpy(line.GetPoints().GetData()).astype(np.float64)
+    segments = line_segments(line)
+
+    aks = [wave_amplitude(points, segments, x_probe) for x_probe in state['probes']]
+
+    UpdatePipeline(time=i, proxy=state['integrate_area'])
+    integrate_object = servermanager.Fetch(state['integrate_area'])
+    area = float(integrate_object.GetCellData().GetArray('Area').GetValue(0))
+
+    Ek = None
+    if state['integrate_Ek'] is not None:
+        UpdatePipeline(time=i, proxy=state['integrate_Ek'])
+        integrate_object = servermanager.Fetch(state['integrate_Ek'])
+        Ek = float(np.array(integrate_object.GetPointData().GetArray('Ek')).ravel()[0])
+
+    print('Calculated wave amplitudes, interfacial area' + (' and kinetic energy' if Ek is not None else '') + ' at time = '+str(i))
+
+    return aks, area, Ek
+
+def pvpy(HDpath, case_name, probes, rho_l=None, rho_g=None):
+
+    path = os.path.join(HDpath,case_name,'postProcessing')
+    os.chdir(path)
+
+    calc_Ek = rho_l is not None and rho_g is not None
+
+    t_ini = 0
+    t_fin = 100
+    time_list = [float(i) for i in range(t_ini,t_fin+1,1)]
+
+    print('Entering time loop')
+
+    ### Time steps sharded across the sweep workers, merged back in time order
+    results = sweep(build, step, range(t_ini,t_fin+1,1), args=(case_name, probes, calc_Ek, rho_l, rho_g))
+
+    ak_lists = [[aks[n] for aks, _, _ in results] for n in range(len(probes))]
+    area_list = [area for _, area, _ in results]
+    Ek_list = [Ek for _, _, Ek in results]
+
+    value_to_add = {'Time': time_list}
+    for n, ak_list in enumerate(ak_lists):
+        value_to_add[f'ak{n}'] = ak_list
+    value_to_add['Int_area'] = area_list
+
+    if calc_Ek:
+        ### Initial kinetic energy reported as zero, as in PV_io_Ek
+        Ek_list[0] = 0.0
+        value_to_add['Ek'] = Ek_list
+
+    value_json = json.dumps([value_to_add])
+
+    return value_json
+
+if __name__ == "__main__":
+
+    HDpath = sys.argv[1]
+
+    case_name = sys.argv[2]
+
+    ### Comma separated x locations of the wave probes, named ak0, ak1, ... in that order
+    probes = [float(x) for x in sys.argv[3].split(',')]
+
+    rho_l = sys.argv[4] if len(sys.argv) > 5 else None
+    rho_g = sys.argv[5] if len(sys.argv) > 5 else None
+
+    df_bytes = pvpy(HDpath, case_name, probes, rho_l, rho_g)
+
+    print(df_bytes)
@@ -13,17 +13,14 @@ import os
 import glob
 import shutil
 import json
+from PV_sweep_engine import sweep
 
-def pvpy(HDpath,case_name):
+### Pipeline held by each sweep worker for all of its time steps, built once instead of once per time step
 
-    path = os.path.join(HDpath,case_name,'postProcessing')
-    os.chdir(path)
+def build(case_name):
 
-    pvdfiles = glob.glob('VAR_*_time=*.pvd')
     pvdfile = f'VAR_{case_name}.pvd'
 
-    timestep = int(glob.glob('VAR_*_*.vtr')[0].split("_")[-1].split(".")[0])
-
     case_data = PVDReader(FileName=pvdfile)
     case_data.CellArrays = []
     case_data.PointArrays = ['Interface']
@@ -31,70 +28,65 @@ def pvpy(HDpath,case_name):
 
     print('Read data')
 
-    t_ini = 0
-    t_fin = 100
+    contour1 = Contour(Input=case_data)
+    contour1.ContourBy = ['POINTS', 'Interface']
+    contour1.Isosurfaces = [0.0]
+    contour1.PointMergeMethod = 'Uniform Binning'
 
-    area_list = []
-    time_list = []
+    print('Made contour')
 
-    print('Entering time loop')
+    clip1 = Clip(Input=contour1)
+    clip1.ClipType = 'Cylinder'
+    clip1.HyperTreeGridClipper = 'Cylinder'
+    clip1.Scalars = ['POINTS', 'Interface']
+    clip1.ClipType.Axis = [0.0, 0.0, 1.0]
+    clip1.ClipType.Radius = 6.8
 
-    for i in range(t_ini,t_fin+1,1):
+    print('Made clip')
 
-        contour1 = Contour(Input=case_data)
-        contour1.ContourBy = ['POINTS', 'Interface']
-        contour1.Isosurfaces = [0.0]
-        contour1.PointMergeMethod = 'Uniform Binning'
+    cellSize1 = CellSize(Input=clip1)
 
-        print('Made contour')
+    print('Calculated cell sizes')
 
-        UpdatePipeline(time=i, proxy=contour1)
+    integrateVariables1 = IntegrateVariables(registrationName='IntegrateVariables1', Input=cellSize1)
+    integrateVariables1.DivideCellDataByVolume = 0
 
-        clip1 = Clip(Input=contour1)
-        clip1.ClipType = 'Cylinder'
-        clip1.HyperTreeGridClipper = 'Cylinder'
-        clip1.Scalars = ['POINTS', 'Interface']
-        clip1.ClipType.Axis = [0.0, 0.0, 1.0]
-        clip1.ClipType.Radius = 6.8
+    animationScene1 = GetAnimationScene()
 
-        print('Made clip')
+    # update animation scene based on data timesteps
+    animationScene1.UpdateAnimationUsingDataTimeSteps()
 
-        UpdatePipeline(time=i, proxy=clip1)
+    return {'case_data': case_data, 'integrate': integrateVariables1, 'scene': animationScene1}
 
-        cellSize1 = CellSize(Input=clip1)
+### Interfacial area at one time step
 
-        print('Calculated cell sizes')
+def step(state, i):
 
-        UpdatePipeline(time=timestep, proxy=cellSize1)
+    # Properties modified on animationScene1
+    state['scene'].AnimationTime = i
 
-        animationScene1 = GetAnimationScene()
+    UpdatePipeline(time=i, proxy=state['case_data'])
 
-        # update animation scene based on data timesteps
-        animationScene1.UpdateAnimationUsingDataTimeSteps()
+    UpdatePipeline(time=i, proxy=state['integrate'])
+    integrate_object = paraview.servermanager.Fetch(state['integrate'])
+    area = integrate_object.GetCellData().GetArray('Area').GetValue(0)
+    print('Calculated interfacial area at time = '+str(i))
 
-        # Properties modified on animationScene1
-        animationScene1.AnimationTime = i
+    return float(area)
 
-        # get the time-keeper
-        timeKeeper1 = GetTimeKeeper()
+def pvpy(HDpath,case_name):
 
-        UpdatePipeline(time=i, proxy=case_data)
+    path = os.path.join(HDpath,case_name,'postProcessing')
+    os.chdir(path)
 
-        UpdatePipeline(time=i, proxy=cellSize1)
+    t_ini = 0
+    t_fin = 100
 
-        integrateVariables1 = IntegrateVariables(registrationName='IntegrateVariables1', Input=cellSize1)
-        integrateVariables1.DivideCellDataByVolume = 0
-        UpdatePipeline(time=i, proxy=integrateVariables1)
-        integrate_object = paraview.servermanager.Fetch(integrateVariables1)
-        area = integrate_object.GetCellData().GetArray('Area').GetValue(0)
-        time = np.full((1, 1), i)
-        area = np.full((1, 1), area)
-        area_list.append(area)
-        time_list.append(time)
-        print('Calculated interfacial area at time = '+str(i))
+    print('Entering time loop')
 
-    area_floats = [float(x) for x in area_list]
-    time_floats = [float(x) for x in time_list]
+    ### Time steps sharded across the sweep workers, merged back in time order
+    area_floats = sweep(build, step, range(t_ini,t_fin+1,1), args=(case_name,))
+    time_floats = [float(x) for x in range(t_ini,t_fin+1,1)]
     value_to_add = [{'Time':time_floats, 'Int_area':area_floats}]
     value_json = json.dumps(value_to_add)
         
@@ -109,15 +101,3 @@ if __name__ == "__main__":
     df_bytes = pvpy(HDpath,case_name)
 
     print(df_bytes)
-
-
-
-
-
-
-
-
-
-
-
-
@@ -13,6 +13,7 @@ import os
 import glob
 import pandas as pd
 import sys
+from PV_DSD_engine import droplet_volumes
 
 
 def pvdropDSD(HDpath,case_name):
@@ -68,35 +69,10 @@ def pvdropDSD(HDpath,case_name):
     connectivity.RegionIdAssignmentMode = 'Unspecified'
     connectivity.ClosestPoint = [0.0, 0.0, 0.0]
 
-    # create a new 'Threshold'
-    threshold1 = Threshold(registrationName='Threshold1', Input=connectivity)
-    threshold1.Scalars = ['POINTS', 'RegionId']
-
-    # find lower and upper bound indices of droplet list
-    region_range = connectivity.CellData.GetArray(0).GetRange()
-
     print('Merge blocks, clip and connectivity performed correctly')
 
-    lower_bound = int(region_range[0])
-    upper_bound = int(region_range[1])
-
-
-    volume_list = []
-
-    for j in range(lower_bound, upper_bound+1):
-
-        threshold1.UpperThreshold = j
-        threshold1.LowerThreshold = j
-
-        # create a new 'Integrate Variables'
-        integrateVariables1 = IntegrateVariables(registrationName='IntegrateVariables1', Input=threshold1)
-        integrateVariables1.DivideCellDataByVolume = 0
-
-        volume_object = paraview.servermanager.Fetch(integrateVariables1)
-        volume = volume_object.GetCellData().GetArray('Volume').GetValue(0)
-        volume_list.append(volume)
-
-    volume_floats = [float(x) for x in volume_list]
+    # all droplet volumes from one fetch of the connectivity output, region 0 included
+    volume_floats = droplet_volumes(connectivity)
 
     volume_df = pd.DataFrame(volume_floats, columns=['Volume'])
 
@@ -0,0 +1,117 @@
+### SMX_Automation_simulation_run, tailored for Paraview 5.10
+### Slice profile engine: area-weighted averages over any number of axial/vertical stations from one fetch of the field
+### to be imported by the single phase pvpython scripts in this folder
+### Author: Juan Pablo Valdes,
+### First commit: October, 2026
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import numpy as np
+
+
+### Per cell extent along the profile axis, cross-section area and point values averaged on its two end faces
+### Replaces moving one Slice plane and creating one IntegrateVariables + Fetch per station
+
+def cell_table(source, arrays, axis):
+
+    from paraview.simple import CellSize, Delete
+    from paraview import servermanager
+    from vtkmodules.util.numpy_support import vtk_to_numpy
+
+    # volume of every cell, fetched once with the point fields to be profiled
+    cell_size = CellSize(Input=source)
+    cell_size.ComputeVertexCount = 0
+    cell_size.ComputeLength = 0
+    cell_size.ComputeArea = 0
+    cell_size.ComputeVolume = 1
+    cell_size.ComputeSum = 0
+
+    data = servermanager.Fetch(cell_size)
+    Delete(cell_size)
+
+    if data.GetNumberOfCells() == 0:
+        return None
+
+    cells = data.GetCells()
+    offsets = vtk_to_numpy(cells.GetOffsetsArray()).astype(np.int64)
+    connectivity = vtk_to_numpy(cells.GetConnectivityArray()).astype(np.int64)
+    coords = vtk_to_numpy(data.GetPoints().GetData())[:, axis].astype(np.float64)
+    volume = vtk_to_numpy(data.GetCellData().GetArray('Volume')).astype(np.float64)
+
+    points = {name: vtk_to_numpy(data.GetPointData().GetArray(name)).astype(np.float64) for name in arrays}
+
+    return face_table(offsets, connectivity, coords, volume, points)
+
+### Pure numpy part of cell_table, from VTK offsets/connectivity arrays
+
+def face_table(offsets, connectivity, coords, volume, points):
+
+    starts = offsets[:-1]
+    cell_coords = coords[connectivity]
+
+    lo = np.minimum.reduceat(cell_coords, starts)
+    hi = np.maximum.reduceat(cell_coords, starts)
+
+    # points of each cell lying on its lower and upper faces along the axis
+    tol = 1e-9 * max(float(coords.max() - coords.min()), 1e-300)
+    counts = np.diff(offsets)
+    at_lo = cell_coords <= np.repeat(lo, counts) + tol
+    at_hi = cell_coords >= np.repeat(hi, counts) - tol
+    n_lo = np.add.reduceat(at_lo.astype(np.float64), starts)
+    n_hi = np.add.reduceat(at_hi.astype(np.float64), starts)
+
+    lo_values, hi_values = {}, {}
+    for name, values in points.items():
+        cell_values = values[connectivity]
+        w_lo = at_lo if cell_values.ndim == 1 else at_lo[:, None]
+        w_hi = at_hi if cell_values.ndim == 1 else at_hi[:, None]
+        n_l = n_lo if cell_values.ndim == 1 else n_lo[:, None]
+        n_h = n_hi if cell_values.ndim == 1 else n_hi[:, None]
+        lo_values[name] = np.add.reduceat(np.where(w_lo, cell_values, 0.0), starts, axis=0) / n_l
+        hi_values[name] = np.add.reduceat(np.where(w_hi, cell_values, 0.0), starts, axis=0) / n_h
+
+    extent = hi - lo
+    area = np.divide(volume, extent, out=np.zeros_like(volume), where=extent > 0)
+
+    return {'lo': lo, 'hi': hi, 'area': area, 'lo_values': lo_values, 'hi_values': hi_values}
+
+### Area-weighted average of every array at each station, a station cutting a cell over [lo, hi)
+### Values are interpolated between the two end faces, exact for unclipped hexahedra with trilinear fields
+
+def profiles(table, stations):
+
+    stations = np.asarray(stations, dtype=np.float64)
+    n_stations = len(stations)
+
+    first = np.searchsorted(stations, table['lo'], side='left')
+    last = np.searchsorted(stations, table['hi'], side='left')
+    n_cut = np.where(table['hi'] > table['lo'], last - first, 0)
+
+    cut_cells = np.repeat(np.arange(len(n_cut)), n_cut)
+    block_start = np.repeat(np.cumsum(n_cut) - n_cut, n_cut)
+    station = np.repeat(first, n_cut) + (np.arange(len(cut_cells)) - block_start)
+
+    lo = table['lo'][cut_cells]
+    t = (stations[station] - lo) / (table['hi'][cut_cells] - lo)
+    weight = table['area'][cut_cells]
+
+    area = np.bincount(station, weights=weight, minlength=n_stations)
+
+    averages = {}
+    for name, lo_values in table['lo_values'].items():
+        lo_v = lo_values[cut_cells]
+        hi_v = table['hi_values'][name][cut_cells]
+        tt = t if lo_v.ndim == 1 else t[:, None]
+        ww = weight if lo_v.ndim == 1 else weight[:, None]
+        values = ((1 - tt) * lo_v + tt * hi_v) * ww
+        if values.ndim == 1:
+            sums = np.bincount(station, weights=values, minlength=n_stations)
+        else:
+            sums = np.stack([np.bincount(station, weights=values[:, c], minlength=n_stations)
+                             for c in range(values.shape[1])], axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            averages[name] = sums / (area if sums.ndim == 1 else area[:, None])
+
+    return area, averages
@@ -13,11 +13,12 @@ import glob
 import pandas as pd
 import sys
 import numpy as np
+from PV_profile_engine import cell_table, profiles
 
 np.set_printoptions(threshold=sys.maxsize)
 
 
-def pvspPP(HDpath,case_name,len,rad):
+def pvspPP(HDpath,case_name,len,rad,n_datap=100):
 
     # find source, modify PVD file to be read and set it to last timestep saved as vtr.
     path = os.path.join(HDpath,case_name)  
@@ -157,84 +158,24 @@ output.PointData.append(u,'u')"""
 
     UpdatePipeline(time=timestep, proxy=threshold1)
     
-    ### LOOPING TO CALCULATE HYDRODYNAMICS ACROSS THE LENGTH OF THE MIXER
+    ### HYDRODYNAMICS ACROSS THE LENGTH OF THE MIXER
 
-    n_datap = 100
     ini = L/n_datap
     L_range = np.linspace(ini,L-ini,n_datap)
 
-    # Slice 1 to extract cross-sectional hydrodynamic values
-    slice1 = Slice(registrationName='Slice1', Input=threshold1)
-    slice1.SliceType = 'Plane'
-    slice1.HyperTreeGridSlicer = 'Plane'
-    slice1.UseDual = 0
-    slice1.Crinkleslice = 0
-    slice1.Triangulatetheslice = 1
-    slice1.Mergeduplicatedpointsintheslice = 1
-    slice1.SliceOffsetValues = [0.0]
-
-    ### 
-    slice1.SliceType.Origin = [ini, R, R]
-    slice1.SliceType.Normal = [1.0, 0.0, 0.0]
-    slice1.SliceType.Offset = 0.0
-
-    UpdatePipeline(time=timestep, proxy=slice1)
-
-
-    # Features to be extracted
-    emax_list = []
-    Q_list = []
-    ediss_list = []
-    gamma_list = []
-    P_list = []
-    u_list = []
-    L_list = []
-
-    ### Looping data extraction for n_datap points across the mixer's length
-    for i in L_range:
-
-        # Advance the slice across the mixer
-        slice1.SliceType.Origin = [i, R, R]
-
-        # Update changes
-        UpdatePipeline(time=timestep, proxy=slice1)
-
-        # create a new 'Integrate Variables' in slice 1 to extract cross-sectional average hydrodynamical features
-        integrateVariables1 = IntegrateVariables(registrationName='IntegrateVariables1', Input=slice1)
-        integrateVariables1.DivideCellDataByVolume = 1
-        UpdatePipeline(time=timestep, proxy=integrateVariables1)
-
-        # Extract flow data objects
-        flow_object = paraview.servermanager.Fetch(integrateVariables1)
-        area = flow_object.GetCellData().GetArray('Area').GetValue(0)
-        
-        # Extract features
-        variables_to_extract = ['emax', 'Q', 
-                                'Ediss', 
-                                'Gamma', 'Pres', 'u']
-        values_A = {var: flow_object.GetPointData().GetArray(var).GetValue(0) 
-                    for var in variables_to_extract}
-
-        # Compute area averaged value
-        emax = values_A['emax']/area
-        Q = values_A['Q']/area
-        ediss = values_A['Ediss']/area
-        gamma = values_A['Gamma']/area
-        P = values_A['Pres']/area
-        u = values_A['u']/area
-
-        # Save to list
-        emax_list.append(emax)
-        Q_list.append(Q)
-        ediss_list.append(ediss)
-        gamma_list.append(gamma)
-        P_list.append(P)
-        u_list.append(u)
-        L_list.append(i)
-
-    data = {'Length': L_list, 'e_max':emax_list, 
-            'Q': Q_list, 'E_diss':ediss_list, 'Gamma': gamma_list, 
-            'Pressure': P_list, 'Velocity': u_list}
+    # Thresholded field fetched once, cells binned by axial position for every station in one pass
+    variables_to_extract = ['emax', 'Q', 'Ediss', 'Gamma', 'Pres', 'u']
+    table = cell_table(threshold1, variables_to_extract, axis=0)
+
+    if table is None:
+        raise ValueError('Threshold output is empty, no cross-section to profile')
+
+    area, values_A = profiles(table, L_range)
+
+    # area averaged values at each station, u as its axial component
+    data = {'Length': L_range.tolist(), 'e_max': values_A['emax'].tolist(), 
+            'Q': values_A['Q'].tolist(), 'E_diss': values_A['Ediss'].tolist(), 'Gamma': values_A['Gamma'].tolist(), 
+            'Pressure': values_A['Pres'].tolist(), 'Velocity': values_A['u'][:, 0].tolist()}
     
     df = pd.DataFrame(data)
 
@@ -255,6 +196,9 @@ if __name__ == "__main__":
 
     R = sys.argv[4]
 
-    df_bytes = pvspPP(HDpath,case_name, L, R)
+    # optional number of stations along the mixer, 100 as before
+    n_datap = int(sys.argv[5]) if len(sys.argv) > 5 else 100
+
+    df_bytes = pvspPP(HDpath,case_name, L, R, n_datap)
 
     print(df_bytes)
@@ -13,6 +13,72 @@ import numpy as np
 import os 
 import glob
 import shutil
+from PV_DSD_engine import droplet_volumes
+from PV_sweep_engine import sweep
+
+### Pipeline held by each sweep worker, its reader pointed at the PVD of every new time step
+
+def build(case_name):
+    return {'case_name': case_name, 'case_data': None, 'connectivity': None}
+
+### Droplet volumes at one time step
+
+def step(state, t_idx):
+
+    case_name = state['case_name']
+    pvdfile0 = f'VAR_{case_name}_time=0.00000E+00.pvd'
+    # one PVD per time step, workers sharing the case folder never overwrite each other's file
+    pvdfile = f'VAR_DSD_{case_name}_{t_idx}.pvd'
+    old_suf = "_0.vtr"
+    new_suf = f"_{t_idx}.vtr"
+
+    with open(pvdfile0,"r") as input_file:
+        lines = input_file.readlines()
+
+    ### modify a pvdfile with the new time step ###
+    updated_lines = []
+    for line in lines:
+        if old_suf in line:
+            updated_line = line.replace(old_suf, new_suf)
+            updated_lines.append(updated_line)
+        else:
+            updated_lines.append(line)
+
+    with open(pvdfile, "w") as output_file:
+        output_file.writelines(updated_lines)
+    
+    if t_idx % 100 == 0:
+        print(f'{t_idx}: PVD file modified correctly.') 
+
+    ### paraview onwards, built on the first time step of the worker and reused after ###
+    if state['case_data'] is None:
+        case_data = PVDReader(FileName=pvdfile)
+        mergeBlocks = MergeBlocks(Input=case_data)
+
+        clip = Clip(Input=mergeBlocks)
+        clip.Scalars = ['POINTS', 'Interface']
+        clip.ClipType = 'Scalar'
+        clip.Value = 0.0
+        clip.Invert = 1   
+
+        # tag droplets as connected regions
+        connectivity = Connectivity(Input=clip)
+        connectivity.RegionIdAssignmentMode = 'Cell Count Descending'
+
+        state['case_data'] = case_data
+        state['connectivity'] = connectivity
+    else:
+        state['case_data'].FileName = pvdfile
+
+    # all droplet volumes from one fetch of the connectivity output, skipping region 0 (continuous phase)
+    volume_floats = droplet_volumes(state['connectivity'], first_region=1)
+
+    os.remove(pvdfile)
+
+    if t_idx % 100 == 0:
+        print(f'Volumes at snaps {t_idx} extracted.')
+
+    return volume_floats
 
 if __name__ == "__main__":
 
@@ -27,92 +93,24 @@ if __name__ == "__main__":
     pvdfiles = glob.glob('VAR_*_time=*.pvd')
     times = sorted([float(filename.split('=')[-1].split('.pvd')[0]) for filename in pvdfiles])
 
+    ### snaps from 320 onwards are processed, sharded across the sweep workers and merged back in time order
+    swept = [t_idx for t_idx in range(len(times)) if t_idx >= 320]
+    volumes = dict(zip(swept, sweep(build, step, swept, args=(case_name,))))
+
     DSD_list = []
     for t_idx,t in enumerate(times):
 
         if t_idx < 320:
             value_to_add = {'Time': t, 'Volumes': [], 'Nd': 0}
-
         else:
-            pvdfile0 = f'VAR_{case_name}_time=0.00000E+00.pvd'
-            shutil.copy(pvdfile0, f'VAR_DSD_{case_name}.pvd')
-            pvdfile = f'VAR_DSD_{case_name}.pvd'
-            old_suf = "_0.vtr"
-            new_suf = f"_{t_idx}.vtr"
-
-            with open(pvdfile0,"r") as input_file:
-                lines = input_file.readlines()
-
-            ### modify a pvdfile with the new time step ###
-            updated_lines = []
-            for line in lines:
-                if old_suf in line:
-                    updated_line = line.replace(old_suf, new_suf)
-                    updated_lines.append(updated_line)
-                else:
-                    updated_lines.append(line)
-
-            with open(pvdfile, "w") as output_file:
-                output_file.writelines(updated_lines)
-            
-            if t_idx % 100 == 0:
-                print(f'{t_idx}: PVD file modified correctly.') 
-
-            ### paraview onwards ###
-            case_data = PVDReader(FileName=pvdfile)
-            mergeBlocks = MergeBlocks(Input=case_data)
-
-            clip = Clip(Input=mergeBlocks)
-            clip.Scalars = ['POINTS', 'Interface']
-            clip.ClipType = 'Scalar'
-            clip.Value = 0.0
-            clip.Invert = 1   
-
-            # tag droplets as connected regions
-            connectivity = Connectivity(Input=clip)
-            connectivity.RegionIdAssignmentMode = 'Cell Count Descending'
-
-            # find lower and upper bound indices of droplet list
-            region = paraview.servermanager.Fetch(connectivity)
-            region_range = region.GetCellData().GetArray('RegionId').GetRange()
-
-            threshold = Threshold(Input=connectivity)
-            threshold.Scalars = ['POINTS', 'RegionId']
-            
-            # create new IntegrateVariables
-            integral = IntegrateVariables(Input=threshold)
-
-            lower_bound = int(region_range[0]+1)
-            upper_bound = int(region_range[1])
-
-            volume_list = []
-            for i in range(lower_bound, upper_bound+1):
-                # select individual droplet
-                threshold.LowerThreshold = i
-                threshold.UpperThreshold = i
-                threshold.ThresholdMethod = 'Between'
-                # threshold.ThresholdRange = [i, i]
-
-                # collect data
-                data_object = paraview.servermanager.Fetch(integral)
-                volume = data_object.GetCellData().GetArray('Volume').GetValue(0)
-                volume_list.append(volume)    
-            # volume_list = [1e-9, 6.7e-11, 5.8e-10]
-            volume_floats = [float(x) for x in volume_list]
-            volume_count = len(volume_list)
+            volume_floats = volumes[t_idx]
+            volume_count = len(volume_floats)
             value_to_add = {'Time': t, 'Volumes': volume_floats, 'Nd': volume_count}
-
-            if t_idx % 100 == 0:
-                print(f'Volumes at snaps {t_idx} extracted.')
             
         DSD_list.append(value_to_add)
-
-        Disconnect()
-        Connect()
     
     print('Volume for all time steps extracted correctly from integrate variables.')
     df_DSD = pd.DataFrame(DSD_list, columns=['Time','Volumes', 'Nd'])
     df_json = df_DSD.to_json(orient='split', double_precision=15)
         
     print(df_json)
-
@@ -11,6 +11,7 @@ import sys
 import pandas as pd
 import os 
 import glob
+from PV_DSD_engine import droplet_volumes
 
 if __name__ == "__main__":
 
@@ -60,34 +61,9 @@ if __name__ == "__main__":
     connectivity = Connectivity(Input=clip)
     connectivity.RegionIdAssignmentMode = 'Cell Count Descending'
 
-    # find lower and upper bound indices of droplet list
-    region = paraview.servermanager.Fetch(connectivity)
-    region_range = region.GetCellData().GetArray('RegionId').GetRange()
-
-    threshold = Threshold(Input=connectivity)
-    threshold.Scalars = ['POINTS', 'RegionId']
-    
-    # create new IntegrateVariables
-    integral = IntegrateVariables(Input=threshold)
-
-    lower_bound = int(region_range[0]+1)
-    upper_bound = int(region_range[1])
-
-    volume_list = []
-    for i in range(lower_bound, upper_bound+1):
-        # select individual droplet
-        threshold.LowerThreshold = i
-        threshold.UpperThreshold = i
-        threshold.ThresholdMethod = 'Between'
-        # threshold.ThresholdRange = [i, i]
-
-        # collect data
-        data_object = paraview.servermanager.Fetch(integral)
-        volume = data_object.GetCellData().GetArray('Volume').GetValue(0)
-        volume_list.append(volume)    
-
-    volume_floats = [float(x) for x in volume_list]
-    volume_count = len(volume_list)
+    # all droplet volumes from one fetch of the connectivity output, skipping region 0 (continuous phase)
+    volume_floats = droplet_volumes(connectivity, first_region=1)
+    volume_count = len(volume_floats)
     value_to_add = [{'Volume':volume_floats, 'Nd':volume_count}]
 
     volume_df = pd.DataFrame(value_to_add, columns=['Volume', 'Nd'])
@@ -12,6 +12,7 @@ import pandas as pd
 import numpy as np
 import os 
 import glob
+from PV_profile_engine import cell_table, profiles
 
 if __name__ == "__main__":
 
@@ -22,6 +23,8 @@ if __name__ == "__main__":
     R = 0.025
     H = 0.051
     C = float(sys.argv[3])
+    # optional number of heights profiled, 100 as before
+    n_slices = int(sys.argv[4]) if len(sys.argv) > 4 else 100
 
     path = os.path.join(HDpath,case_name)
     os.chdir(path)
@@ -127,77 +130,25 @@ output.PointData.append(U,'U')
 
     UpdatePipeline(time=timestep, proxy=clip)
 
-    ### Looping to get hydrodynamics across the height of cylinder ###
-    n_slices = 100
+    ### Hydrodynamics across the height of cylinder ###
     ini = 0.05/n_slices
     H_range = np.linspace(ini,0.05-ini,n_slices)
 
-    # slice to extract cross-sectional hydropdynamic value ###
-    slice = Slice(Input=clip)
-    slice.SliceType = 'Plane'
-    slice.HyperTreeGridSlicer = 'Plane'
-    slice.UseDual = 0
-    slice.Crinkleslice = 0
-    slice.Triangulatetheslice = 1
-    slice.Mergeduplicatedpointsintheslice = 1
-    slice.SliceOffsetValues = [0.0]
-
-    ###
-    slice.SliceType.Origin = [H/2, H/2, ini]
-    slice.SliceType.Normal = [0.0, 0.0, 1.0]
-
-    UpdatePipeline(time=timestep, proxy=slice)
-
-    ### Features to be extracted ###
-    Q_list = []
-    P_list = []
-    Ur_list = []
-    Uth_list = []
-    Uz_list = []
-    H_list = []
-
-    for i in H_range:
-
-        ### moving up the slice ###
-        slice.SliceType.Origin = [H/2, H/2, i]
-
-        # update change
-        UpdatePipeline(time=timestep, proxy=slice)
-
-        ### create a new 'Integrate Varaibles' in slice to extract features ###
-        integrateVariables = IntegrateVariables(Input=slice)
-        integrateVariables.DivideCellDataByVolume = 1
-        UpdatePipeline(time=timestep, proxy=integrateVariables)
-
-        # Extract flow data objects
-        flow_object = paraview.servermanager.Fetch(integrateVariables)
-        area = flow_object.GetCellData().GetArray('Area').GetValue(0)
-
-        # Extract features: values
-        values_to_extract = ['Q', 'Pres']
-        values_A = {var: flow_object.GetPointData().GetArray(var).GetValue(0) 
-                    for var in values_to_extract}
-        # Extract features: tuples
-        tuples_to_extract = ['U']
-        n_Elements = flow_object.GetPointData().GetArray('U').GetNumberOfComponents()
-        tuples_A = {'U': [flow_object.GetPointData().GetArray('U').GetValue(i)
-                    for i in range(n_Elements)]
-                    }
-        
-        # compute the area average value
-        Q = values_A['Q']/area
-        P = values_A['Pres']/area
-        Ur = tuples_A['U'][0]/area
-        Uth = tuples_A['U'][1]/area
-        Uz = tuples_A['U'][2]/area
+    # clipped field fetched once, cells binned by height for every slice position in one pass
+    table = cell_table(clip, ['Q', 'Pres', 'U'], axis=2)
 
-        # save to list
-        H_list.append(i)
-        Q_list.append(Q)
-        P_list.append(P)
-        Ur_list.append(Ur)
-        Uth_list.append(Uth)
-        Uz_list.append(Uz)
+    if table is None:
+        raise ValueError('Clip output is empty, no cross-section to profile')
+
+    area, values_A = profiles(table, H_range)
+
+    # area averaged values at each height
+    H_list = H_range.tolist()
+    Q_list = values_A['Q'].tolist()
+    P_list = values_A['Pres'].tolist()
+    Ur_list = values_A['U'][:, 0].tolist()
+    Uth_list = values_A['U'][:, 1].tolist()
+    Uz_list = values_A['U'][:, 2].tolist()
 
     print('Flow features extracted correctly from vertical slices.')
 
@@ -0,0 +1,68 @@
+### SMX_Automation_simulation_run, tailored for Paraview 5.10
+### Time-sweep engine: time steps of a per-timestep script sharded across a pool of pvpython worker processes
+### to be imported by the pvpython scripts looping over time steps in this folder
+### Author: Juan Pablo Valdes,
+### First commit: October, 2026
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import sys
+import multiprocessing as mp
+
+
+### Pipeline built once per worker by build(*args) and the per time step function applied to it
+_state = None
+_step = None
+
+def _init_worker(build, step, args):
+    global _state, _step
+    _state = build(*args)
+    _step = step
+
+def _run_shard(shard):
+    results = [_step(_state, t) for t in shard]
+    # progress printed by the worker reaches the log before the parent prints its JSON line
+    sys.stdout.flush()
+    return results
+
+### Number of worker processes, PV_SWEEP_WORKERS in the environment or every core
+
+def sweep_workers():
+    return max(1, int(os.environ.get('PV_SWEEP_WORKERS', os.cpu_count() or 1)))
+
+### Contiguous shards of the time steps, a few per worker so uneven steps balance out
+
+def shards(times, workers, per_worker=4):
+    n = min(len(times), workers * per_worker)
+    size, extra = divmod(len(times), n)
+    out, start = [], 0
+    for k in range(n):
+        end = start + size + (1 if k < extra else 0)
+        out.append(times[start:end])
+        start = end
+    return out
+
+### Applying step(state, t) to every time step, state = build(*args) held by each worker for all of its steps
+### Results are returned in time order, the same list the serial loop would build
+
+def sweep(build, step, times, args=(), workers=None):
+
+    times = list(times)
+    workers = min(workers or sweep_workers(), len(times))
+
+    if workers <= 1:
+        state = build(*args)
+        return [step(state, t) for t in times]
+
+    # buffered output would otherwise be duplicated in every forked worker
+    sys.stdout.flush()
+
+    # fork: each worker inherits the imported paraview modules and builds its own pipeline in its own server
+    ctx = mp.get_context('fork')
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(build, step, args)) as pool:
+        results = pool.map(_run_shard, shards(times, workers), chunksize=1)
+
+    return [value for shard in results for value in shard]
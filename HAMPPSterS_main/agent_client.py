@@ -0,0 +1,191 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Local client of HPC_agent.py, multiplexing the remote calls of every run over one SSH channel
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import json
+import time
+import atexit
+import itertools
+import threading
+import paramiko
+from concurrent.futures import Future, TimeoutError
+from ssh_pool import ssh_pool
+from hpc_protocol import RESULT_PREFIX, parse_result
+
+
+################################################################################### HPC AGENT CLIENT ################################################################################
+
+class AgentClient:
+    """Starts HPC_agent.py once over a pooled SSH session and matches its responses to concurrent requests by id"""
+
+    class AgentUnavailable(Exception):
+        """Exception class for an agent that could not be started or did not answer in time, callers fall back to one-shot commands"""
+        def __init__(self, message="HPC agent could not be started"):
+            self.message = message
+            super().__init__(self.message)
+
+    ### Seconds allowed for the agent to import its modules and answer the handshake
+    start_timeout = 120
+
+    ### Seconds before trying to start the agent again after a failed start
+    retry_interval = 300
+
+    def __init__(self, local_path, usr, main_path, workers=4, agent_script='HPC_agent.py') -> None:
+
+        self.local_path = local_path
+        self.usr = usr
+        self.main_path = main_path
+        self.workers = workers
+        self.agent_script = agent_script
+
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._stdin = None
+        self._alive = False
+        self._failed_at = None
+
+        self.stats = {'starts': 0, 'failed_starts': 0, 'requests': 0, 'timeouts': 0}
+
+    ### Opening the agent channel and waiting for its ready record, called with the lock held
+
+    def _start(self, log=None):
+
+        if self._failed_at is not None and time.time() - self._failed_at < self.retry_interval:
+            raise AgentClient.AgentUnavailable('HPC agent failed to start recently, not retrying yet')
+
+        command = f'python {self.main_path}/{self.agent_script} --workers {self.workers}'
+
+        try:
+            stdin, stdout, stderr = ssh_pool.exec_command(self.local_path, self.usr, command, log)
+            ### Tracebacks from the agent itself arrive on the same stream and are skipped by the reader
+            stdout.channel.set_combine_stderr(True)
+        except (paramiko.SSHException, OSError) as e:
+            self._failed_at = time.time()
+            self.stats['failed_starts'] += 1
+            raise AgentClient.AgentUnavailable(f'HPC agent channel could not be opened: {e}')
+
+        ready = Future()
+        self._pending = {0: ready}
+        self._stdin = stdin
+        self._alive = True
+
+        reader = threading.Thread(target=self._read, args=(stdout, self._pending), name='HPCAgentReader', daemon=True)
+        reader.start()
+
+        try:
+            ready.result(timeout=self.start_timeout)
+        except (TimeoutError, paramiko.SSHException, NameError) as e:
+            self._alive = False
+            self._failed_at = time.time()
+            self.stats['failed_starts'] += 1
+            stdin.channel.close()
+            raise AgentClient.AgentUnavailable(f'HPC agent did not become ready: {e}')
+
+        self._failed_at = None
+        self.stats['starts'] += 1
+        if log is not None:
+            log.info(f'HPC agent started on {self.main_path} with {self.workers} workers')
+
+    ### Reader thread resolving the future of each response, failing every pending request once the channel closes
+
+    def _read(self, stdout, pending):
+
+        error = paramiko.SSHException('HPC agent channel closed')
+
+        try:
+            for line in stdout:
+                line = line.strip()
+                if not line.startswith(RESULT_PREFIX):
+                    continue
+                response = parse_result([line])
+                future = pending.pop(response.get('id'), None)
+                if future is not None:
+                    future.set_result(response)
+        except NameError as e:
+            error = e
+        except (paramiko.SSHException, OSError, ValueError) as e:
+            error = paramiko.SSHException(f'HPC agent channel failed: {e}')
+        finally:
+            ### The start handshake is awaited with the lock held, so it is failed before taking the lock
+            ready = pending.get(0)
+            if ready is not None and not ready.done():
+                ready.set_exception(error)
+
+            with self._lock:
+                if self._pending is pending:
+                    self._alive = False
+                for future in list(pending.values()):
+                    if not future.done():
+                        future.set_exception(error)
+                pending.clear()
+
+    ### Sending one request and blocking until its response record arrives, at most timeout seconds
+
+    def request(self, function, pdict=None, study=None, jobs=None, log=None, timeout=None):
+
+        with self._lock:
+            if not self._alive:
+                self._start(log)
+
+            req_id = next(self._ids)
+            future = Future()
+            self._pending[req_id] = future
+
+            try:
+                self._stdin.write(json.dumps({'id': req_id, 'function': function, 'study': study,
+                                              'pdict': pdict, 'jobs': jobs}) + '\n')
+                self._stdin.flush()
+            except (paramiko.SSHException, OSError) as e:
+                self._pending.pop(req_id, None)
+                self._alive = False
+                raise paramiko.SSHException(f'Request to HPC agent failed: {e}')
+
+            self.stats['requests'] += 1
+
+        ### A hung agent process is treated as an unavailable agent, the late response is dropped by the reader
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            with self._lock:
+                self._pending.pop(req_id, None)
+                self.stats['timeouts'] += 1
+            raise AgentClient.AgentUnavailable(f'HPC agent did not answer {function} within {timeout} s')
+
+    def close(self):
+        with self._lock:
+            if self._alive:
+                try:
+                    self._stdin.write(json.dumps({'function': 'shutdown'}) + '\n')
+                    self._stdin.flush()
+                    self._stdin.channel.shutdown_write()
+                except (paramiko.SSHException, OSError):
+                    pass
+            self._alive = False
+
+
+### One agent per (user, HPC main path) shared by every run in this process
+_agents = {}
+_agents_lock = threading.Lock()
+
+def get_agent(local_path, usr, main_path, workers=4):
+    with _agents_lock:
+        key = (usr, main_path)
+        if key not in _agents:
+            _agents[key] = AgentClient(local_path, usr, main_path, workers=workers)
+        return _agents[key]
+
+def close_agents():
+    with _agents_lock:
+        agents = list(_agents.values())
+    for agent in agents:
+        agent.close()
+
+### Registered after the SSH pool, so agents are shut down while their sessions are still open
+atexit.register(close_agents)
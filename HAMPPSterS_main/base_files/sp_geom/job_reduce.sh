@@ -0,0 +1,11 @@
+#!/bin/bash
+#PBS -N 'job_name'
+#PBS -o 'job_name'.out
+#PBS -j oe
+#PBS -l select=1:ncpus=1:mem='mem'gb
+#PBS -l walltime='walltime'
+set -vx
+cd $PBS_O_WORKDIR
+
+# Post-processing metrics computed next to the converted fields, released once the convert job ends successfully
+'python_exe' 'reduce_script' $PBS_O_WORKDIR 'params_file'
@@ -0,0 +1,241 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Central qstat monitor batching the status polls of every active job
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import json
+import time
+import asyncio
+import threading
+import paramiko
+from ssh_pool import ssh_pool
+from hpc_protocol import parse_result
+from agent_client import AgentClient
+from poll_policy import PollPolicy
+
+
+################################################################################### BATCHED JOB MONITOR ################################################################################
+
+class QstatMonitor:
+    """Background service running one remote qstat for all registered jobs due a poll, as scheduled by its poll policy"""
+
+    ### Seconds allowed for a batched qstat through the agent before falling back to a one-shot command
+    agent_timeout = 300
+
+    def __init__(self, local_path, usr, main_path, HPC_script='HPC_run_scheduling.py', poll_interval=300, agent=None, policy=None) -> None:
+
+        self.local_path = local_path
+        self.usr = usr
+        self.main_path = main_path
+        self.HPC_script = HPC_script
+        self.poll_interval = poll_interval
+
+        ### Next poll time of each job, the fixed poll_interval for every job if no adaptive policy is given
+        self.policy = policy if policy is not None else PollPolicy(poll_interval, poll_interval, 3600 / poll_interval)
+
+        ### AgentClient serving the batched qstat without a new remote python process, if enabled
+        self.agent = agent
+
+        ### Job id -> number of runs waiting on it, and last known {'status', 't_wait'}
+        self._active = {}
+        self._statuses = {}
+
+        ### Job id -> time of its next poll, and what the policy needs about it (see PollPolicy.next_interval)
+        self._due = {}
+        self._tracks = {}
+        self._last_poll = 0.0
+
+        self._cond = threading.Condition()
+        self._thread = None
+
+        ### (event loop, future) pairs of coroutines awaiting the next poll
+        self._async_waiters = []
+
+        self.stats = {'polls': 0, 'failed_polls': 0, 'jobs_polled': 0, 'starts_seen': 0}
+
+    ### Starting the polling thread lazily on first registration
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='QstatMonitor', daemon=True)
+            self._thread.start()
+
+    def register(self, jobid):
+        jobid = str(int(jobid))
+        with self._cond:
+            self._active[jobid] = self._active.get(jobid, 0) + 1
+            ### The run has just queried the job itself, first batched poll one minimum interval later
+            self._due.setdefault(jobid, time.time() + self.policy.min_interval)
+            self._ensure_running()
+            self._cond.notify_all()
+
+    def unregister(self, jobid):
+        jobid = str(int(jobid))
+        with self._cond:
+            if jobid in self._active:
+                self._active[jobid] -= 1
+                if self._active[jobid] <= 0:
+                    del self._active[jobid]
+                    self._statuses.pop(jobid, None)
+                    self._due.pop(jobid, None)
+                    self._tracks.pop(jobid, None)
+
+    ### Polling loop: one SSH round-trip and one qstat for the jobs due, never closer than the policy minimum gap
+
+    def _loop(self):
+
+        while True:
+            with self._cond:
+                while True:
+                    now = time.time()
+                    if self._active:
+                        wake = max(min(self._due.get(jobid, now) for jobid in self._active), self._last_poll + self.policy.min_gap)
+                        if wake <= now:
+                            break
+                        self._cond.wait(wake - now)
+                    else:
+                        self._cond.wait()
+
+                ### Jobs due within one gap ride along on this qstat rather than forcing another one
+                job_ids = sorted(jobid for jobid in self._active if self._due.get(jobid, now) <= now + self.policy.min_gap)
+
+            try:
+                statuses = self.poll(job_ids)
+            except (paramiko.AuthenticationException, paramiko.SSHException, OSError, ValueError, NameError):
+                statuses = None
+
+            with self._cond:
+                self.stats['polls'] += 1
+                self._last_poll = time.time()
+                if statuses is None:
+                    self.stats['failed_polls'] += 1
+                else:
+                    self.stats['jobs_polled'] += len(job_ids)
+                    for jobid, value in statuses.items():
+                        if jobid in self._active:
+                            self._statuses[jobid] = value
+                            self.observe(jobid, value)
+
+                for jobid in job_ids:
+                    if jobid in self._active:
+                        interval = self.policy.next_interval(self._tracks[jobid]) if jobid in self._tracks else self.policy.min_interval
+                        self._due[jobid] = self._last_poll + interval
+
+                self._cond.notify_all()
+                waiters, self._async_waiters = self._async_waiters, []
+
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(self._wake, future)
+
+    ### Updating the poll policy track of a job with its latest status, recording queue waits of jobs seen starting
+
+    def observe(self, jobid, value):
+
+        now = time.time()
+        track = self._tracks.get(jobid)
+
+        if track is None or track['status'] != value['status']:
+            if track is not None and track['status'] == 'Q' and value['status'] == 'R':
+                self.policy.observe_start(track, now - track['seen'])
+                self.stats['starts_seen'] += 1
+            track = {'status': value['status'], 'unchanged': 0}
+            self._tracks[jobid] = track
+        else:
+            track['unchanged'] += 1
+
+        track.update(seen=now, queue=value.get('queue', track.get('queue')),
+                     queued_for=value.get('queued_for'), start_in=value.get('start_in'))
+
+    def poll(self, job_ids):
+
+        if self.agent is not None:
+            try:
+                return self.read_statuses(self.agent.request('monitor_batch', jobs=job_ids, timeout=self.agent_timeout))
+            except AgentClient.AgentUnavailable:
+                pass
+
+        command = f'python {self.main_path}/{self.HPC_script} monitor_batch --jobs \'{",".join(job_ids)}\''
+        stdin, stdout, stderr = ssh_pool.exec_command(self.local_path, self.usr, command)
+
+        try:
+            out_lines = [line.strip() for line in stdout]
+        finally:
+            stdin.close()
+            stdout.close()
+            stderr.close()
+
+        return self.read_statuses(parse_result(out_lines))
+
+    @staticmethod
+    def read_statuses(record):
+        if record['error'] is not None:
+            raise ValueError(f"Batched qstat failed: {record['error']['message']}")
+        return record['data']
+
+    ### Blocking until the job leaves the given status or max_wait elapses, returning the last known {'status', 't_wait'}
+
+    def wait_for_change(self, jobid, status, max_wait):
+
+        jobid = str(int(jobid))
+        deadline = time.time() + max_wait
+
+        with self._cond:
+            while True:
+                current = self._statuses.get(jobid)
+                if current is not None and current['status'] != status:
+                    return current
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return current
+                self._cond.wait(remaining)
+
+    @staticmethod
+    def _wake(future):
+        if not future.done():
+            future.set_result(None)
+
+    ### Coroutine counterpart of wait_for_change, suspending the run on the event loop rather than a thread
+
+    async def async_wait_for_change(self, jobid, status, max_wait):
+
+        jobid = str(int(jobid))
+        loop = asyncio.get_running_loop()
+        deadline = time.time() + max_wait
+
+        while True:
+            with self._cond:
+                current = self._statuses.get(jobid)
+                if current is not None and current['status'] != status:
+                    return current
+
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return current
+
+                future = loop.create_future()
+                self._async_waiters.append((loop, future))
+
+            try:
+                await asyncio.wait_for(future, remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+### One monitor per (user, HPC main path) shared by every run in this process
+_monitors = {}
+_monitors_lock = threading.Lock()
+
+def get_monitor(local_path, usr, main_path, poll_interval=300, agent=None, policy=None):
+    with _monitors_lock:
+        key = (usr, main_path)
+        if key not in _monitors:
+            _monitors[key] = QstatMonitor(local_path, usr, main_path, poll_interval=poll_interval, agent=agent, policy=policy)
+        elif agent is not None:
+            _monitors[key].agent = agent
+        return _monitors[key]
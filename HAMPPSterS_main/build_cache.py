@@ -0,0 +1,126 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Compile-once cache of the BLUE executables, keyed by the hash of the rendered f90, the Makefile and the compiler environment
+### to be run in the HPC, next to HPC_run_scheduling.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+from contextlib import contextmanager
+from templates import ENCODING
+
+
+################################################################################### BUILD KEY ################################################################################
+
+### Environment variables read by the Makefile and by $(BLUE_HOME)/options/Make.inc
+COMPILER_ENV = ('BLUE_HOME', 'BLUEINC', 'BLUELIB', 'FC', 'FFLAGS', 'LDFLAGS', 'LOADEDMODULES')
+
+### Compiler environment as a dict: variables, Make.inc contents and the BLUE library files the executable is linked against
+
+def compiler_env():
+
+    env = {name: os.environ.get(name, '') for name in COMPILER_ENV}
+
+    make_inc = os.path.join(env['BLUE_HOME'], 'options', 'Make.inc')
+    try:
+        with open(make_inc, 'rb') as file:
+            env['Make.inc'] = hashlib.sha256(file.read()).hexdigest()
+    except OSError:
+        env['Make.inc'] = None
+
+    ### A rebuilt BLUE library changes the executable even with the same source
+    for token in env['BLUELIB'].split():
+        if os.path.isfile(token):
+            info = os.stat(token)
+            env[token] = [info.st_size, int(info.st_mtime)]
+
+    return env
+
+### Hash of the rendered f90, the base Makefile (before the run name is written in) and compiler_env()
+
+def build_key(source, makefile, env):
+
+    digest = hashlib.sha256()
+    for part in (source, makefile, json.dumps(env, sort_keys=True)):
+        digest.update(part.encode(ENCODING, errors='replace'))
+        digest.update(b'\0')
+
+    return digest.hexdigest()
+
+
+################################################################################### BUILD CACHE ################################################################################
+
+class BuildCache:
+    """Content addressed store of compiled executables shared by every run of the study, one lock per key"""
+
+    def __init__(self, cache_dir) -> None:
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def exe_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.x')
+
+    ### Exclusive lock on one key, released by the OS if the holding process dies
+
+    @contextmanager
+    def lock(self, key):
+        with open(os.path.join(self.cache_dir, f'{key}.lock'), 'w') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    ### Hard link of src at dest, copied instead across file systems
+
+    @staticmethod
+    def place(src, dest):
+
+        tmp_path = f'{dest}.tmp'
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+
+        try:
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copy2(src, tmp_path)
+
+        os.replace(tmp_path, dest)
+
+    ### Executable of key placed at dest, running compile() only if no run has built it before
+    ### compile() must leave the executable at dest. Returns True on a cache hit
+
+    def build(self, key, dest, compile):
+
+        with self.lock(key):
+
+            if os.path.isfile(self.exe_path(key)):
+                self.place(self.exe_path(key), dest)
+                return True
+
+            start = time.monotonic()
+            compile()
+            self.place(dest, self.exe_path(key))
+
+            with open(os.path.join(self.cache_dir, f'{key}.json'), 'w') as file:
+                json.dump({'exe': os.path.basename(dest), 'compile_time': round(time.monotonic() - start, 1)}, file)
+
+            return False
+
+
+### One build cache per directory, shared by every run served by this process
+_build_caches = {}
+
+def get_build_cache(cache_dir):
+    cache_dir = os.path.abspath(cache_dir)
+    if cache_dir not in _build_caches:
+        _build_caches[cache_dir] = BuildCache(cache_dir)
+    return _build_caches[cache_dir]
@@ -0,0 +1,156 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Vectorized convergence diagnostics with a registry of pluggable criteria
+### to be run in the HPC, next to HPC_run_scheduling.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import copy
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+################################################################################### ARRAY HELPERS ################################################################################
+
+### Length of the run of True values closing the array, i.e. consecutive stable steps up to the latest one
+
+def trailing_run(mask):
+    mask = np.asarray(mask, dtype=bool)
+    unstable = np.flatnonzero(~mask)
+    return len(mask) if len(unstable) == 0 else len(mask) - unstable[-1] - 1
+
+### Rolling mean over window rows sampled every step rows, same values as pandas rolling(window).mean()[::step].dropna()
+
+def moving_average(values, window, step):
+    values = np.asarray(values, dtype=float)
+    if len(values) < window:
+        return np.array([])
+    means = sliding_window_view(values, window).mean(axis=1)
+    ### means[k] is the rolling mean ending at row k + window - 1, keeping the rows that are multiples of step
+    first = (-(window - 1)) % step
+    sampled = means[first::step]
+    return sampled[~np.isnan(sampled)]
+
+
+################################################################################### CRITERIA REGISTRY ################################################################################
+
+### Criterion kind -> function(recent, history, settings, **params) returning True when the check fails
+criteria = {}
+
+def register_criterion(kind):
+    def decorator(func):
+        criteria[kind] = func
+        return func
+    return decorator
+
+### Time step check: dt CFL collapsing below a fraction of its largest values, or most recent steps limited by CFL
+
+@register_criterion('cfl')
+def cfl_criterion(recent, history, settings, limit_factor=1e-3, bad_fraction=0.5, cfl_column='dt CFL', dt_column='dt'):
+
+    lower_limit = history.largest_cfl[-1] * limit_factor
+    CFL_check = history.min_cfl < lower_limit
+
+    bad_steps = np.count_nonzero(recent[cfl_column].values - recent[dt_column].values < 0)
+    dt_check = bad_steps / len(recent) > bad_fraction
+
+    return bool(CFL_check or dt_check)
+
+### Stability check on any csv column: too few consecutive steps with small relative change and gradient of its moving average
+### allow_decrease: decreasing steps count as stable, min_order: only checked once the moving average exceeds 10**min_order
+
+@register_criterion('stability')
+def stability_criterion(recent, history, settings, column, stable_fraction=0.9, allow_decrease=False, min_order=None,
+                        relchg_thres=None, grad_thres=None, spacing=2):
+
+    relchg_thres = settings['relchg_thres'] if relchg_thres is None else relchg_thres
+    grad_thres = settings['grad_thres'] if grad_thres is None else grad_thres
+
+    moving_avg = moving_average(recent[column].values, settings['window_size'], settings['window_step'])
+
+    ### Not enough points for a gradient yet, nothing to judge
+    if len(moving_avg) < 2:
+        return False
+
+    if min_order is not None and np.log10(moving_avg).max() <= min_order:
+        return False
+
+    relchg = np.diff(moving_avg) / moving_avg[:-1]
+    grad = np.gradient(moving_avg, spacing)
+
+    stable_relchg = np.abs(relchg) < relchg_thres
+    stable_grad = np.abs(grad) < grad_thres
+    if allow_decrease:
+        stable_relchg |= relchg < 0
+        stable_grad |= grad < 0
+
+    stable_period = int(len(relchg) * stable_fraction)
+
+    return bool(trailing_run(stable_relchg) < stable_period or trailing_run(stable_grad) < stable_period)
+
+
+################################################################################### DIAGNOSTICS ENGINE ################################################################################
+
+class ConvergenceDiagnostics:
+    """Evaluates the configured criteria on the csv tail and votes on divergence"""
+
+    ### Defaults reproducing the original checks, overridden per study through the 'convergence' pset entry
+    defaults = {
+        'len_to_check': 400,
+        'recent_fraction': 0.95,
+        'window_fraction': 0.05,
+        'relchg_thres': 0.1,
+        'grad_thres': 0.1,
+        'fail_votes': 2,
+        'criteria': {
+            'time step check': {'kind': 'cfl'},
+            'divergence check': {'kind': 'stability', 'column': 'Max(div(V))', 'stable_fraction': 0.8,
+                                 'allow_decrease': True, 'min_order': -1},
+            'kinetic energy check': {'kind': 'stability', 'column': 'Kinetic Energy', 'stable_fraction': 0.9},
+        },
+    }
+
+    ### config: dict merged over the defaults, a criterion set to None is disabled
+
+    def __init__(self, config=None) -> None:
+
+        self.config = copy.deepcopy(self.defaults)
+        config = config or {}
+
+        for key, value in config.items():
+            if key == 'criteria':
+                self.config['criteria'].update(value)
+            else:
+                self.config[key] = value
+
+        self.criteria = {name: spec for name, spec in self.config['criteria'].items() if spec is not None}
+
+        for name, spec in self.criteria.items():
+            if spec.get('kind') not in criteria:
+                raise ValueError(f"Unknown convergence criterion kind {spec.get('kind')} for check {name}")
+
+        self.len_to_check = int(self.config['len_to_check'])
+        self.recent = int(self.len_to_check * self.config['recent_fraction'])
+        self.fail_votes = int(self.config['fail_votes'])
+
+        window_size = max(10, int(self.len_to_check * self.config['window_fraction']))
+        self.settings = {'window_size': window_size,
+                         'window_step': max(10, int(window_size * 0.5)),
+                         'relchg_thres': self.config['relchg_thres'],
+                         'grad_thres': self.config['grad_thres']}
+
+    ### Returns {check name: failed} for the last rows of the csv and the whole-history state of the reader
+
+    def evaluate(self, frame, history):
+
+        recent = frame.iloc[-self.recent:]
+        checks = {}
+
+        for name, spec in self.criteria.items():
+            params = {key: value for key, value in spec.items() if key != 'kind'}
+            checks[name] = criteria[spec['kind']](recent, history, self.settings, **params)
+
+        return checks
@@ -0,0 +1,157 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Incremental reader of the BLUE history csv, parsing only the rows appended since the last check
+### to be run in the HPC, next to HPC_run_scheduling.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import io
+import os
+import json
+import numpy as np
+import pandas as pd
+
+
+################################################################################### CSV TAIL READER ################################################################################
+
+class CSVTailReader:
+    """Keeps the byte offset, row count, dt CFL extremes and last rows of a growing csv between checks"""
+
+    def __init__(self, csv_path, state_path=None, tail=400, n_largest=5) -> None:
+
+        self.csv_path = csv_path
+        self.state_path = state_path if state_path is not None else os.path.join(
+            os.path.dirname(csv_path), f'.{os.path.basename(csv_path)}.tail.json')
+
+        ### Rows kept in memory, enough for the window the convergence checks look at
+        self.tail = tail
+        self.n_largest = n_largest
+
+        self.reset()
+        self.load()
+
+    def reset(self):
+
+        self.header = None
+        self.offset = 0
+        self.last_line = b''
+        self.rows = 0
+
+        ### Largest dt CFL values seen (descending) and smallest one, over the whole history
+        self.largest_cfl = []
+        self.min_cfl = None
+
+        self.data = None
+
+    ### Restoring the state saved by a previous check, a one-shot remote call starts from here
+
+    def load(self):
+
+        if not os.path.exists(self.state_path):
+            return
+
+        try:
+            with open(self.state_path, 'r') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if state.get('csv_path') != self.csv_path:
+            return
+
+        self.header = state['header']
+        self.offset = state['offset']
+        self.last_line = state['last_line'].encode('latin-1')
+        self.rows = state['rows']
+        self.largest_cfl = state['largest_cfl']
+        self.min_cfl = state['min_cfl']
+        self.data = pd.DataFrame(state['data'], columns=self.header) if self.header else None
+
+    def save(self):
+
+        state = {'csv_path': self.csv_path,
+                 'header': self.header,
+                 'offset': self.offset,
+                 'last_line': self.last_line.decode('latin-1'),
+                 'rows': self.rows,
+                 'largest_cfl': self.largest_cfl,
+                 'min_cfl': self.min_cfl,
+                 'data': self.data.values.tolist() if self.data is not None else []}
+
+        ### Written aside and renamed so an interrupted check never leaves a truncated state file
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.state_path)
+
+    ### The csv was rewritten (e.g. run restarted from scratch) if the line before the saved offset changed
+
+    def is_stale(self, file, size):
+
+        if self.offset == 0:
+            return False
+        if size < self.offset:
+            return True
+
+        file.seek(self.offset - len(self.last_line))
+        return file.read(len(self.last_line)) != self.last_line
+
+    ### Parsing the complete rows appended since the last call, returns the number of new rows
+
+    def update(self):
+
+        size = os.path.getsize(self.csv_path)
+
+        with open(self.csv_path, 'rb') as file:
+
+            if self.is_stale(file, size):
+                self.reset()
+
+            file.seek(self.offset)
+            chunk = file.read(size - self.offset)
+
+        ### Only whole lines, a row being written by BLUE is picked up on the next call
+        end = chunk.rfind(b'\n') + 1
+        if end == 0:
+            return 0
+        chunk = chunk[:end]
+
+        if self.header is None:
+            header_end = chunk.find(b'\n') + 1
+            self.header = pd.read_csv(io.BytesIO(chunk[:header_end]), nrows=0).columns.tolist()
+            body = chunk[header_end:]
+        else:
+            body = chunk
+
+        new_rows = pd.read_csv(io.BytesIO(body), header=None, names=self.header) if body.strip() else pd.DataFrame(columns=self.header)
+
+        if len(new_rows):
+
+            ### Merging the extremes of the new rows into the running ones instead of rescanning the history
+            if 'dt CFL' in new_rows.columns:
+                cfl = new_rows['dt CFL'].dropna().values
+                if len(cfl):
+                    merged = np.concatenate([np.asarray(self.largest_cfl, dtype=float), cfl])
+                    self.largest_cfl = np.sort(merged)[::-1][:self.n_largest].tolist()
+                    new_min = float(cfl.min())
+                    self.min_cfl = new_min if self.min_cfl is None else min(self.min_cfl, new_min)
+
+            self.data = new_rows.iloc[-self.tail:] if self.data is None or self.data.empty else \
+                pd.concat([self.data, new_rows], ignore_index=True).iloc[-self.tail:]
+            self.data = self.data.reset_index(drop=True)
+
+            self.rows += len(new_rows)
+
+        last_start = chunk.rfind(b'\n', 0, end - 1) + 1
+        self.last_line = chunk[last_start:end]
+        self.offset += end
+
+        return len(new_rows)
+
+    ### Last rows as a DataFrame with the csv column names
+
+    def frame(self):
+        return self.data if self.data is not None else pd.DataFrame(columns=self.header or [])
@@ -0,0 +1,91 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Versioned JSON-lines result protocol shared by HPC_run_scheduling.py and the local scheduling classes
+### to be deployed both locally and in the HPC, next to HPC_run_scheduling.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import json
+import time
+
+### Bumped whenever a field changes meaning, the local side refuses records from a different version
+PROTOCOL_VERSION = 1
+
+### Every remote invocation prints exactly one line starting with this prefix, after all its human readable output
+RESULT_PREFIX = '@@HAMPPSTERS_RESULT@@ '
+
+### Error codes a remote function can report, matched to local exceptions by the scheduling classes
+ERROR_CODES = ['JobStatError', 'ValueError', 'FileNotFoundError', 'ConvergenceError',
+               'BadTerminationError', 'KeyError', 'UnhandledError']
+
+
+################################################################################### HPC SIDE RECORD ################################################################################
+
+class RemoteResult:
+    """Typed result of one remote function call, emitted as a single JSON line"""
+
+    def __init__(self, function, run_name=None) -> None:
+
+        self.function = function
+        self.run_name = run_name
+        self.started = time.time()
+
+        ### jobid: int, status: qstat letter, t_wait: seconds, ret_bool: restart decision, data: function specific payload
+        self.fields = {'jobid': None, 'status': None, 't_wait': 0.0, 'ret_bool': None, 'data': None}
+        self.error = None
+
+    def update(self, **fields):
+        for key in fields:
+            if key not in self.fields:
+                raise KeyError(f'Unknown result field {key}')
+        if 'jobid' in fields and fields['jobid'] is not None:
+            fields['jobid'] = int(fields['jobid'])
+        if 't_wait' in fields and fields['t_wait'] is not None:
+            fields['t_wait'] = float(fields['t_wait'])
+        if 'ret_bool' in fields and fields['ret_bool'] is not None:
+            fields['ret_bool'] = bool(fields['ret_bool'])
+        self.fields.update(fields)
+
+    ### Only the first failure is kept, later ones are usually consequences of it
+
+    def fail(self, code, message=''):
+        if code not in ERROR_CODES:
+            raise KeyError(f'Unknown error code {code}')
+        if self.error is None:
+            self.error = {'code': code, 'message': str(message)}
+
+    def as_dict(self):
+        return {'version': PROTOCOL_VERSION,
+                'function': self.function,
+                'run_name': self.run_name,
+                'ok': self.error is None,
+                **self.fields,
+                'error': self.error,
+                'timing': {'started': self.started, 'elapsed': round(time.time() - self.started, 3)}}
+
+    def encode(self):
+        return RESULT_PREFIX + json.dumps(self.as_dict(), default=str)
+
+    def emit(self):
+        print(self.encode(), flush=True)
+
+
+################################################################################### LOCAL SIDE PARSING ################################################################################
+
+### Returning the result record of one invocation from its stdout lines
+### Scanning backwards, the record is the last line printed so normally only one line is inspected
+
+def parse_result(out_lines):
+
+    for idx in range(len(out_lines) - 1, -1, -1):
+        line = out_lines[idx]
+        if line.startswith(RESULT_PREFIX):
+            record = json.loads(line[len(RESULT_PREFIX):])
+            if record.get('version') != PROTOCOL_VERSION:
+                raise NameError(f"HPC result protocol version {record.get('version')} does not match local version {PROTOCOL_VERSION}")
+            return record
+
+    raise NameError('No result record found in the remote output')
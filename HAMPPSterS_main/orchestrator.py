@@ -0,0 +1,174 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Event-driven orchestration of many parametric runs on a single asyncio event loop
+### to be run locally, as an alternative to psweep run_local
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import json
+import asyncio
+import importlib
+import functools
+import paramiko
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from pp_queue import get_pp_queue
+
+
+################################################################################### RUN ORCHESTRATOR ################################################################################
+
+class RunOrchestrator:
+    """Drives the workflow generator of every run as a coroutine, so hundreds of runs share one process"""
+
+    def __init__(self, simulator_cls, io_workers=8, pp_workers=None, pp_memory=None, batch_submit=False) -> None:
+
+        ### Scheduling class instantiated once per run, e.g. SMSimScheduling
+        self.simulator_cls = simulator_cls
+
+        ### Blocking SSH/SFTP calls run on a small fixed pool, sleeps and queue waits cost no thread at all
+        self.io_workers = io_workers
+
+        ### Limits of the shared post-processing queue, None keeps its defaults (half the cores, 4 GB per job)
+        self.pp_workers = pp_workers
+        self.pp_memory = pp_memory
+
+        ### New runs provisioned and submitted by one remote run_batch call instead of one staggered run call each
+        self.batch_submit = batch_submit
+
+    ### Executing one yielded effect without blocking the event loop
+
+    async def perform(self, effect, io_pool):
+
+        loop = asyncio.get_running_loop()
+        kind = effect[0]
+
+        if kind == 'sleep':
+            await asyncio.sleep(effect[1])
+            return None
+        elif kind == 'wait_job':
+            _, monitor, jobid, status, max_wait = effect
+            return await monitor.async_wait_for_change(jobid, status, max_wait)
+        elif kind == 'call':
+            _, func, args = effect
+            return await loop.run_in_executor(io_pool, functools.partial(func, *args))
+        elif kind == 'postprocess':
+            _, queue, func, args = effect
+            return await asyncio.wrap_future(queue.submit(func, *args))
+        else:
+            raise ValueError(f'Unknown workflow effect {kind}')
+
+    ### Coroutine state machine for a single run, stepping its workflow generator effect by effect
+
+    async def drive(self, steps, io_pool):
+
+        value, error = None, None
+
+        while True:
+            try:
+                effect = steps.throw(error) if error is not None else steps.send(value)
+            except StopIteration as stop:
+                return stop.value
+
+            value, error = None, None
+
+            try:
+                value = await self.perform(effect, io_pool)
+            except Exception as e:
+                error = e
+
+    ### resume: RunStateStore record to restart the run from, simulator_cls: class overriding the orchestrator default
+
+    async def run_one(self, pset_dict, io_pool, resume=None, simulator_cls=None, submission=None):
+
+        simulator = (simulator_cls or self.simulator_cls)()
+        log = simulator.prepare(pset_dict)
+        simulator.submission = submission
+
+        try:
+            result = await self.drive(simulator.workflow(log, resume=resume), io_pool)
+        except Exception as e:
+            log.info(f'Run {pset_dict["run_name"]} exited with unhandled exception: {e}')
+            result = simulator.failed_return()
+
+        return result if result is not None else {}
+
+    async def run_all(self, params, resumes=None, classes=None):
+
+        resumes = resumes or [None] * len(params)
+        classes = classes or [None] * len(params)
+
+        ### Orchestrator limits applied to the shared queue before any run reaches post-processing
+        get_pp_queue(self.pp_workers, self.pp_memory)
+
+        with ThreadPoolExecutor(max_workers=self.io_workers) as io_pool:
+
+            submissions = {}
+            if self.batch_submit and params and not any(resumes):
+                loop = asyncio.get_running_loop()
+                submissions = await loop.run_in_executor(io_pool, self.submit_batch, params)
+
+            return await asyncio.gather(*(self.run_one(pset_dict, io_pool, resume, simulator_cls, submissions.get(pset_dict['run_name']))
+                                          for pset_dict, resume, simulator_cls in zip(params, resumes, classes)))
+
+    ### One remote run_batch call for the whole grid, returning run_name -> {jobid, status, t_wait, error}
+    ### Empty if the call itself fails, each run then submitting on its own as before
+
+    def submit_batch(self, params):
+
+        simulator = self.simulator_cls()
+        simulator.prepare(params[0])
+
+        first = params[0]
+        log = simulator.set_log(os.path.join(first['local_path'], f"output_{first['case']}", 'output_batch.txt'))
+
+        log.info('-' * 100)
+        log.info(f'BATCH SUBMISSION OF {len(params)} RUNS')
+        log.info('-' * 100)
+
+        payload = json.dumps({'runs': params, 'workers': first.get('batch_workers'), 'qsub_interval': first.get('qsub_interval', 2)},
+                             default=simulator.convert_to_json, ensure_ascii=False)
+
+        try:
+            simulator.remote_function('HPC_run_scheduling.py', 'run_batch', payload, log, via_stdin=True)
+        except (paramiko.AuthenticationException, paramiko.SSHException, OSError, ValueError, NameError) as e:
+            log.info(f'Batch submission failed, runs submitted individually: {e}')
+            return {}
+
+        stats = simulator.remote_data['stats']
+        log.info(f"{stats['submitted']} of {stats['runs']} runs submitted in {stats['elapsed']} s, {stats['failed']} failed")
+
+        return simulator.remote_data['runs']
+
+    ### Entry point mirroring psweep run_local: every pset in params runs concurrently, results merged into one DataFrame
+
+    def run(self, params, save=True, calc_dir='calc'):
+
+        results = asyncio.run(self.run_all(params))
+
+        return self.collect(params, results, save, calc_dir)
+
+    ### Picking up interrupted runs from RunStateStore records, each at its recorded stage with its own scheduling class
+
+    def resume(self, records, save=True, calc_dir='calc'):
+
+        params = [record['pset'] for record in records]
+        classes = [getattr(importlib.import_module(record['sim_module']), record['sim_class']) for record in records]
+
+        results = asyncio.run(self.run_all(params, resumes=records, classes=classes))
+
+        return self.collect(params, results, save, calc_dir)
+
+    @staticmethod
+    def collect(params, results, save, calc_dir):
+
+        df = pd.DataFrame([{**pset_dict, **result} for pset_dict, result in zip(params, results)])
+
+        if save:
+            os.makedirs(calc_dir, exist_ok=True)
+            df.to_pickle(os.path.join(calc_dir, 'database.pk'))
+
+        return df
@@ -0,0 +1,179 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Single backwards pass over a memory-mapped BLUE .out file, finding the last line of every pattern of interest
+### to be run in the HPC, next to HPC_run_scheduling.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import json
+import mmap
+
+
+################################################################################### OUT FILE SCANNER ################################################################################
+
+class OutScanner:
+    """Finds the last line containing each pattern of a table, reading only bytes appended since the previous scan"""
+
+    ### name -> pattern and how many closing lines it is searched in (None for the whole file)
+    default_patterns = {
+        'bad_termination': {'pattern': 'BAD TERMINATION OF ONE OF YOUR APPLICATION PROCESSES', 'last_lines': 50},
+        'killed_mem': {'pattern': 'PBS: job killed: mem', 'last_lines': 50},
+        'restart': {'pattern': 'writing restart file', 'last_lines': None},
+    }
+
+    ### Bytes searched per step of the backwards pass
+    block_size = 4 * 1024 * 1024
+
+    ### patterns: entries merged over default_patterns, an entry set to None is dropped
+
+    def __init__(self, out_path, patterns=None, state_path=None) -> None:
+
+        self.out_path = out_path
+        self.state_path = state_path if state_path is not None else os.path.join(
+            os.path.dirname(out_path), f'.{os.path.basename(out_path)}.scan.json')
+
+        table = {**self.default_patterns, **(patterns or {})}
+        self.patterns = {name: spec for name, spec in table.items() if spec is not None}
+
+        self.reset()
+        self.load()
+
+    def reset(self):
+
+        ### File size covered by the cached matches, and the line closing it to detect a rewritten file
+        self.offset = 0
+        self.last_line = b''
+
+        ### Whole-file patterns already searched up to self.offset, and {'line', 'offset'} of their last match
+        self.scanned = []
+        self.found = {}
+
+    def load(self):
+
+        if not os.path.exists(self.state_path):
+            return
+
+        try:
+            with open(self.state_path, 'r') as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if state.get('out_path') != self.out_path:
+            return
+
+        self.offset = state['offset']
+        self.last_line = state['last_line'].encode('latin-1')
+        self.scanned = [name for name in state['scanned'] if name in self.patterns]
+        self.found = {name: match for name, match in state['found'].items() if name in self.scanned}
+
+    def save(self):
+
+        state = {'out_path': self.out_path,
+                 'offset': self.offset,
+                 'last_line': self.last_line.decode('latin-1'),
+                 'scanned': self.scanned,
+                 'found': self.found}
+
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(state, file)
+        os.replace(tmp_path, self.state_path)
+
+    ### A new job writing the .out from scratch invalidates the cache
+
+    def is_stale(self, mm, size):
+        if self.offset == 0:
+            return False
+        if size < self.offset:
+            return True
+        return mm[self.offset - len(self.last_line):self.offset] != self.last_line
+
+    ### Offset where the last n lines of the file begin
+
+    @staticmethod
+    def tail_start(mm, size, n_lines):
+        pos = size
+        ### A trailing newline closes the last line rather than opening an empty one
+        if size and mm[size - 1:size] == b'\n':
+            pos -= 1
+        for _ in range(n_lines):
+            pos = mm.rfind(b'\n', 0, pos)
+            if pos < 0:
+                return 0
+        return pos + 1
+
+    @staticmethod
+    def line_at(mm, size, pos):
+        start = mm.rfind(b'\n', 0, pos) + 1
+        end = mm.find(b'\n', pos, size)
+        end = size if end < 0 else end
+        return mm[start:end].decode('utf-8', errors='replace').strip()
+
+    ### Returns {name: last matching line or None}, scanning backwards from the end of the file once
+
+    def scan(self):
+
+        size = os.path.getsize(self.out_path)
+        if size == 0:
+            return {name: None for name in self.patterns}
+
+        with open(self.out_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+
+            if self.is_stale(mm, size):
+                self.reset()
+
+            ### Lower bound of the search for each pattern: start of its closing lines, or the cached offset for whole-file ones
+            targets, lower = {}, {}
+            for name, spec in self.patterns.items():
+                targets[name] = spec['pattern'].encode()
+                if spec.get('last_lines'):
+                    lower[name] = self.tail_start(mm, size, spec['last_lines'])
+                else:
+                    lower[name] = max(0, self.offset - len(targets[name]) + 1) if name in self.scanned else 0
+
+            overlap = max(len(target) for target in targets.values()) - 1
+            pending = set(self.patterns)
+            positions = {}
+            hi = size
+
+            ### One pass from the end: each block is searched for the patterns still missing, stopping once all are resolved
+            while pending and hi > 0:
+                lo = max(0, hi - self.block_size)
+
+                for name in list(pending):
+                    if hi <= lower[name]:
+                        pending.discard(name)
+                        continue
+                    pos = mm.rfind(targets[name], max(lo, lower[name]), min(size, hi + overlap))
+                    if pos >= 0:
+                        positions[name] = pos
+                        pending.discard(name)
+
+                hi = lo
+
+            matches = {}
+            for name, spec in self.patterns.items():
+                if name in positions:
+                    matches[name] = self.line_at(mm, size, positions[name])
+                    if not spec.get('last_lines'):
+                        self.found[name] = {'line': matches[name], 'offset': positions[name]}
+                elif not spec.get('last_lines') and name in self.found:
+                    ### Nothing new since the previous scan, the cached match is still the last one
+                    matches[name] = self.found[name]['line']
+                else:
+                    matches[name] = None
+
+            ### Caching up to the last complete line only, a line still being written is rescanned next time
+            end = mm.rfind(b'\n', 0, size) + 1
+            if end > 0:
+                start = mm.rfind(b'\n', 0, end - 1) + 1
+                self.last_line = mm[start:end]
+                self.offset = end
+                self.scanned = [name for name, spec in self.patterns.items() if not spec.get('last_lines')]
+
+        return matches
@@ -0,0 +1,119 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Adaptive choice of the next qstat poll of each job: PBS estimated start, per-queue wait history and exponential backoff
+### to be run locally, used by the batched qstat monitor in batch_monitor.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import json
+import statistics
+import threading
+from collections import deque
+
+
+################################################################################### QUEUE HISTORY ################################################################################
+
+class QueueHistory:
+    """Recent queue waits of started jobs per PBS queue, kept in a JSON file so later studies start with them"""
+
+    def __init__(self, path=None, maxlen=50) -> None:
+
+        self.path = path
+        self.maxlen = maxlen
+        self.waits = {}
+        self._lock = threading.Lock()
+
+        if path is not None:
+            try:
+                with open(path, 'r') as file:
+                    for queue, waits in json.load(file).items():
+                        self.waits[queue] = deque(waits, maxlen=maxlen)
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def record(self, queue, wait):
+
+        with self._lock:
+            self.waits.setdefault(queue, deque(maxlen=self.maxlen)).append(round(float(wait)))
+
+            if self.path is not None:
+                tmp_path = f'{self.path}.tmp'
+                with open(tmp_path, 'w') as file:
+                    json.dump({name: list(waits) for name, waits in self.waits.items()}, file)
+                os.replace(tmp_path, self.path)
+
+    ### Median wait of the queue, None until a few jobs have been seen starting in it
+
+    def median(self, queue, min_samples=3):
+        with self._lock:
+            waits = self.waits.get(queue)
+            if waits is None or len(waits) < min_samples:
+                return None
+            return statistics.median(waits)
+
+
+################################################################################### POLL POLICY ################################################################################
+
+class PollPolicy:
+    """Seconds until the next poll of a job, and the minimum gap between two batched polls capping the poll rate"""
+
+    def __init__(self, min_interval=60, max_interval=1800, max_rate=60, history=None) -> None:
+
+        self.min_interval = float(min_interval)
+        self.max_interval = max(float(max_interval), self.min_interval)
+
+        ### max_rate: batched qstat calls per hour, jobs due close together share one call
+        self.min_gap = 3600 / float(max_rate)
+
+        self.history = history if history is not None else QueueHistory()
+
+    ### Expected seconds until a queued job starts: PBS estimated start if given, else the median wait of its queue
+
+    def expected_start(self, track):
+
+        if track.get('start_in') is not None:
+            return track['start_in']
+
+        median = self.history.median(track.get('queue'))
+        if median is not None and track.get('queued_for') is not None:
+            return median - track['queued_for']
+
+        return None
+
+    ### track: {'status', 'unchanged' (polls since the last status change), 'queue', 'queued_for', 'start_in'}
+
+    def next_interval(self, track):
+
+        ### Backoff while nothing changes, reset by every status change
+        backoff = self.min_interval * 2 ** min(track.get('unchanged', 0), 16)
+        interval = backoff
+
+        ### Queued job: poll right at its expected start when that comes before the backoff, else close in by halves
+        if track.get('status') == 'Q':
+            target = self.expected_start(track)
+            if target is not None and target > 0:
+                interval = target if target <= backoff else max(backoff, target / 2)
+
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    ### Queue wait of a job seen queued at the previous poll and started by this one, halfway between the two polls
+
+    def observe_start(self, track, elapsed):
+        if track.get('queue') is not None and track.get('queued_for') is not None:
+            self.history.record(track['queue'], track['queued_for'] + elapsed / 2)
+
+
+### One policy per history file and limits, shared by every run in this process
+_policies = {}
+_policies_lock = threading.Lock()
+
+def get_poll_policy(history_path=None, min_interval=60, max_interval=1800, max_rate=60):
+    with _policies_lock:
+        key = (history_path, min_interval, max_interval, max_rate)
+        if key not in _policies:
+            _policies[key] = PollPolicy(min_interval, max_interval, max_rate, history=QueueHistory(history_path))
+        return _policies[key]
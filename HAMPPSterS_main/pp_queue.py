@@ -0,0 +1,144 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Local post-processing work queue shared by every run, replacing the wait on other active pvpython processes
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import time
+import threading
+import psutil
+from collections import deque
+from concurrent.futures import Future
+
+
+################################################################################### POST-PROCESSING QUEUE ################################################################################
+
+class PostProcessQueue:
+    """Bounded pool of post-processing workers, admitting a queued job only when a slot and enough free memory are available"""
+
+    ### Slots default to half the cores, each pvpython or in-process job being mostly single threaded
+    default_workers = max(1, (os.cpu_count() or 2) // 2)
+
+    def __init__(self, max_workers=None, job_memory=4.0, admit_interval=30) -> None:
+
+        self.max_workers = int(max_workers or self.default_workers)
+
+        ### Expected peak memory of one job in GB, a job only starts when this much is available
+        self.job_memory = float(job_memory)
+
+        ### Re-check of the free memory when admission is held by memory alone, jobs finishing wake the dispatcher earlier
+        self.admit_interval = admit_interval
+
+        ### (future, func, args, queued time) of jobs waiting for admission, served in submission order
+        self._pending = deque()
+        self._running = 0
+
+        self._cond = threading.Condition()
+        self._thread = None
+
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'max_running': 0, 'memory_holds': 0, 'queue_wait': 0.0}
+
+    ### Starting the dispatcher thread lazily on first submission
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name='PostProcessQueue', daemon=True)
+            self._thread.start()
+
+    ### Updating the limits, e.g. from the orchestrator or a pset, waking the dispatcher to use new slots
+
+    def configure(self, max_workers=None, job_memory=None):
+        with self._cond:
+            if max_workers is not None:
+                self.max_workers = int(max_workers)
+            if job_memory is not None:
+                self.job_memory = float(job_memory)
+            self._cond.notify_all()
+
+    ### Enqueuing one post-processing job, the returned Future completes as soon as the job does
+
+    def submit(self, func, *args):
+
+        future = Future()
+
+        with self._cond:
+            self._pending.append((future, func, args, time.monotonic()))
+            self.stats['submitted'] += 1
+            self._ensure_running()
+            self._cond.notify_all()
+
+        return future
+
+    ### Memory admission: a job always starts on an idle queue so a large job cannot be held forever
+
+    def _memory_available(self):
+        if self._running == 0:
+            return True
+        return psutil.virtual_memory().available >= self.job_memory * 1024**3
+
+    ### Dispatcher: sleeps on the condition until a job is queued and a slot frees, no polling of other processes
+
+    def _loop(self):
+
+        while True:
+            with self._cond:
+                while not self._pending or self._running >= self.max_workers:
+                    self._cond.wait()
+
+                if not self._memory_available():
+                    self.stats['memory_holds'] += 1
+                    self._cond.wait(self.admit_interval)
+                    continue
+
+                future, func, args, queued = self._pending.popleft()
+
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                self._running += 1
+                self.stats['max_running'] = max(self.stats['max_running'], self._running)
+                self.stats['queue_wait'] += time.monotonic() - queued
+
+            threading.Thread(target=self._work, args=(future, func, args), name='PostProcessWorker', daemon=True).start()
+
+    def _work(self, future, func, args):
+
+        try:
+            result = func(*args)
+        except BaseException as e:
+            with self._cond:
+                self._running -= 1
+                self.stats['failed'] += 1
+                self._cond.notify_all()
+            future.set_exception(e)
+        else:
+            with self._cond:
+                self._running -= 1
+                self.stats['completed'] += 1
+                self._cond.notify_all()
+            future.set_result(result)
+
+    ### Jobs running and waiting, e.g. for logging when a run is queued
+
+    def load(self):
+        with self._cond:
+            return self._running, len(self._pending)
+
+
+### One queue per local process, shared by every run post-processing on this machine
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_pp_queue(max_workers=None, job_memory=None):
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = PostProcessQueue(max_workers=max_workers, job_memory=job_memory if job_memory is not None else 4.0)
+        elif max_workers is not None or job_memory is not None:
+            _queue.configure(max_workers=max_workers, job_memory=job_memory)
+        return _queue
@@ -0,0 +1,101 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### On-HPC reduction of the converted fields to the single phase post-processing metrics, so only a small metrics file is downloaded
+### to be run in the HPC as the reduce PBS job chained after the convert job, and imported locally to read its output
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import sys
+import glob
+import json
+import time
+import pandas as pd
+from vtr_metrics import sp_pipe_profiles, sv_vessel_profiles
+
+
+################################################################################### STUDY REDUCERS ################################################################################
+
+### Same DataFrame as SMSimScheduling.post_process_SP, no time reported
+
+def reduce_sp_geom(results_dir, pset_dict):
+
+    domain_length = (1 + float(pset_dict['n_ele']))*float(pset_dict['pipe_radius'])*2
+    frame = sp_pipe_profiles(None, pset_dict['run_name'], domain_length, float(pset_dict['pipe_radius']), case_path=results_dir)
+
+    return frame, None
+
+### Same DataFrame and final time as SVSimScheduling.post_process_lastsp
+
+def reduce_sp_svgeom(results_dir, pset_dict):
+
+    pvdfiles = glob.glob(os.path.join(results_dir, 'VAR_*_time=*.pvd'))
+    maxtime = max(float(filename.split('=')[-1].split('.pvd')[0]) for filename in pvdfiles)
+
+    frame = sv_vessel_profiles(None, pset_dict['run_name'], pset_dict['clearance'], case_path=results_dir)
+
+    return frame, maxtime
+
+### Case types whose post-processing can run next to the data
+REDUCERS = {'sp_geom': reduce_sp_geom, 'sp_svgeom': reduce_sp_svgeom}
+
+
+################################################################################### METRICS FILE ################################################################################
+
+def metrics_name(run_name):
+    return f'metrics_{run_name}.json'
+
+def params_name(run_name):
+    return f'reduce_{run_name}.json'
+
+### Metrics written atomically, a file present is always complete
+
+def write_metrics(path, case_type, frame, maxtime, elapsed):
+
+    record = {'case': case_type, 'maxtime': maxtime, 'elapsed': round(elapsed, 3),
+              'frame': json.loads(frame.to_json(orient='split', double_precision=15))}
+
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(record, file)
+    os.replace(tmp_path, path)
+
+### DataFrame and final time (None for sp_geom) of a downloaded metrics file
+
+def read_metrics(path):
+
+    with open(path, 'r') as file:
+        record = json.load(file)
+
+    ### 'split' layout: columns, index and row data
+    frame = pd.DataFrame(**record['frame'])
+
+    return frame, record['maxtime']
+
+
+if __name__ == "__main__":
+
+    ### Run from the RESULTS folder by job_reduce.sh: python reduce_metrics.py RESULTS_DIR PARAMS_JSON
+    results_dir = os.path.abspath(sys.argv[1])
+
+    with open(sys.argv[2], 'r') as file:
+        pset_dict = json.load(file)
+
+    case_type = pset_dict['case']
+    start = time.monotonic()
+
+    print('-' * 100)
+    print(f"Reducing {case_type} run {pset_dict['run_name']} in {results_dir}")
+    print('-' * 100)
+
+    frame, maxtime = REDUCERS[case_type](results_dir, pset_dict)
+    elapsed = time.monotonic() - start
+
+    write_metrics(os.path.join(results_dir, metrics_name(pset_dict['run_name'])), case_type, frame, maxtime, elapsed)
+
+    print(frame)
+    print('-' * 100)
+    print(f'Metrics written in {elapsed:.1f} s')
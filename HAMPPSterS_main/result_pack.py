@@ -0,0 +1,265 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Packing of the converted RESULTS into a few compressed tar archives plus a manifest, and streamed unpacking of them
+### to be deployed both locally and in the HPC, next to HPC_run_scheduling.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import json
+import time
+import shutil
+import tarfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+### Manifest written last in the pack folder, its presence marks a complete pack
+PACK_MANIFEST = 'pack_manifest.json'
+
+### Archive suffix of each codec, in order of preference
+CODEC_SUFFIX = {'zstd': '.tar.zst', 'gzip': '.tar.gz'}
+
+
+################################################################################### HPC SIDE PACKING ################################################################################
+
+### Codecs the local side can decompress, sent with the pack request so the HPC only picks one of them
+
+def local_codecs():
+    codecs = []
+    if zstandard is not None or shutil.which('zstd'):
+        codecs.append('zstd')
+    codecs.append('gzip')
+    return codecs
+
+### Multi-threaded compressor command writing to stdout, None if the codec is not available on this machine
+
+def compressor(codec, threads):
+    if codec == 'zstd' and shutil.which('zstd'):
+        return ['zstd', '-q', '-c', f'-T{threads}']
+    if codec == 'gzip':
+        if shutil.which('pigz'):
+            return ['pigz', '-c', '-p', str(threads)]
+        return ['gzip', '-c']
+    return None
+
+### Files split into n groups of similar total size, largest first, each group becoming one archive
+
+def balance(sizes, n_archives):
+
+    n = max(1, min(int(n_archives), len(sizes)))
+    groups = [[] for _ in range(n)]
+    totals = [0] * n
+
+    for name in sorted(sizes, key=lambda name: (-sizes[name], name)):
+        k = totals.index(min(totals))
+        groups[k].append(name)
+        totals[k] += sizes[name]
+
+    return [sorted(group) for group in groups if group]
+
+### Regular files of the results folder as name -> [size, mtime]
+
+def listing(results_dir):
+    files = {}
+    for entry in os.scandir(results_dir):
+        if entry.is_file(follow_symlinks=False):
+            info = entry.stat()
+            files[entry.name] = [info.st_size, int(info.st_mtime)]
+    return files
+
+def read_pack_manifest(pack_dir):
+    try:
+        with open(os.path.join(pack_dir, PACK_MANIFEST), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+### tar | compressor pipeline for one archive, written to a .part file and renamed once complete
+
+def pack_archive(results_dir, members, archive_path, command):
+
+    part_path = archive_path + '.part'
+
+    with open(part_path, 'wb') as out:
+        tar = subprocess.Popen(['tar', '-cf', '-', '-C', results_dir, '--'] + members, stdout=subprocess.PIPE)
+        comp = subprocess.Popen(command, stdin=tar.stdout, stdout=out)
+        ### Only the compressor holds the pipe, so tar gets SIGPIPE if the compressor dies
+        tar.stdout.close()
+        comp_code = comp.wait()
+        tar_code = tar.wait()
+
+    if tar_code != 0 or comp_code != 0:
+        os.remove(part_path)
+        raise subprocess.CalledProcessError(tar_code or comp_code, f"tar | {' '.join(command)}")
+
+    os.replace(part_path, archive_path)
+    return os.path.getsize(archive_path)
+
+### Packing every file of results_dir into pack_dir, reusing a complete pack of the same files
+### Returns the manifest: codec, source listing and archive -> {'members', 'raw', 'size'}
+
+def pack_results(results_dir, pack_dir, codecs=('zstd', 'gzip'), n_archives=4, threads=None):
+
+    files = listing(results_dir)
+    if not files:
+        raise FileNotFoundError(f'No files to pack in {results_dir}')
+
+    manifest = read_pack_manifest(pack_dir)
+    if manifest is not None and manifest.get('source') == files and manifest.get('codec') in codecs:
+        print(f"Reusing {len(manifest['archives'])} {manifest['codec']} archives already packed in {pack_dir}")
+        return manifest
+
+    groups = balance({name: size for name, (size, _) in files.items()}, n_archives)
+    threads = max(1, int(threads or (os.cpu_count() or 1) // len(groups)))
+
+    for codec in codecs:
+        command = compressor(codec, threads)
+        if command is not None:
+            break
+    else:
+        raise ValueError(f'None of the codecs {list(codecs)} is available on the HPC')
+
+    ### Stale archives or manifest from an earlier pack removed before writing new ones
+    shutil.rmtree(pack_dir, ignore_errors=True)
+    os.makedirs(pack_dir)
+
+    names = [f'RESULTS_{k}{CODEC_SUFFIX[codec]}' for k in range(len(groups))]
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+        packed = list(pool.map(lambda args: pack_archive(results_dir, args[1], os.path.join(pack_dir, args[0]), command),
+                               zip(names, groups)))
+
+    manifest = {'codec': codec, 'source': files,
+                'archives': {name: {'members': {member: files[member][0] for member in group},
+                                    'raw': sum(files[member][0] for member in group), 'size': size}
+                             for name, group, size in zip(names, groups, packed)}}
+
+    tmp_path = os.path.join(pack_dir, PACK_MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, os.path.join(pack_dir, PACK_MANIFEST))
+
+    raw = sum(entry['raw'] for entry in manifest['archives'].values())
+    print(f'Packed {len(files)} files into {len(names)} {codec} archives with {threads} thread(s) each: '
+          f'{raw / 1024**2:.1f} MB -> {sum(packed) / 1024**2:.1f} MB in {time.monotonic() - start:.1f} s')
+
+    return manifest
+
+
+################################################################################### LOCAL SIDE UNPACKING ################################################################################
+
+### Decompressed stream of an archive file object, yielded as an open streaming tarfile
+
+class TarStream:
+    """Context manager reading a tar archive sequentially from a compressed, non seekable file object"""
+
+    def __init__(self, fileobj, codec) -> None:
+        self.fileobj = fileobj
+        self.codec = codec
+        self.proc = None
+        self.feeder = None
+        self.feed_error = None
+
+    def __enter__(self):
+
+        if self.codec == 'gzip':
+            self.tar = tarfile.open(fileobj=self.fileobj, mode='r|gz')
+
+        elif self.codec == 'zstd' and zstandard is not None:
+            self.tar = tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(self.fileobj), mode='r|')
+
+        elif self.codec == 'zstd' and shutil.which('zstd'):
+            ### zstd CLI fed from a thread, tarfile reading its output
+            self.proc = subprocess.Popen(['zstd', '-q', '-d', '-c'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.feeder = threading.Thread(target=self.feed, daemon=True)
+            self.feeder.start()
+            self.tar = tarfile.open(fileobj=self.proc.stdout, mode='r|')
+
+        else:
+            raise ValueError(f'Cannot decompress {self.codec} archives on this machine')
+
+        return self.tar
+
+    def feed(self):
+        try:
+            for block in iter(lambda: self.fileobj.read(1024**2), b''):
+                self.proc.stdin.write(block)
+        except (OSError, EOFError) as e:
+            self.feed_error = e
+        finally:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+
+    def __exit__(self, exc_type, exc, tb):
+
+        self.tar.close()
+
+        if self.proc is not None:
+            ### Rest of the decompressed stream discarded so the feeder can finish
+            for _ in iter(lambda: self.proc.stdout.read(1024**2), b''):
+                pass
+            self.proc.stdout.close()
+            self.feeder.join()
+            code = self.proc.wait()
+            if exc_type is None and self.feed_error is not None:
+                raise self.feed_error
+            if exc_type is None and code != 0:
+                raise subprocess.CalledProcessError(code, 'zstd -d')
+
+        ### Trailing bytes after the tar end marker read so a hash of the compressed stream covers the whole file
+        if exc_type is None:
+            for _ in iter(lambda: self.fileobj.read(1024**2), b''):
+                pass
+
+        return False
+
+### Extracting the members of a streaming tarfile into local_dir, each through a .part file
+### Only names listed in members (name -> size) are accepted, and files already present with that size are skipped
+### Returns (extracted, skipped) member names
+
+def extract_members(tar, local_dir, members, part_suffix='.part'):
+
+    extracted, skipped = [], []
+
+    for member in tar:
+
+        name = member.name
+        if not member.isfile() or name not in members or os.path.basename(name) != name:
+            raise ValueError(f'Unexpected archive member {name}')
+
+        local_file = os.path.join(local_dir, name)
+        if os.path.isfile(local_file) and os.path.getsize(local_file) == members[name] == member.size:
+            skipped.append(name)
+            continue
+
+        part_file = local_file + part_suffix
+        source = tar.extractfile(member)
+        with open(part_file, 'wb') as out:
+            shutil.copyfileobj(source, out, 1024**2)
+
+        if os.path.getsize(part_file) != members[name]:
+            os.remove(part_file)
+            raise ValueError(f'{name}: unpacked {member.size} bytes, manifest lists {members[name]}')
+
+        os.replace(part_file, local_file)
+        os.utime(local_file, (time.time(), member.mtime))
+        extracted.append(name)
+
+    missing = set(members) - set(extracted) - set(skipped)
+    if missing:
+        raise ValueError(f'{len(missing)} member(s) missing from archive, e.g. {sorted(missing)[0]}')
+
+    return extracted, skipped
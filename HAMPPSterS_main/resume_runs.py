@@ -0,0 +1,64 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Resuming every interrupted run recorded in a run state database after a local outage
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import argparse
+from run_state import RunStateStore
+from orchestrator import RunOrchestrator
+from logger import configure_logger
+
+log = configure_logger("resume")
+
+def main():
+    parser = argparse.ArgumentParser()
+
+    ### SQLite file written by the runs, by default run_state_{case}.db in local_path
+    parser.add_argument(
+        "--db",
+        type=str,
+        required=True,
+    )
+
+    ### Optional subset of run names to resume, all pending runs otherwise
+    parser.add_argument(
+        "--runs",
+        nargs='*',
+    )
+
+    parser.add_argument(
+        "--io_workers",
+        type=int,
+        default=8,
+    )
+
+    args = parser.parse_args()
+
+    store = RunStateStore(args.db)
+    records = store.pending()
+    store.close()
+
+    if args.runs:
+        records = [record for record in records if record['run_name'] in args.runs]
+
+    log.info('-' * 100)
+    log.info(f'Resuming {len(records)} runs from {args.db}')
+    for record in records:
+        log.info(f"{record['run_name']}: stage {record['stage']}, job {record['jobid']}, last update {record['updated']}")
+    log.info('-' * 100)
+
+    if not records:
+        return
+
+    orchestrator = RunOrchestrator(None, io_workers=args.io_workers)
+    df = orchestrator.resume(records)
+
+    log.info('\n' + df.to_string())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### Durable SQLite store of each run's workflow stage, used to resume runs after a local crash
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+
+################################################################################### RUN STATE STORE ################################################################################
+
+class RunStateStore:
+    """SQLite-backed record of the last completed workflow stage of every run"""
+
+    ### Workflow checkpoints in order, a resumed run restarts right after the recorded one
+    stages = ['new', 'running', 'sim_finished', 'convert_submitted', 'convert_finished', 'reduce_submitted', 'downloaded', 'done', 'failed']
+
+    def __init__(self, db_path) -> None:
+
+        self.db_path = db_path
+        self._lock = threading.Lock()
+
+        ### One connection per process, shared by the runs of an orchestrator
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+
+        with self.conn:
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS runs (
+                                    run_name TEXT PRIMARY KEY,
+                                    study_ID TEXT,
+                                    sim_module TEXT,
+                                    sim_class TEXT,
+                                    pset TEXT,
+                                    stage TEXT,
+                                    jobid TEXT,
+                                    t_wait REAL,
+                                    status TEXT,
+                                    result TEXT,
+                                    updated TEXT)''')
+            self.conn.execute('''CREATE TABLE IF NOT EXISTS transitions (
+                                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                    run_name TEXT,
+                                    stage TEXT,
+                                    jobid TEXT,
+                                    t_wait REAL,
+                                    status TEXT,
+                                    updated TEXT)''')
+
+    ### Registering a fresh run, resetting any previous record with the same run name
+
+    def register(self, pset_dict, sim_module, sim_class, pset_json):
+
+        now = datetime.now().isoformat()
+
+        with self._lock, self.conn:
+            self.conn.execute('''INSERT OR REPLACE INTO runs
+                                 (run_name, study_ID, sim_module, sim_class, pset, stage, jobid, t_wait, status, result, updated)
+                                 VALUES (?, ?, ?, ?, ?, 'new', NULL, 0, NULL, NULL, ?)''',
+                              (pset_dict['run_name'], str(pset_dict['study_ID']), sim_module, sim_class, pset_json, now))
+            self.conn.execute('INSERT INTO transitions (run_name, stage, jobid, t_wait, status, updated) VALUES (?, ?, NULL, 0, NULL, ?)',
+                              (pset_dict['run_name'], 'new', now))
+
+    ### Recording a stage transition and its job details in a single transaction
+
+    def record(self, run_name, stage, jobid=None, t_wait=0, status=None, result=None):
+
+        if stage not in self.stages:
+            raise ValueError(f'Unknown workflow stage {stage}')
+
+        now = datetime.now().isoformat()
+        jobid = str(jobid) if jobid is not None else None
+        result = json.dumps(result, default=str) if result is not None else None
+
+        with self._lock, self.conn:
+            self.conn.execute('''UPDATE runs SET stage = ?, jobid = ?, t_wait = ?, status = ?, result = COALESCE(?, result), updated = ?
+                                 WHERE run_name = ?''',
+                              (stage, jobid, float(t_wait or 0), status, result, now, run_name))
+            self.conn.execute('INSERT INTO transitions (run_name, stage, jobid, t_wait, status, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                              (run_name, stage, jobid, float(t_wait or 0), status, now))
+
+    def load(self, run_name):
+
+        with self._lock:
+            cursor = self.conn.execute('''SELECT run_name, study_ID, sim_module, sim_class, pset, stage, jobid, t_wait, status, result, updated
+                                          FROM runs WHERE run_name = ?''', (run_name,))
+            row = cursor.fetchone()
+
+        return self._as_dict(row) if row is not None else None
+
+    ### Runs interrupted before reaching done or failed
+
+    def pending(self):
+
+        with self._lock:
+            cursor = self.conn.execute('''SELECT run_name, study_ID, sim_module, sim_class, pset, stage, jobid, t_wait, status, result, updated
+                                          FROM runs WHERE stage NOT IN ('done', 'failed') ORDER BY run_name''')
+            rows = cursor.fetchall()
+
+        return [self._as_dict(row) for row in rows]
+
+    @staticmethod
+    def _as_dict(row):
+        keys = ['run_name', 'study_ID', 'sim_module', 'sim_class', 'pset', 'stage', 'jobid', 't_wait', 'status', 'result', 'updated']
+        state = dict(zip(keys, row))
+        state['pset'] = json.loads(state['pset'])
+        return state
+
+    def close(self):
+        self.conn.close()
+
+
+### One store per database file in this process
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_store(db_path):
+    with _stores_lock:
+        if db_path not in _stores:
+            _stores[db_path] = RunStateStore(db_path)
+        return _stores[db_path]
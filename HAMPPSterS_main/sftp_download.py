@@ -0,0 +1,424 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Parallel, resumable and verified bulk SFTP download of run results over one pooled SSH transport, as files or packed archives
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import json
+import stat
+import time
+import shlex
+import hashlib
+import threading
+import paramiko
+from concurrent.futures import ThreadPoolExecutor
+from ssh_pool import ssh_pool
+from result_pack import PACK_MANIFEST, TarStream, extract_members
+
+
+################################################################################### BULK DOWNLOADER ################################################################################
+
+class BulkDownloader:
+    """Downloads every file of a remote folder over several SFTP channels, skipping complete files and resuming partial ones"""
+
+    class IntegrityError(Exception):
+        """Exception class for a downloaded file whose size or hash does not match the remote copy"""
+        def __init__(self, message="Downloaded file does not match the remote file"):
+            self.message = message
+            super().__init__(self.message)
+
+    ### Manifest of completed and partial downloads kept in each destination folder
+    manifest_name = '.download_manifest.json'
+
+    ### Partial downloads are written next to their final name and renamed once complete
+    part_suffix = '.part'
+
+    ### Hashes available both in hashlib and as <name>sum on the login node, the only values accepted for verify
+    verify_algorithms = ('md5', 'sha1', 'sha256', 'sha512')
+
+    def __init__(self, local_path, usr, channels=4, chunk_size=1024**2, verify=None, log=None) -> None:
+
+        self.local_path = local_path
+        self.usr = usr
+
+        ### Parallel SFTP channels, all multiplexed over the pooled SSH transport
+        self.channels = max(1, int(channels))
+        self.chunk_size = int(chunk_size)
+
+        ### Optional remote hash check, one of verify_algorithms run as <verify>sum on the login node
+        ### Checked here so a typo fails before any transfer and no pset text reaches the remote shell
+        if verify and verify not in BulkDownloader.verify_algorithms:
+            raise ValueError(f"Unknown sftp_verify hash {verify!r}, expected one of {', '.join(BulkDownloader.verify_algorithms)}")
+        self.verify = verify
+        self.log = log
+
+        self._local = threading.local()
+        self._sftps = []
+        self._lock = threading.Lock()
+
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {'files': 0, 'downloaded': 0, 'resumed': 0, 'skipped': 0, 'verified': 0, 'bytes': 0, 'seconds': 0.0,
+                      'archives': 0, 'unpacked': 0}
+
+    def info(self, message):
+        if self.log is not None:
+            self.log.info(message)
+
+    ### One SFTP client per worker thread, each its own channel on the shared transport
+
+    def sftp(self):
+        client = getattr(self._local, 'sftp', None)
+        if client is None:
+            client = ssh_pool.open_sftp(self.local_path, self.usr, self.log)
+            self._local.sftp = client
+            with self._lock:
+                self._sftps.append(client)
+        return client
+
+    def close(self):
+        with self._lock:
+            sftps, self._sftps = self._sftps, []
+        for client in sftps:
+            try:
+                client.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    ### Manifest entries: filename -> {'size', 'mtime', 'complete', 'hash'}
+
+    def read_manifest(self, local_dir):
+        try:
+            with open(os.path.join(local_dir, self.manifest_name), 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def write_manifest(self, local_dir, manifest):
+        path = os.path.join(local_dir, self.manifest_name)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(manifest, file, indent=1, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    ### Download plan of one remote file: 'skip', ('resume', offset) or ('fresh', 0)
+
+    def plan(self, attr, local_file, entry):
+
+        remote = {'size': attr.st_size, 'mtime': int(attr.st_mtime)}
+
+        if os.path.isfile(local_file):
+            local_size = os.path.getsize(local_file)
+            ### Complete when the manifest or the local size/mtime (set after download) match the remote file
+            if entry and entry.get('complete') and entry['size'] == remote['size'] and entry['mtime'] == remote['mtime'] \
+                    and local_size == remote['size']:
+                return 'skip', 0
+            if local_size == remote['size'] and int(os.path.getmtime(local_file)) == remote['mtime']:
+                return 'skip', 0
+
+        part_file = local_file + self.part_suffix
+        if os.path.isfile(part_file) and entry and not entry.get('complete') \
+                and entry['size'] == remote['size'] and entry['mtime'] == remote['mtime']:
+            offset = os.path.getsize(part_file)
+            if 0 < offset <= remote['size']:
+                return 'resume', offset
+
+        return 'fresh', 0
+
+    ### Chunked, pipelined read of one remote file from offset onwards, hashing the whole file on the way
+
+    def fetch(self, remote_file, local_file, size, offset):
+
+        part_file = local_file + self.part_suffix
+        digest = hashlib.new(self.verify) if self.verify else None
+
+        ### Resumed prefix hashed first so the digest covers the whole file
+        if digest is not None and offset:
+            with open(part_file, 'rb') as local:
+                for block in iter(lambda: local.read(self.chunk_size), b''):
+                    digest.update(block)
+
+        with self.sftp().open(remote_file, 'rb') as remote, open(part_file, 'r+b' if offset else 'wb') as local:
+            remote.seek(offset)
+            local.seek(offset)
+            ### Read requests for the rest of the file issued up front instead of one round trip per chunk
+            remote.prefetch(size)
+            remaining = size - offset
+            while remaining > 0:
+                block = remote.read(min(self.chunk_size, remaining))
+                if not block:
+                    break
+                local.write(block)
+                if digest is not None:
+                    digest.update(block)
+                remaining -= len(block)
+
+        if os.path.getsize(part_file) != size:
+            raise BulkDownloader.IntegrityError(f'{remote_file}: received {os.path.getsize(part_file)} of {size} bytes')
+
+        return digest.hexdigest() if digest is not None else None
+
+    ### Remote hashes of every file to verify, one command on the login node for the whole folder
+
+    def remote_hashes(self, remote_dir, filenames):
+
+        if not self.verify or not filenames:
+            return {}
+
+        command = f'cd {shlex.quote(remote_dir)} && {self.verify}sum -- ' + ' '.join(shlex.quote(name) for name in filenames)
+        _, stdout, _ = ssh_pool.exec_command(self.local_path, self.usr, command, self.log)
+
+        hashes = {}
+        for line in stdout.read().decode('utf-8', errors='replace').splitlines():
+            parts = line.strip().split(None, 1)
+            if len(parts) == 2:
+                hashes[parts[1].lstrip('*')] = parts[0]
+        return hashes
+
+    ### Downloading one file according to its plan, recording it in the manifest as it goes
+
+    def transfer(self, remote_dir, local_dir, attr, manifest, remote_hash):
+
+        name = attr.filename
+        remote_file = f'{remote_dir.rstrip("/")}/{name}'
+        local_file = os.path.join(local_dir, name)
+
+        action, offset = self.plan(attr, local_file, manifest.get(name))
+
+        if action == 'skip':
+            with self._lock:
+                self.stats['skipped'] += 1
+            return
+
+        ### Marked partial before any byte is written so an interrupted transfer can resume
+        with self._lock:
+            manifest[name] = {'size': attr.st_size, 'mtime': int(attr.st_mtime), 'complete': False}
+            self.write_manifest(local_dir, manifest)
+
+        start = time.monotonic()
+        local_hash = self.fetch(remote_file, local_file, attr.st_size, offset)
+        seconds = time.monotonic() - start
+
+        if remote_hash is not None and local_hash != remote_hash:
+            os.remove(local_file + self.part_suffix)
+            raise BulkDownloader.IntegrityError(f'{remote_file}: {self.verify} {local_hash} does not match remote {remote_hash}')
+
+        os.replace(local_file + self.part_suffix, local_file)
+        ### Remote mtime kept locally so a lost manifest still recognises the file as complete
+        os.utime(local_file, (time.time(), attr.st_mtime))
+
+        received = attr.st_size - offset
+        with self._lock:
+            manifest[name] = {'size': attr.st_size, 'mtime': int(attr.st_mtime), 'complete': True}
+            if local_hash is not None:
+                manifest[name]['hash'] = local_hash
+            self.write_manifest(local_dir, manifest)
+            self.stats['downloaded'] += 1
+            self.stats['resumed'] += 1 if offset else 0
+            self.stats['verified'] += 1 if remote_hash is not None else 0
+            self.stats['bytes'] += received
+
+        rate = received / 1024**2 / seconds if seconds > 0 else float('inf')
+        self.info(f'{name}: {received / 1024**2:.1f} MB in {seconds:.1f} s ({rate:.1f} MB/s)' + (f', resumed at {offset} bytes' if offset else ''))
+
+    ### Downloading every regular file of remote_dir into local_dir, raising the first failure once all transfers ended
+
+    def download(self, remote_dir, local_dir):
+
+        os.makedirs(local_dir, exist_ok=True)
+        self.reset_stats()
+        start = time.monotonic()
+
+        try:
+            files = [attr for attr in self.sftp().listdir_attr(remote_dir) if stat.S_ISREG(attr.st_mode)]
+            manifest = self.read_manifest(local_dir)
+
+            ### Only files that will actually be transferred are hashed remotely
+            to_fetch = [attr for attr in files
+                        if self.plan(attr, os.path.join(local_dir, attr.filename), manifest.get(attr.filename))[0] != 'skip']
+            hashes = self.remote_hashes(remote_dir, [attr.filename for attr in to_fetch])
+
+            self.stats['files'] += len(files)
+            self.info(f'{len(files)} files in {remote_dir}: {len(to_fetch)} to download over {self.channels} SFTP channels, '
+                      f'{len(files) - len(to_fetch)} already present')
+
+            errors = []
+            with ThreadPoolExecutor(max_workers=self.channels) as pool:
+                futures = [pool.submit(self.transfer, remote_dir, local_dir, attr, manifest, hashes.get(attr.filename))
+                           for attr in files]
+                for future in futures:
+                    try:
+                        future.result()
+                    except (paramiko.SSHException, EOFError, OSError, BulkDownloader.IntegrityError) as e:
+                        errors.append(e)
+        finally:
+            self.close()
+
+        seconds = time.monotonic() - start
+        self.stats['seconds'] = seconds
+        self.report(seconds)
+
+        if errors:
+            raise errors[0]
+
+    ### Downloading a single file of remote_dir, e.g. the metrics of the reduce job, False if it does not exist
+
+    def download_file(self, remote_dir, local_dir, name):
+
+        os.makedirs(local_dir, exist_ok=True)
+        self.reset_stats()
+        start = time.monotonic()
+
+        try:
+            try:
+                attr = self.sftp().stat(f'{remote_dir.rstrip("/")}/{name}')
+            except FileNotFoundError:
+                return False
+            attr.filename = name
+
+            manifest = self.read_manifest(local_dir)
+            hashes = self.remote_hashes(remote_dir, [name])
+            self.stats['files'] += 1
+            self.transfer(remote_dir, local_dir, attr, manifest, hashes.get(name))
+        finally:
+            self.close()
+
+        self.stats['seconds'] = time.monotonic() - start
+        return True
+
+    ### Streaming one archive through the decompressor into local_dir, no compressed copy is written locally
+    ### The archive is recorded in the manifest once all its members are in place, a rerun skips it
+
+    def unpack(self, remote_dir, local_dir, name, entry, codec, manifest, remote_hash):
+
+        remote_file = f'{remote_dir.rstrip("/")}/{name}'
+        done = manifest.get(name)
+
+        if done and done.get('complete') and done['size'] == entry['size'] \
+                and all(os.path.isfile(os.path.join(local_dir, member)) for member in entry['members']):
+            with self._lock:
+                self.stats['skipped'] += len(entry['members'])
+            return
+
+        start = time.monotonic()
+
+        with self.sftp().open(remote_file, 'rb') as remote:
+            remote.prefetch(entry['size'])
+            reader = HashingReader(remote, self.verify)
+            with TarStream(reader, codec) as tar:
+                extracted, skipped = extract_members(tar, local_dir, entry['members'], self.part_suffix)
+
+        if reader.received != entry['size']:
+            raise BulkDownloader.IntegrityError(f'{remote_file}: received {reader.received} of {entry["size"]} bytes')
+
+        if remote_hash is not None and reader.hexdigest() != remote_hash:
+            ### Members of a corrupt archive are not trusted, removed so the next attempt unpacks them again
+            for member in extracted:
+                os.remove(os.path.join(local_dir, member))
+            raise BulkDownloader.IntegrityError(f'{remote_file}: {self.verify} {reader.hexdigest()} does not match remote {remote_hash}')
+
+        seconds = time.monotonic() - start
+
+        with self._lock:
+            manifest[name] = {'size': entry['size'], 'mtime': 0, 'complete': True, 'members': sorted(entry['members'])}
+            if remote_hash is not None:
+                manifest[name]['hash'] = remote_hash
+            self.write_manifest(local_dir, manifest)
+            self.stats['unpacked'] += len(extracted)
+            self.stats['skipped'] += len(skipped)
+            self.stats['verified'] += 1 if remote_hash is not None else 0
+            self.stats['bytes'] += entry['size']
+
+        rate = entry['size'] / 1024**2 / seconds if seconds > 0 else float('inf')
+        self.info(f'{name}: {entry["size"] / 1024**2:.1f} MB ({entry["raw"] / 1024**2:.1f} MB unpacked, {len(extracted)} files) '
+                  f'in {seconds:.1f} s ({rate:.1f} MB/s)')
+
+    ### Downloading the archives listed in the pack manifest of remote_dir, one per SFTP channel, unpacked into local_dir
+    ### Returns False without downloading anything when remote_dir holds no complete pack
+
+    def download_packed(self, remote_dir, local_dir):
+
+        os.makedirs(local_dir, exist_ok=True)
+        self.reset_stats()
+        start = time.monotonic()
+
+        try:
+            try:
+                with self.sftp().open(f'{remote_dir.rstrip("/")}/{PACK_MANIFEST}', 'r') as file:
+                    pack = json.loads(file.read().decode('utf-8'))
+            except (FileNotFoundError, ValueError) as e:
+                self.info(f'No complete pack in {remote_dir} ({e}), downloading individual files')
+                return False
+
+            archives = pack['archives']
+            manifest = self.read_manifest(local_dir)
+            hashes = self.remote_hashes(remote_dir, sorted(archives))
+
+            packed = sum(entry['size'] for entry in archives.values())
+            raw = sum(entry['raw'] for entry in archives.values())
+            self.stats['files'] += sum(len(entry['members']) for entry in archives.values())
+            self.stats['archives'] += len(archives)
+            self.info(f"{self.stats['files']} files packed in {len(archives)} {pack['codec']} archives in {remote_dir}: "
+                      f'{packed / 1024**2:.1f} MB for {raw / 1024**2:.1f} MB of data, over {self.channels} SFTP channels')
+
+            errors = []
+            with ThreadPoolExecutor(max_workers=self.channels) as pool:
+                futures = [pool.submit(self.unpack, remote_dir, local_dir, name, entry, pack['codec'], manifest, hashes.get(name))
+                           for name, entry in sorted(archives.items())]
+                for future in futures:
+                    try:
+                        future.result()
+                    except (paramiko.SSHException, EOFError, OSError, ValueError, BulkDownloader.IntegrityError) as e:
+                        errors.append(e)
+        finally:
+            self.close()
+
+        seconds = time.monotonic() - start
+        self.stats['seconds'] = seconds
+        self.report(seconds)
+
+        if errors:
+            error = errors[0]
+            raise error if isinstance(error, (OSError, BulkDownloader.IntegrityError)) else BulkDownloader.IntegrityError(str(error))
+
+        return True
+
+    ### Logging totals and aggregate throughput of the last download
+
+    def report(self, seconds):
+        total = self.stats['bytes'] / 1024**2
+        rate = total / seconds if seconds > 0 else 0.0
+        if self.stats['archives']:
+            self.info(f"Unpacked {self.stats['unpacked']} files from {self.stats['archives']} archives ({self.stats['verified']} hash verified), "
+                      f"skipped {self.stats['skipped']}: {total:.1f} MB in {seconds:.1f} s ({rate:.1f} MB/s)")
+            return
+        self.info(f"Downloaded {self.stats['downloaded']} files ({self.stats['resumed']} resumed, {self.stats['verified']} hash verified), "
+                  f"skipped {self.stats['skipped']}: {total:.1f} MB in {seconds:.1f} s ({rate:.1f} MB/s)")
+
+
+### Read-only file wrapper counting and optionally hashing the bytes read through it
+
+class HashingReader:
+    """File object wrapper hashing a stream as it is consumed"""
+
+    def __init__(self, fileobj, algorithm=None) -> None:
+        self.fileobj = fileobj
+        self.digest = hashlib.new(algorithm) if algorithm else None
+        self.received = 0
+
+    def read(self, size=-1):
+        block = self.fileobj.read(size)
+        self.received += len(block)
+        if self.digest is not None:
+            self.digest.update(block)
+        return block
+
+    def hexdigest(self):
+        return self.digest.hexdigest() if self.digest is not None else None
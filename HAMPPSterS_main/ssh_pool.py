@@ -0,0 +1,195 @@
+### Automation_simulation_run, tailored for Imperial College's HPC
+### Persistent SSH session pool shared by the local scheduling classes
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import atexit
+import threading
+import warnings
+import configparser
+import paramiko
+
+
+################################################################################### SSH CONNECTION POOL ################################################################################
+
+class SSHPool:
+    """Process-wide pool of authenticated SSH clients keyed by (user, login node)"""
+
+    try_logins = ['login.hpc.ic.ac.uk','login-a.hpc.ic.ac.uk','login-b.hpc.ic.ac.uk','login-c.hpc.ic.ac.uk']
+
+    def __init__(self, keepalive=60) -> None:
+
+        ### Keep-alive interval (s) sent over idle transports so the login node does not drop them
+        self.keepalive = keepalive
+
+        self._clients = {}
+        self._credentials = {}
+        self._lock = threading.RLock()
+
+        ### Counters for connections opened against reused from the pool
+        self.stats = {'opened': 0, 'reused': 0, 'reconnects': 0, 'failed': 0}
+
+    ### Reading and caching the SSH credentials stored in config_{usr}.ini
+
+    def credentials(self, local_path, usr):
+
+        with self._lock:
+            if usr not in self._credentials:
+                config = configparser.ConfigParser()
+                configfile = os.path.join(local_path, f'config_{usr}.ini')
+                config.read(configfile)
+                user = config.get('SSH', 'username')
+                key = config.get('SSH', 'password')
+                self._credentials[usr] = (user, key)
+
+        return self._credentials[usr]
+
+    ### Checking the transport of a pooled client is still usable
+
+    @staticmethod
+    def is_healthy(ssh):
+        transport = ssh.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            transport.send_ignore()
+        except (EOFError, OSError, paramiko.SSHException):
+            return False
+        return True
+
+    ### Healthy pooled client of usr on any login, in try_logins order, so a failed-over session is reused before retrying the primary
+
+    def pooled(self, usr):
+
+        stale = []
+
+        with self._lock:
+            found = None
+            for login in self.try_logins:
+                ssh = self._clients.get((usr, login))
+                if ssh is None:
+                    continue
+                if self.is_healthy(ssh):
+                    self.stats['reused'] += 1
+                    found = (ssh, login)
+                    break
+                ### Stale session, dropped here and reconnected by connect
+                stale.append(self._clients.pop((usr, login)))
+                self.stats['reconnects'] += 1
+
+        for ssh in stale:
+            try:
+                ssh.close()
+            except Exception:
+                pass
+
+        return found
+
+    ### Returning a connected SSH client for usr, reusing a pooled one when healthy and walking try_logins otherwise
+    ### The handshake runs outside the pool lock, so a slow or failing login does not block the other threads
+
+    def connect(self, local_path, usr, log=None):
+
+        user, key = self.credentials(local_path, usr)
+
+        found = self.pooled(usr)
+        if found is not None:
+            return found
+
+        for login in self.try_logins:
+
+            ssh = paramiko.SSHClient()
+            ssh.load_system_host_keys()
+            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            warnings.filterwarnings("ignore", category=ResourceWarning)
+
+            try:
+                ssh.connect(login, username=user, password=key)
+                ssh.get_transport().set_keepalive(self.keepalive)
+            except (paramiko.AuthenticationException, paramiko.SSHException, OSError) as e:
+                ssh.close()
+                with self._lock:
+                    self.stats['failed'] += 1
+                if login == self.try_logins[-1]:
+                    if isinstance(e, paramiko.SSHException):
+                        raise e
+                    raise paramiko.SSHException(f'Connection to {login} failed: {e}')
+                if log is not None:
+                    log.info(f'SSH connection failed with login {login}, trying again ...')
+                continue
+
+            ### Publishing the new client, unless another thread connected to the same login meanwhile
+            with self._lock:
+                existing = self._clients.get((usr, login))
+                if existing is None or not self.is_healthy(existing):
+                    self._clients[(usr, login)] = ssh
+                    self.stats['opened'] += 1
+                    return ssh, login
+                self.stats['reused'] += 1
+
+            ssh.close()
+            return existing, login
+
+    ### Closing and removing a pooled client, used when a command fails on a broken session
+
+    def discard(self, usr, login):
+        with self._lock:
+            ssh = self._clients.pop((usr, login), None)
+        if ssh is not None:
+            try:
+                ssh.close()
+            except Exception:
+                pass
+
+    ### Running a command on a pooled session, reconnecting once if the session broke mid-call
+
+    def exec_command(self, local_path, usr, command, log=None):
+
+        for attempt in range(2):
+            ssh, login = self.connect(local_path, usr, log)
+            try:
+                return ssh.exec_command(command)
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                self.discard(usr, login)
+                if attempt == 1:
+                    raise paramiko.SSHException(f'Remote command failed on {login}: {e}')
+                if log is not None:
+                    log.info(f'SSH session with {login} broken, reconnecting ...')
+
+    ### Opening an SFTP channel over a pooled session, reconnecting once if the session broke
+
+    def open_sftp(self, local_path, usr, log=None):
+
+        for attempt in range(2):
+            ssh, login = self.connect(local_path, usr, log)
+            try:
+                return paramiko.SFTPClient.from_transport(ssh.get_transport())
+            except (paramiko.SSHException, EOFError, OSError) as e:
+                self.discard(usr, login)
+                if attempt == 1:
+                    raise paramiko.SSHException(f'SFTP channel failed on {login}: {e}')
+                if log is not None:
+                    log.info(f'SSH session with {login} broken, reconnecting ...')
+
+    ### Logging the connection reuse counters
+
+    def report(self, log):
+        log.info(f"SSH pool: {self.stats['opened']} connections opened, {self.stats['reused']} reused, "
+                 f"{self.stats['reconnects']} reconnects, {self.stats['failed']} failed logins")
+
+    def close_all(self):
+        with self._lock:
+            keys = list(self._clients.keys())
+        for usr, login in keys:
+            self.discard(usr, login)
+
+
+### Single pool shared by every scheduling instance in this process
+ssh_pool = SSHPool()
+atexit.register(ssh_pool.close_all)
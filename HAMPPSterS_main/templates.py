@@ -0,0 +1,161 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### In-process rendering of the base f90, Makefile and job.sh templates, replacing one sed call per placeholder
+### to be run in the HPC, next to HPC_run_scheduling.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import re
+import shutil
+
+
+################################################################################### SUBSTITUTION ################################################################################
+
+### Placeholders in the base files are identifiers in single quotes, e.g. 'pipe_radius'
+PLACEHOLDER = re.compile(r"'([A-Za-z_][A-Za-z0-9_]*)'")
+
+### Files are handled as latin-1 so any byte (e.g. accented Makefile headers) round-trips unchanged
+ENCODING = 'latin-1'
+
+### Replacing every quoted placeholder and bare word (e.g. RUN_NAME, Makefile 'file') in a single regex pass
+
+def substitute(text, placeholders=None, words=None):
+
+    table = {f"'{name}'": str(value) for name, value in (placeholders or {}).items()}
+    table.update({word: str(value) for word, value in (words or {}).items()})
+
+    if not table:
+        return text
+
+    ### Quoted placeholders matched literally, bare words only as whole tokens so 'Makefile' keeps its name
+    alternatives = [re.escape(key) if key.startswith("'") else rf'\b{re.escape(key)}\b'
+                    for key in sorted(table, key=len, reverse=True)]
+    pattern = re.compile('|'.join(alternatives))
+
+    return pattern.sub(lambda match: table[match.group(0)], text)
+
+### Substituting placeholders of a file in place with one read and one write, used for the copied convert scripts
+
+def render_in_place(path, placeholders=None, words=None):
+
+    with open(path, 'r', encoding=ENCODING, newline='') as file:
+        text = file.read()
+
+    with open(path, 'w', encoding=ENCODING, newline='') as file:
+        file.write(substitute(text, placeholders, words))
+
+
+################################################################################### TEMPLATE SET ################################################################################
+
+class TemplateSet:
+    """Base files of one case read once and rendered in memory, each run file written with a single write"""
+
+    class PlaceholderError(ValueError):
+        """Exception class for expected placeholders left in a rendered file, i.e. values missing for the base file"""
+        def __init__(self, message="Placeholders left unreplaced in rendered file"):
+            self.message = message
+            super().__init__(self.message)
+
+    ### Ways of placing the static base files in a run directory
+    link_modes = ('hardlink', 'symlink', 'copy')
+
+    def __init__(self, base_dir) -> None:
+
+        self.base_dir = base_dir
+
+        ### name -> text of every top level file, subdirectories are copied as they are
+        self.files = {}
+        self.dirs = []
+
+        for entry in sorted(os.listdir(base_dir)):
+            entry_path = os.path.join(base_dir, entry)
+            if os.path.isdir(entry_path):
+                self.dirs.append(entry)
+            else:
+                with open(entry_path, 'r', encoding=ENCODING, newline='') as file:
+                    self.files[entry] = file.read()
+
+    ### Rendered text of a base file, failing if any of the expected placeholder names is left
+    ### Other quoted words (Fortran status='old', quoted shell words such as 'EOF') belong to the base file and are kept as they are
+
+    def render(self, name, placeholders=None, words=None, expected=None):
+
+        text = substitute(self.files[name], placeholders, words)
+
+        leftover = sorted({match.group(1) for match in PLACEHOLDER.finditer(text)} & set(expected or ()))
+        if leftover:
+            raise TemplateSet.PlaceholderError(
+                f"No value given for placeholders {', '.join(leftover)} in {os.path.join(self.base_dir, name)}")
+
+        return text
+
+    ### Rendering a base file and writing it under its run name, keeping the permissions of the base file
+
+    def write(self, name, out_path, placeholders=None, words=None, expected=None):
+
+        text = self.render(name, placeholders, words, expected)
+
+        with open(out_path, 'w', encoding=ENCODING, newline='') as file:
+            file.write(text)
+        shutil.copymode(os.path.join(self.base_dir, name), out_path)
+
+    ### Placing the base files that need no rendering in a run directory, i.e. everything but the templates written separately
+    ### mode 'hardlink' or 'symlink' shares the read-only base files between runs, 'copy' duplicates them
+    ### Hard links fall back to copies across file systems. Returns {'files', 'bytes', 'linked', 'saved'}, saved being the bytes not duplicated
+
+    def materialize(self, dest_dir, exclude=(), mode='hardlink'):
+
+        if mode not in TemplateSet.link_modes:
+            raise ValueError(f"Unknown base file mode {mode}, expected one of {', '.join(TemplateSet.link_modes)}")
+
+        stats = {'files': 0, 'bytes': 0, 'linked': 0, 'saved': 0}
+
+        sources = [name for name in self.files if name not in exclude]
+        for name in self.dirs:
+            if name not in exclude:
+                for root, _, files in os.walk(os.path.join(self.base_dir, name)):
+                    rel_root = os.path.relpath(root, self.base_dir)
+                    os.makedirs(os.path.join(dest_dir, rel_root), exist_ok=True)
+                    sources.extend(os.path.join(rel_root, file) for file in files)
+
+        for rel_path in sources:
+            src = os.path.join(self.base_dir, rel_path)
+            dest = os.path.join(dest_dir, rel_path)
+            size = os.path.getsize(src)
+
+            if os.path.lexists(dest):
+                os.remove(dest)
+
+            linked = True
+            try:
+                if mode == 'hardlink':
+                    os.link(src, dest)
+                elif mode == 'symlink':
+                    os.symlink(os.path.abspath(src), dest)
+                else:
+                    linked = False
+            except OSError:
+                linked = False
+
+            if not linked:
+                shutil.copy2(src, dest)
+
+            stats['files'] += 1
+            stats['bytes'] += size
+            stats['linked'] += linked
+            stats['saved'] += size if linked else 0
+
+        return stats
+
+### One template set per base case directory, read once per process and shared by every run of that case
+_template_sets = {}
+
+def get_templates(base_dir):
+    base_dir = os.path.abspath(base_dir)
+    if base_dir not in _template_sets:
+        _template_sets[base_dir] = TemplateSet(base_dir)
+    return _template_sets[base_dir]
@@ -0,0 +1,385 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### In-process clip, connectivity, slice and integrate metrics on BLUE rectilinear grids, replacing the pvpython scripts
+### to be run locally inside the scheduler post-processing workers, or in the HPC through reduce_metrics.py
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import itertools
+import numpy as np
+import pandas as pd
+from vtr_reader import load_case
+
+
+################################################################################### SCALAR CLIP ################################################################################
+
+### Voxel corners numbered di + 2*dj + 4*dk
+_corners = [(di, dj, dk) for dk in (0, 1) for dj in (0, 1) for di in (0, 1)]
+
+### Point array shifted onto the voxels, the value of corner (di, dj, dk) of every voxel
+def _corner(array, di, dj, dk):
+    nx, ny, nz = array.shape[:3]
+    return array[di:di + nx - 1, dj:dj + ny - 1, dk:dk + nz - 1]
+
+### Each voxel split into the 6 tetrahedra around its main diagonal
+_tets = np.array([[0, (1 << a), (1 << a) | (1 << b), 7] for a, b in itertools.permutations(range(3), 2)])
+
+### Fraction of each tetrahedron where a linear field is above zero, values shaped (n, 4)
+
+def tet_fraction_above(values):
+
+    above = values > 0
+    n_above = above.sum(axis=1)
+    fraction = (n_above == 4).astype(np.float64)
+
+    ### Sorting so the above vertices come first, keeping the values of each tetrahedron together
+    order = np.argsort(~above, axis=1, kind='stable')
+    f = np.take_along_axis(values, order, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+
+        ### One vertex above: corner tetrahedron cut at the crossing point of its three edges
+        one = n_above == 1
+        if one.any():
+            fa, fb = f[one, :1], f[one, 1:]
+            fraction[one] = np.prod(fa / (fa - fb), axis=1)
+
+        ### Three above: complement of the corner tetrahedron around the single vertex below
+        three = n_above == 3
+        if three.any():
+            fa, fb = f[three, :3], f[three, 3:]
+            fraction[three] = 1 - np.prod(-fb / (fa - fb), axis=1)
+
+        ### Two above: prism between the two vertices above and the four edge crossings
+        two = n_above == 2
+        if two.any():
+            fraction[two] = _prism_fraction(f[two])
+
+    return fraction
+
+def _prism_fraction(f):
+
+    a1, a2, b1, b2 = f.T
+    t = lambda fa, fb: fa / (fa - fb)
+
+    ### Barycentric frame: a1 at the origin, a2, b1, b2 on the unit axes, so volume fractions are plain determinants
+    n = len(f)
+    A = np.zeros((n, 3))
+    D = np.tile([1.0, 0.0, 0.0], (n, 1))
+    B = np.zeros((n, 3)); B[:, 1] = t(a1, b1)
+    C = np.zeros((n, 3)); C[:, 2] = t(a1, b2)
+    E = D.copy(); E[:, 0] -= t(a2, b1); E[:, 1] = t(a2, b1)
+    F = D.copy(); F[:, 0] -= t(a2, b2); F[:, 2] = t(a2, b2)
+
+    def volume(p0, p1, p2, p3):
+        return np.abs(np.linalg.det(np.stack([p1 - p0, p2 - p0, p3 - p0], axis=1)))
+
+    return volume(A, B, C, D) + volume(B, C, D, E) + volume(C, D, E, F)
+
+### Clipped volume of every voxel for the part of a point scalar above value (below when invert)
+### Same linear edge interpolation as Clip with a scalar clip type, voxels entirely kept skip the tetrahedra
+
+def clip_volumes(grid, array, value=0.0, invert=False):
+
+    field = np.asarray(grid.point_data[array], dtype=np.float64) - value
+    if invert:
+        field = -field
+
+    x, y, z = grid.coords
+    cell_volume = np.diff(x)[:, None, None] * np.diff(y)[None, :, None] * np.diff(z)[None, None, :]
+
+    above = field > 0
+    n_above = np.zeros(cell_volume.shape, dtype=np.int8)
+    for di, dj, dk in _corners:
+        n_above += _corner(above, di, dj, dk)
+
+    fraction = (n_above == 8).astype(np.float64)
+
+    ### Only voxels cut by the interface are split into tetrahedra, their corner values gathered by index
+    mixed = np.nonzero((n_above > 0) & (n_above < 8))
+    if len(mixed[0]):
+        corners = np.stack([field[mixed[0] + di, mixed[1] + dj, mixed[2] + dk] for di, dj, dk in _corners], axis=-1)
+        fraction[mixed] = tet_fraction_above(corners[:, _tets].reshape(-1, 4)).reshape(-1, 6).mean(axis=1)
+
+    return fraction * cell_volume, above
+
+
+################################################################################### CONNECTIVITY ################################################################################
+
+### Connected components of the kept points, two points linked when they share a voxel (26-neighbourhood)
+### Min-label propagation with pointer jumping, labels are flat point indices of each component root
+
+def label_points(mask):
+
+    big = mask.size
+    labels = np.where(mask, np.arange(mask.size).reshape(mask.shape), big)
+
+    offsets = [o for o in itertools.product((-1, 0, 1), repeat=3) if o > (0, 0, 0)]
+
+    def window(offset, side):
+        return tuple(slice(max(0, -o), n - max(0, o)) if side == 0 else slice(max(0, o), n + min(0, o))
+                     for o, n in zip(offset, mask.shape))
+
+    while True:
+        previous = labels.copy()
+
+        for offset in offsets:
+            s0, s1 = window(offset, 0), window(offset, 1)
+            ### Windows overlap, so both sides only ever lower their labels
+            low = np.minimum(labels[s0], labels[s1])
+            labels[s0] = np.where(mask[s0], np.minimum(labels[s0], low), labels[s0])
+            labels[s1] = np.where(mask[s1], np.minimum(labels[s1], low), labels[s1])
+
+        ### Pointer jumping: each point takes the label of its label until labels are component roots
+        flat = labels.reshape(-1)
+        kept = flat < big
+        while True:
+            jumped = flat[flat[kept]]
+            if np.array_equal(jumped, flat[kept]):
+                break
+            flat[kept] = jumped
+
+        if np.array_equal(labels, previous):
+            return labels
+
+### Volume of every connected region of the clipped field, ordered like Connectivity RegionIds
+### order: 'unspecified' by first cell in VTK order, 'descending' by cell count as 'Cell Count Descending'
+
+def region_volumes(grid, array, value=0.0, invert=False, order='unspecified'):
+
+    volumes, mask = clip_volumes(grid, array, value, invert)
+    labels = label_points(mask)
+
+    big = mask.size
+    corner_labels = _corner(labels, 0, 0, 0).copy()
+    for di, dj, dk in _corners[1:]:
+        np.minimum(corner_labels, _corner(labels, di, dj, dk), out=corner_labels)
+
+    kept = (volumes > 0) & (corner_labels < big)
+    if not kept.any():
+        return np.zeros(0)
+
+    roots, region = np.unique(corner_labels[kept], return_inverse=True)
+    region_volume = np.bincount(region, weights=volumes[kept])
+    region_cells = np.bincount(region)
+
+    if order == 'descending':
+        ranking = np.lexsort((np.arange(len(roots)), -region_cells))
+    else:
+        ### VTK cell ids run x fastest, the region found first is the one holding the lowest id
+        nx, ny, nz = (n - 1 for n in mask.shape)
+        i, j, k = np.nonzero(kept)
+        cell_id = i + nx * (j + ny * k)
+        first = np.full(len(roots), np.iinfo(np.int64).max)
+        np.minimum.at(first, region, cell_id)
+        ranking = np.argsort(first, kind='stable')
+
+    return region_volume[ranking]
+
+
+################################################################################### SLICE AND INTEGRATE ################################################################################
+
+### Planes bracketing position along axis and the interpolation weight between them
+
+def bracket(coords, position):
+    k = int(np.clip(np.searchsorted(coords, position, side='right') - 1, 0, len(coords) - 2))
+    w = (position - coords[k]) / (coords[k + 1] - coords[k])
+    return k, float(np.clip(w, 0.0, 1.0))
+
+### Velocity gradient on the two planes bracketing a slice, from a slab with one extra plane each side
+
+def slab_gradient(grid, velocity, axis, k):
+
+    lo, hi = max(0, k - 1), min(grid.shape[axis], k + 3)
+    slab = np.take(velocity, np.arange(lo, hi), axis=axis).astype(np.float64)
+    coords = [c if a != axis else c[lo:hi] for a, c in enumerate(grid.coords)]
+
+    ### grad[..., i, j] = d u_i / d x_j, as the Gradient filter stores it
+    grad = np.stack([np.stack(np.gradient(slab[..., comp], *coords), axis=-1) for comp in range(3)], axis=-2)
+
+    return np.take(grad, [k - lo, k + 1 - lo], axis=axis)
+
+### Strain based features computed by the programmable filter of the single phase scripts
+
+def strain_features(grad, pressure, velocity):
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        D = (grad + np.swapaxes(grad, -1, -2)) / 2
+        omega = (grad - np.swapaxes(grad, -1, -2)) / 2
+
+        maxeig = np.linalg.eigvalsh(D)[..., -1]
+
+        DD = np.sum(D * D, axis=(-1, -2))
+        o2 = np.sum(omega * omega, axis=(-1, -2))
+
+        return {'Gamma': np.sqrt(2 * DD),
+                'Ediss': 2 * (0.615 / 1364) * DD,
+                'emax': maxeig / np.sqrt(DD),
+                'Q': (DD - o2) / (DD + o2),
+                'Pres': pressure,
+                'u': velocity}
+
+### Fraction of each in-plane quad inside a cylinder whose axis is normal to the plane, from sub-sampled points
+
+def disk_coverage(u, v, center, radius, samples=4):
+
+    offsets = (np.arange(samples) + 0.5) / samples
+    su = u[:-1, None] + np.diff(u)[:, None] * offsets[None, :]
+    sv = v[:-1, None] + np.diff(v)[:, None] * offsets[None, :]
+
+    inside = ((su[:, None, :, None] - center[0]) ** 2 + (sv[None, :, None, :] - center[1]) ** 2) <= radius ** 2
+    return inside.mean(axis=(2, 3))
+
+### Area integral of point features over the slice of the cylinder clip, as IntegrateVariables on a triangulated slice
+### valid: point mask on both bracketing planes, a quad is kept when the 3D cells it cuts had all points valid
+
+def integrate_slice(grid, axis, position, features, center, radius, valid=None):
+
+    k, w = bracket(grid.coords[axis], position)
+    u, v = [c for a, c in enumerate(grid.coords) if a != axis]
+    c_uv = [c for a, c in enumerate(center) if a != axis]
+
+    area = np.diff(u)[:, None] * np.diff(v)[None, :] * disk_coverage(u, v, c_uv, radius)
+
+    if valid is not None:
+        cell_valid = valid[0] & valid[1]
+        quad_valid = cell_valid[:-1, :-1] & cell_valid[1:, :-1] & cell_valid[:-1, 1:] & cell_valid[1:, 1:]
+        area = np.where(quad_valid, area, 0.0)
+
+    total_area = area.sum()
+    integrals = {}
+
+    for name, planes in features.items():
+        values = (1 - w) * planes[0] + w * planes[1]
+        quad_mean = (values[:-1, :-1] + values[1:, :-1] + values[:-1, 1:] + values[1:, 1:]) / 4
+        weights = area.reshape(area.shape + (1,) * (quad_mean.ndim - 2))
+        ### Quads outside the clip carry no area, their NaN values must not leak into the integral
+        integrals[name] = np.sum(np.where(weights > 0, quad_mean, 0.0) * weights, axis=(0, 1))
+
+    return integrals, total_area
+
+### Point features on the two planes bracketing a slice, each feature shaped (2, n_u, n_v[, n_comp])
+
+def slice_features(grid, axis, position):
+
+    k, _ = bracket(grid.coords[axis], position)
+
+    velocity = grid.point_data['Velocity']
+    grad = slab_gradient(grid, velocity, axis, k)
+    planes = lambda array: np.moveaxis(np.take(array, [k, k + 1], axis=axis), axis, 0).astype(np.float64)
+
+    features = strain_features(np.moveaxis(grad, axis, 0), planes(grid.point_data['Pressure']), planes(velocity))
+
+    return features
+
+
+################################################################################### STUDY METRICS ################################################################################
+
+### Same outputs as PV_scripts/PV_ndrop_DSD.py: one row per droplet volume
+
+def ndrop_DSD(HDpath, case_name):
+
+    grid = load_case(os.path.join(HDpath, case_name), case_name, arrays=['Interface'])
+    volumes = region_volumes(grid, 'Interface', value=0.0, invert=False, order='unspecified')
+
+    return pd.DataFrame([float(x) for x in volumes], columns=['Volume'])
+
+### Same outputs as PV_scripts/PV_sv_last.py: droplet volumes without region 0 (continuous phase) and their count
+
+def sv_last_DSD(HDpath, case_name):
+
+    case_path = os.path.join(HDpath, case_name)
+    grid = load_case(case_path, case_name, arrays=['Interface'])
+    volumes = region_volumes(grid, 'Interface', value=0.0, invert=True, order='descending')
+
+    volume_floats = [float(x) for x in volumes[1:]]
+    return pd.DataFrame([{'Volume': volume_floats, 'Nd': len(volume_floats)}], columns=['Volume', 'Nd'])
+
+### Same outputs as PV_scripts/PV_sp_PP.py: area averaged features on n_datap cross sections along the pipe
+### case_path overrides HDpath/case_name as the folder holding the files, e.g. RESULTS on the HPC
+
+def sp_pipe_profiles(HDpath, case_name, length, radius, n_datap=100, case_path=None):
+
+    grid = load_case(case_path or os.path.join(HDpath, case_name), case_name, arrays=['Velocity', 'Pressure'])
+
+    R, L = float(radius), float(length)
+    ini = L / n_datap
+    L_range = np.linspace(ini, L - ini, n_datap)
+
+    rows = []
+    for position in L_range:
+
+        features = slice_features(grid, 0, position)
+        ### Threshold on Q between -1 and 1 for all points removes the cells inside the mixer elements
+        valid = np.isfinite(features['Q']) & (np.abs(features['Q']) <= 1)
+        integrals, area = integrate_slice(grid, 0, position, features, grid.center, R, valid=valid)
+
+        rows.append({'Length': position,
+                     'e_max': integrals['emax'] / area,
+                     'Q': integrals['Q'] / area,
+                     'E_diss': integrals['Ediss'] / area,
+                     'Gamma': integrals['Gamma'] / area,
+                     'Pressure': integrals['Pres'] / area,
+                     'Velocity': integrals['u'][0] / area})
+
+    return pd.DataFrame(rows, columns=['Length', 'e_max', 'Q', 'E_diss', 'Gamma', 'Pressure', 'Velocity'])
+
+### Same outputs as PV_scripts/PV_sv_sp.py: profiles along the vessel height and over a radial line at the impeller
+
+def sv_vessel_profiles(HDpath, case_name, clearance, R=0.025, H=0.051, n_slices=100, n_samples=100, case_path=None):
+
+    grid = load_case(case_path or os.path.join(HDpath, case_name), case_name, arrays=['Velocity', 'Pressure'])
+
+    ini = 0.05 / n_slices
+    H_range = np.linspace(ini, 0.05 - ini, n_slices)
+    center = grid.center
+
+    Q_list, P_list, Ur_list, Uth_list, Uz_list = [], [], [], [], []
+
+    for position in H_range:
+        features = slice_features(grid, 2, position)
+        integrals, area = integrate_slice(grid, 2, position, features, center, R)
+        Q_list.append(integrals['Q'] / area)
+        P_list.append(integrals['Pres'] / area)
+        Ur_list.append(integrals['u'][0] / area)
+        Uth_list.append(integrals['u'][1] / area)
+        Uz_list.append(integrals['u'][2] / area)
+
+    ### Plot over line from the vessel axis to the wall at the impeller height, Resolution n_samples
+    C = float(clearance)
+    features = slice_features(grid, 2, C)
+    _, w = bracket(grid.coords[2], C)
+
+    line_x = np.linspace(H / 2, H / 2 + 0.025, n_samples + 1)[:n_samples]
+    line_y = np.full(n_samples, H / 2)
+    arc = line_x - H / 2
+
+    def probe(name):
+        values = (1 - w) * features[name][0] + w * features[name][1]
+        x, y = grid.coords[0], grid.coords[1]
+        i = np.clip(np.searchsorted(x, line_x, side='right') - 1, 0, len(x) - 2)
+        j = np.clip(np.searchsorted(y, line_y, side='right') - 1, 0, len(y) - 2)
+        tx = ((line_x - x[i]) / (x[i + 1] - x[i]))
+        ty = ((line_y - y[j]) / (y[j + 1] - y[j]))
+        if values.ndim == 3:
+            tx, ty = tx[:, None], ty[:, None]
+        sampled = ((1 - tx) * (1 - ty) * values[i, j] + tx * (1 - ty) * values[i + 1, j]
+                   + (1 - tx) * ty * values[i, j + 1] + tx * ty * values[i + 1, j + 1])
+        ### Probe points outside the clipped cylinder are invalid and read as zero
+        outside = np.hypot(line_x - center[0], line_y - center[1]) > R
+        sampled[outside] = 0.0
+        return sampled
+
+    U_line = probe('u')
+
+    data = [{'Height': H_range.tolist(),
+             'Q': Q_list, 'Pressure': P_list, 'Ur': Ur_list, 'Uth': Uth_list, 'Uz': Uz_list,
+             'arc_length': arc.tolist(), 'Q_over_line': probe('Q').tolist(),
+             'Ur_over_line': U_line[:, 0].tolist(), 'Uz_over_line': U_line[:, 2].tolist()}]
+
+    return pd.DataFrame(data, columns=['Height', 'Q', 'Pressure', 'Ur', 'Uth', 'Uz',
+                                       'arc_length', 'Q_over_line', 'Ur_over_line', 'Uz_over_line'])
@@ -0,0 +1,281 @@
+### Automation_simulation_run, tailored for BLUE 12.5.1
+### ParaView-free reader of the rectilinear grid .vtr pieces and .pvd collections written by BLUE
+### to be run locally
+### Author: Juan Pablo Valdes,
+### Contributors: Paula Pico, Fuyue Liang
+### Version: 6.0
+### Department of Chemical Engineering, Imperial College London
+#######################################################################################################################################################################################
+#######################################################################################################################################################################################
+
+import os
+import re
+import glob
+import mmap
+import zlib
+import base64
+import numpy as np
+import xml.etree.ElementTree as ET
+
+
+################################################################################### VTK XML TYPES ################################################################################
+
+vtk_types = {
+    'Int8': np.int8, 'UInt8': np.uint8,
+    'Int16': np.int16, 'UInt16': np.uint16,
+    'Int32': np.int32, 'UInt32': np.uint32,
+    'Int64': np.int64, 'UInt64': np.uint64,
+    'Float32': np.float32, 'Float64': np.float64,
+}
+
+
+################################################################################### VTR PIECE ################################################################################
+
+class VTRFile:
+    """One .vtr file: XML header parsed once, appended raw arrays returned as memory-mapped views"""
+
+    def __init__(self, path) -> None:
+
+        self.path = path
+
+        with open(path, 'rb') as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        ### Raw appended data is not valid XML, only the header before it is parsed
+        appended = self.mm.find(b'<AppendedData')
+        if appended >= 0:
+            header = self.mm[:appended] + b'</VTKFile>'
+            tag_end = self.mm.find(b'>', appended)
+            self.appended_tag = self.mm[appended:tag_end + 1].decode()
+            ### Data starts after the '_' marker following the AppendedData tag
+            self.data_start = self.mm.find(b'_', tag_end) + 1
+        else:
+            header = self.mm[:]
+            self.appended_tag = None
+            self.data_start = None
+
+        self.root = ET.fromstring(header)
+
+        if self.root.get('type') != 'RectilinearGrid':
+            raise ValueError(f"{path} is not a RectilinearGrid VTK file")
+
+        self.byte_order = '<' if self.root.get('byte_order', 'LittleEndian') == 'LittleEndian' else '>'
+        self.header_type = np.dtype(vtk_types[self.root.get('header_type', 'UInt32')]).newbyteorder(self.byte_order)
+        self.compressed = self.root.get('compressor') is not None
+
+        if self.root.get('compressor') not in (None, 'vtkZLibDataCompressor'):
+            raise ValueError(f"Unsupported compressor {self.root.get('compressor')} in {path}")
+
+        self.pieces = self.root.find('RectilinearGrid').findall('Piece')
+
+    ### Reading a DataArray element, a view on the file for uncompressed appended raw data
+
+    def read_array(self, element):
+
+        dtype = np.dtype(vtk_types[element.get('type')]).newbyteorder(self.byte_order)
+        n_comp = int(element.get('NumberOfComponents', 1))
+        data_format = element.get('format')
+
+        if data_format == 'ascii':
+            values = np.array(element.text.split(), dtype=dtype)
+
+        elif data_format == 'appended':
+            if self.appended_tag is None or 'encoding="raw"' not in self.appended_tag:
+                raise ValueError(f"Only raw appended data is supported, found {self.appended_tag} in {self.path}")
+            start = self.data_start + int(element.get('offset'))
+            values = self.read_appended(start, dtype)
+
+        elif data_format == 'binary':
+            values = self.read_inline(element.text.strip(), dtype)
+
+        else:
+            raise ValueError(f"Unknown DataArray format {data_format} in {self.path}")
+
+        return values.reshape(-1, n_comp) if n_comp > 1 else values
+
+    def read_appended(self, start, dtype):
+
+        header_size = self.header_type.itemsize
+
+        if not self.compressed:
+            n_bytes = int(np.frombuffer(self.mm, dtype=self.header_type, count=1, offset=start)[0])
+            ### Memory-mapped view, pages are only read when the array is used
+            return np.frombuffer(self.mm, dtype=dtype, count=n_bytes // dtype.itemsize, offset=start + header_size)
+
+        ### Compressed: [n_blocks, block_size, last_block_size, compressed sizes...] then the zlib blocks
+        n_blocks = int(np.frombuffer(self.mm, dtype=self.header_type, count=1, offset=start)[0])
+        header = np.frombuffer(self.mm, dtype=self.header_type, count=3 + n_blocks, offset=start)
+        sizes = header[3:].astype(np.int64)
+        pos = start + header_size * (3 + n_blocks)
+
+        blocks = []
+        for size in sizes:
+            blocks.append(zlib.decompress(self.mm[pos:pos + size]))
+            pos += size
+
+        return np.frombuffer(b''.join(blocks), dtype=dtype)
+
+    def read_inline(self, text, dtype):
+
+        header_size = self.header_type.itemsize
+
+        if not self.compressed:
+            ### Header either encoded on its own (padded) or in one stream with the data
+            header_chars = 4 * -(-header_size // 3)
+            n_bytes = int(np.frombuffer(base64.b64decode(text[:header_chars]), dtype=self.header_type, count=1)[0])
+            if text[header_chars - 1] == '=':
+                return np.frombuffer(base64.b64decode(text[header_chars:]), dtype=dtype, count=n_bytes // dtype.itemsize)
+            return np.frombuffer(base64.b64decode(text), dtype=dtype, count=n_bytes // dtype.itemsize, offset=header_size)
+
+        ### The compression header is encoded on its own, its length known once the block count is read
+        first = base64.b64decode(text[:4 * -(-header_size // 3)])
+        n_blocks = int(np.frombuffer(first, dtype=self.header_type, count=1)[0])
+        header_chars = 4 * -(-header_size * (3 + n_blocks) // 3)
+        header = np.frombuffer(base64.b64decode(text[:header_chars]), dtype=self.header_type, count=3 + n_blocks)
+        data = base64.b64decode(text[header_chars:])
+
+        blocks, pos = [], 0
+        for size in header[3:].astype(np.int64):
+            blocks.append(zlib.decompress(data[pos:pos + size]))
+            pos += size
+
+        return np.frombuffer(b''.join(blocks), dtype=dtype)
+
+    ### Coordinates and requested point arrays of every piece, arrays shaped (nx, ny, nz[, n_comp])
+
+    def read_pieces(self, arrays=None):
+
+        pieces = []
+
+        for piece in self.pieces:
+
+            extent = [int(v) for v in piece.get('Extent').split()]
+            shape = (extent[1] - extent[0] + 1, extent[3] - extent[2] + 1, extent[5] - extent[4] + 1)
+
+            coords = [np.asarray(self.read_array(element), dtype=np.float64) for element in piece.find('Coordinates').findall('DataArray')]
+
+            point_data = {}
+            point_node = piece.find('PointData')
+            for element in (point_node.findall('DataArray') if point_node is not None else []):
+                name = element.get('Name')
+                if arrays is not None and name not in arrays:
+                    continue
+                values = self.read_array(element)
+                ### VTK stores x fastest, i.e. C order (nz, ny, nx), transposed as a view to index [i, j, k]
+                values = values.reshape(shape[::-1] + values.shape[1:])
+                point_data[name] = np.swapaxes(values, 0, 2)
+
+            pieces.append({'coords': coords, 'point_data': point_data})
+
+        return pieces
+
+
+################################################################################### MERGED GRID ################################################################################
+
+class RectilinearGrid:
+    """Point data of all pieces merged on the global rectilinear grid, the equivalent of PVDReader + MergeBlocks"""
+
+    def __init__(self, x, y, z, point_data=None) -> None:
+        self.coords = [np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64), np.asarray(z, dtype=np.float64)]
+        self.point_data = point_data or {}
+
+    @property
+    def shape(self):
+        return tuple(len(c) for c in self.coords)
+
+    @property
+    def bounds(self):
+        return [(c[0], c[-1]) for c in self.coords]
+
+    @property
+    def center(self):
+        return np.array([(c[0] + c[-1]) / 2 for c in self.coords])
+
+    ### Global coordinates from every piece, points shared by neighbouring pieces merged within a tolerance
+
+    @staticmethod
+    def merge_coords(arrays):
+
+        values = np.unique(np.concatenate(arrays))
+        if len(values) < 2:
+            return values
+
+        tol = 1e-9 * max(values[-1] - values[0], 1e-300)
+        keep = np.concatenate([[True], np.diff(values) > tol])
+        return values[keep]
+
+    @classmethod
+    def from_pieces(cls, pieces):
+
+        coords = [cls.merge_coords([piece['coords'][axis] for piece in pieces]) for axis in range(3)]
+        shape = tuple(len(c) for c in coords)
+
+        point_data = {}
+
+        for piece in pieces:
+
+            ### Location of the piece in the global grid
+            index = []
+            for axis in range(3):
+                pos = np.searchsorted(coords[axis], piece['coords'][axis] - 1e-9 * max(coords[axis][-1] - coords[axis][0], 1e-300))
+                index.append(slice(int(pos[0]), int(pos[0]) + len(pos)))
+            index = tuple(index)
+
+            for name, values in piece['point_data'].items():
+                if name not in point_data:
+                    point_data[name] = np.zeros(shape + values.shape[3:], dtype=values.dtype.newbyteorder('='))
+                point_data[name][index] = values
+
+        return cls(*coords, point_data=point_data)
+
+
+################################################################################### PVD COLLECTION ################################################################################
+
+### Datasets of a .pvd collection as (timestep, part, file) entries
+
+def read_pvd(pvd_path):
+
+    root = ET.parse(pvd_path).getroot()
+    datasets = []
+
+    for element in root.iter('DataSet'):
+        datasets.append((float(element.get('timestep', 0)), int(element.get('part', 0) or 0), element.get('file')))
+
+    return datasets
+
+### Last time step index among the VAR_*.vtr pieces downloaded for a case
+
+def last_timestep(path, pattern='VAR_*_*.vtr'):
+
+    vtrfiles = glob.glob(os.path.join(path, pattern))
+    if not vtrfiles:
+        raise FileNotFoundError(f'No {pattern} files found in {path}')
+
+    return max(int(os.path.basename(file).split('_')[-1].split('.')[0]) for file in vtrfiles)
+
+### Reading the merged grid of a .pvd, optionally pointing its '_0.vtr' pieces at another time step in memory
+### Same selection the PV scripts make by rewriting the PVD file before opening it with PVDReader
+
+def read_grid(pvd_path, arrays=None, timestep=None):
+
+    base_dir = os.path.dirname(os.path.abspath(pvd_path))
+    pieces = []
+
+    for _, _, file_name in read_pvd(pvd_path):
+
+        if timestep is not None and file_name.endswith('_0.vtr'):
+            file_name = re.sub(r'_0\.vtr$', f'_{timestep}.vtr', file_name)
+
+        pieces.extend(VTRFile(os.path.join(base_dir, file_name)).read_pieces(arrays))
+
+    ### Pieces are still views on the mapped files, copied once into the global arrays here
+    return RectilinearGrid.from_pieces(pieces)
+
+### Grid of the last time step of a case, as opened by the pvpython post-processing scripts
+
+def load_case(case_path, case_name, arrays=None, timestep=None):
+
+    pvdfile = os.path.join(case_path, f'VAR_{case_name}_time=0.00000E+00.pvd')
+    timestep = last_timestep(case_path) if timestep is None else timestep
+
+    return read_grid(pvdfile, arrays=arrays, timestep=timestep)